@@ -0,0 +1,24 @@
+# helpers compartilhados pelos benchmarks (rodar da raiz: python bench/<arquivo>.py)
+import os
+import sys
+from typing import Dict, List
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def importar_bot(**env: str):
+    # tokens falsos: nenhum benchmark conecta no Discord nem na OpenAI de verdade
+    os.environ.setdefault("DISCORD_BOT_TOKEN", "bench")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("INFRACOES_DB", ":memory:")
+    for k, v in env.items():
+        os.environ[k] = v
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    import bot
+    return bot
+
+def percentis(valores: List[float], ps=(50, 95, 99)) -> Dict[int, float]:
+    if not valores:
+        return {p: 0.0 for p in ps}
+    v = sorted(valores)
+    return {p: v[min(len(v) - 1, int(round(p / 100.0 * (len(v) - 1))))] for p in ps}
@@ -0,0 +1,181 @@
+# objetos falsos do discord.py pro replay offline
+# Member/Role são subclasses de verdade: o bot checa isinstance(..., discord.Member)
+# e compara cargos com o operador do discord.Role. Nada aqui fala com a rede.
+import asyncio
+import datetime
+import time
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+class Efeitos:
+    # tudo que o bot "fez" no Discord, com o instante (perf_counter) de cada ação
+    def __init__(self):
+        self.log: List[Tuple[float, str, object]] = []  # (t, tipo, detalhe)
+
+    def registrar(self, tipo: str, detalhe: object = None) -> None:
+        self.log.append((time.perf_counter(), tipo, detalhe))
+
+    def contagem(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for _, tipo, _ in self.log:
+            out[tipo] = out.get(tipo, 0) + 1
+        return out
+
+class CargoFalso(discord.Role):
+    def __init__(self, guild: "GuildFalsa", id: int, nome: str, posicao: int):
+        self.id = id
+        self.name = nome
+        self.position = posicao
+        self.guild = guild
+
+class MembroFalso(discord.Member):
+    def __init__(self, guild: "GuildFalsa", id: int, nome: str, cargos: List[CargoFalso],
+                 perms: Optional[discord.Permissions] = None, bot: bool = False, latencia_rest: float = 0.0):
+        self.guild = guild
+        self.timed_out_until = None
+        self._fid = id
+        self._fnome = nome
+        self._fcargos = cargos
+        self._fperms = perms or discord.Permissions.none()
+        self._fbot = bot
+        self._latencia = latencia_rest
+
+    id = property(lambda s: s._fid)
+    name = property(lambda s: s._fnome)
+    display_name = property(lambda s: s._fnome)
+    bot = property(lambda s: s._fbot)
+    mention = property(lambda s: f"<@{s._fid}>")
+    roles = property(lambda s: [s.guild.default_role] + list(s._fcargos))
+    top_role = property(lambda s: max(s.roles))
+    guild_permissions = property(lambda s: s._fperms)
+
+    def __repr__(self) -> str:
+        return f"<MembroFalso id={self._fid} nome={self._fnome!r}>"
+
+    async def edit(self, *, reason: Optional[str] = None, **campos) -> None:
+        await asyncio.sleep(self._latencia)
+        if "timed_out_until" in campos:
+            self.timed_out_until = campos["timed_out_until"]
+            self.guild.efeitos.registrar("mute" if campos["timed_out_until"] else "unmute", self._fid)
+        if "roles" in campos:
+            self._fcargos = [r for r in campos["roles"] if not r.is_default()]
+            self.guild.efeitos.registrar("roles", self._fid)
+
+    async def remove_roles(self, *cargos, reason: Optional[str] = None, atomic: bool = True) -> None:
+        await self.edit(roles=[r for r in self._fcargos if r not in cargos], reason=reason)
+
+class UsuarioFalso(discord.User):
+    # o que o discord.py entrega como autor de `reference.resolved` quando o
+    # membro não está no cache (o payload do gateway não traz `member`)
+    def __init__(self, id: int, nome: str):
+        self._fid = id
+        self._fnome = nome
+
+    id = property(lambda s: s._fid)
+    name = property(lambda s: s._fnome)
+    display_name = property(lambda s: s._fnome)
+    bot = property(lambda s: False)
+    mention = property(lambda s: f"<@{s._fid}>")
+
+    def __repr__(self) -> str:
+        return f"<UsuarioFalso id={self._fid} nome={self._fnome!r}>"
+
+class BanidosFalsos:
+    def __init__(self, banned):
+        self.banned = banned
+        self.failed = []
+
+class GuildFalsa:
+    def __init__(self, id: int, efeitos: Efeitos, latencia_rest: float = 0.0):
+        self.id = id
+        self.efeitos = efeitos
+        self.latencia_rest = latencia_rest
+        self.default_role = CargoFalso(self, id, "@everyone", 0)
+        self.roles: List[CargoFalso] = [self.default_role]
+        self._membros: Dict[int, MembroFalso] = {}
+        self.banidos: set = set()
+
+    def criar_cargo(self, nome: str, posicao: int) -> CargoFalso:
+        r = CargoFalso(self, 10_000 + len(self.roles), nome, posicao)
+        self.roles.append(r)
+        return r
+
+    def adicionar(self, m: MembroFalso) -> MembroFalso:
+        self._membros[m.id] = m
+        return m
+
+    def get_member(self, uid: int) -> Optional[MembroFalso]:
+        return self._membros.get(uid)
+
+    async def ban(self, alvo, *, reason: Optional[str] = None, delete_message_seconds: int = 0) -> None:
+        await asyncio.sleep(self.latencia_rest)
+        self.banidos.add(alvo.id)
+        self.efeitos.registrar("ban", alvo.id)
+
+    async def bulk_ban(self, alvos, *, reason: Optional[str] = None, delete_message_seconds: int = 0) -> BanidosFalsos:
+        await asyncio.sleep(self.latencia_rest)
+        for a in alvos:
+            self.banidos.add(a.id)
+        self.efeitos.registrar("ban", len(alvos))
+        return BanidosFalsos(list(alvos))
+
+class _Digitando:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class CanalFalso:
+    def __init__(self, id: int, guild: GuildFalsa, efeitos: Efeitos, latencia_rest: float = 0.0):
+        self.id = id
+        self.guild = guild
+        self.efeitos = efeitos
+        self.latencia_rest = latencia_rest
+
+    def typing(self) -> _Digitando:
+        return _Digitando()
+
+    async def send(self, conteudo: str) -> "MensagemFalsa":
+        await asyncio.sleep(self.latencia_rest)
+        self.efeitos.registrar("send", conteudo)
+        return MensagemFalsa(0, self, None, conteudo, [])
+
+    async def fetch_message(self, message_id: int):
+        raise discord.NotFound(_RespostaFalsa(404), "mensagem falsa não existe")
+
+class _RespostaFalsa:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "falso"
+
+class ReferenciaFalsa:
+    def __init__(self, resolved: "MensagemResolvidaFalsa"):
+        self.message_id = resolved.id
+        self.resolved = resolved
+
+class MensagemResolvidaFalsa(discord.Message):
+    # subclasse de verdade: o bot checa isinstance(ref.resolved, discord.Message)
+    def __init__(self, id: int, author, content: str):
+        self.id = id
+        self.author = author
+        self.content = content
+
+class MensagemFalsa:
+    def __init__(self, id: int, channel: CanalFalso, author: Optional[MembroFalso], content: str,
+                 mentions: List[MembroFalso], reference: Optional[ReferenciaFalsa] = None):
+        self.id = id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.mentions = mentions
+        self.reference = reference
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+
+    async def reply(self, conteudo: str) -> "MensagemFalsa":
+        return await self.channel.send(conteudo)
+
+    async def edit(self, content: str) -> None:
+        self.content = content
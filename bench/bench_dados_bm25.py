@@ -0,0 +1,67 @@
+# índice invertido + BM25 vs varredura linear antiga, num dados.txt sintético
+import os
+import random
+import sys
+import tempfile
+import time
+
+from _comum import importar_bot, percentis
+
+SECOES = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+CONSULTAS = 500
+
+def gerar_arquivo(bot, caminho: str, secoes: int) -> None:
+    rnd = random.Random(42)
+    with open(bot.CAMINHO_DADOS, "r", encoding="utf-8") as f:
+        reais = bot._separar_blocos(f.read())
+    vocab = sorted({t for tit, txt in reais for t in bot._termos(tit + " " + txt)})
+    vocab += [f"termo{i:05d}" for i in range(20_000)]
+    with open(caminho, "w", encoding="utf-8") as f:
+        for i in range(secoes):
+            tit, txt = reais[i % len(reais)]
+            extra = " ".join(rnd.choice(vocab) for _ in range(rnd.randint(20, 80)))
+            f.write(f"## {tit} #{i}\n{txt} {extra}\n\n")
+
+def linear_antigo(blocos_toks, pergunta: str, bot):
+    q = bot._tokenizar(pergunta)
+    melhor, melhor_score = None, 0
+    for titulo, texto, toks in blocos_toks:
+        inter = len(q.intersection(toks))
+        if inter > melhor_score:
+            melhor_score, melhor = inter, (titulo, texto)
+    return melhor if melhor_score >= 2 else None
+
+def main() -> None:
+    bot = importar_bot()
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, "dados.txt")
+        gerar_arquivo(bot, caminho, SECOES)
+        print(f"{SECOES} seções, {os.path.getsize(caminho) / 1e6:.1f} MB")
+
+        bot.CAMINHO_DADOS = caminho
+        t0 = time.perf_counter()
+        indice = bot.recarregar_arquivos().indice
+        print(f"montagem do índice: {(time.perf_counter() - t0) * 1000:.0f} ms, {len(indice.postings)} termos")
+
+        blocos_toks = [(t, x, bot._tokenizar(t + " " + x)) for t, x in indice.blocos]
+        rnd = random.Random(7)
+        consultas = []
+        for _ in range(CONSULTAS):
+            t, x = indice.blocos[rnd.randrange(len(indice.blocos))]
+            termos = bot._termos(t + " " + x)
+            consultas.append(" ".join(rnd.sample(termos, min(4, len(termos)))) + "?")
+
+        for nome, fn in (
+            ("linear (antigo)", lambda q: linear_antigo(blocos_toks, q, bot)),
+            ("bm25 top-k", lambda q: bot.buscar_contexto_dados(q)),
+        ):
+            lat = []
+            for q in consultas:
+                t0 = time.perf_counter()
+                fn(q)
+                lat.append(time.perf_counter() - t0)
+            p = percentis(lat)
+            print(f"{nome:<16} p50 {p[50] * 1e3:7.3f} ms  p95 {p[95] * 1e3:7.3f} ms  p99 {p[99] * 1e3:7.3f} ms")
+
+if __name__ == "__main__":
+    main()
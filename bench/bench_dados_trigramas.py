@@ -0,0 +1,103 @@
+# busca no dados.txt com erro de digitação: interseção de termos (antigo) vs BM25 vs trigramas
+# recall: consultas com typo geradas dos blocos do dados.txt real; latência: arquivo sintético grande
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from _comum import importar_bot, percentis
+from bench_dados_bm25 import gerar_arquivo, linear_antigo
+
+SECOES = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+CONSULTAS_POR_BLOCO = 40
+CONSULTAS_LATENCIA = 500
+_ACENTOS = str.maketrans("áàâãéêíóôõúç", "aaaaeeiooouc")
+
+def com_typo(rnd: random.Random, palavra: str) -> str:
+    op = rnd.randrange(4)
+    if op == 0 and len(palavra) > 3:
+        i = rnd.randrange(1, len(palavra) - 2)
+        return palavra[:i] + palavra[i + 1] + palavra[i] + palavra[i + 2:]  # troca vizinhas
+    if op == 1 and len(palavra) > 4:
+        i = rnd.randrange(1, len(palavra) - 1)
+        return palavra[:i] + palavra[i + 1:]  # come uma letra
+    if op == 2:
+        return palavra.translate(_ACENTOS)
+    return palavra + "?"
+
+def consultas_typo(bot, blocos, rnd: random.Random):
+    out = []
+    for i, (titulo, texto) in enumerate(blocos):
+        termos = [t for t in bot._termos(titulo + " " + texto) if len(t) >= 5]
+        if len(termos) < 2:
+            continue
+        for _ in range(CONSULTAS_POR_BLOCO):
+            palavras = rnd.sample(termos, min(3, len(termos)))
+            out.append((i, " ".join(com_typo(rnd, p) for p in palavras)))
+    return out
+
+def indice_modo(bot, modo: str):
+    bot.DADOS_MODO = modo
+    return bot.carregar_blocos_dados()
+
+def main() -> None:
+    bot = importar_bot()
+    if bot.np is None:
+        raise SystemExit("numpy não instalado: modo trigramas indisponível")
+    rnd = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        # cópia: a matriz .npy é gravada do lado do dados.txt
+        bot.CAMINHO_DADOS = os.path.join(tmp, "dados.txt")
+        shutil.copy(os.path.join(os.path.dirname(bot.__file__), "dados.txt"), bot.CAMINHO_DADOS)
+        bm25 = indice_modo(bot, "bm25")
+        tri = indice_modo(bot, "trigramas")
+        consultas = consultas_typo(bot, bm25.blocos, rnd)
+        blocos_toks = [(t, x, bot._tokenizar(t + " " + x)) for t, x in bm25.blocos]
+        titulo_idx = {t: i for i, (t, _) in enumerate(bm25.blocos)}
+
+        print(f"recall em {len(consultas)} consultas com typo ({len(bm25.blocos)} blocos do dados.txt real)")
+        for nome, fn in (
+            ("interseção (antigo)", lambda q: [titulo_idx[r[0]]] if (r := linear_antigo(blocos_toks, q, bot)) else []),
+            ("bm25", lambda q: [d for _, d in bot.ranquear_blocos(bm25, q)]),
+            ("trigramas", lambda q: [d for _, d in bot.ranquear_blocos(tri, q)]),
+        ):
+            r1 = r3 = vazio = 0
+            for gold, q in consultas:
+                top = fn(q)
+                r1 += bool(top) and top[0] == gold
+                r3 += gold in top[:3]
+                vazio += not top
+            n = len(consultas)
+            print(f"  {nome:<20} recall@1 {r1 / n:6.1%}  recall@3 {r3 / n:6.1%}  sem resultado {vazio / n:6.1%}")
+
+        caminho = os.path.join(tmp, "grande.txt")
+        gerar_arquivo(bot, caminho, SECOES)
+        bot.CAMINHO_DADOS = caminho
+        bm25 = indice_modo(bot, "bm25")
+        t0 = time.perf_counter()
+        tri = indice_modo(bot, "trigramas")
+        montar = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        tri = indice_modo(bot, "trigramas")
+        reabrir = time.perf_counter() - t0
+        print(f"\n{SECOES} seções: matriz {montar * 1e3:.0f} ms pra montar, {reabrir * 1e3:.0f} ms pra recarregar (bm25 + mmap)"
+              f" ({os.path.getsize(caminho + '.trigramas.npy') / 1e6:.1f} MB)")
+        consultas = [q for _, q in consultas_typo(bot, bm25.blocos[:50], rnd)][:CONSULTAS_LATENCIA]
+        blocos_toks = [(t, x, bot._tokenizar(t + " " + x)) for t, x in bm25.blocos]
+        for nome, fn in (
+            ("interseção (antigo)", lambda q: linear_antigo(blocos_toks, q, bot)),
+            ("bm25", lambda q: bot.ranquear_blocos(bm25, q)),
+            ("trigramas", lambda q: bot.ranquear_blocos(tri, q)),
+        ):
+            lat = []
+            for q in consultas:
+                t0 = time.perf_counter()
+                fn(q)
+                lat.append(time.perf_counter() - t0)
+            p = percentis(lat)
+            print(f"  {nome:<20} p50 {p[50] * 1e3:7.3f} ms  p95 {p[95] * 1e3:7.3f} ms  p99 {p[99] * 1e3:7.3f} ms")
+
+if __name__ == "__main__":
+    main()
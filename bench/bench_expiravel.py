@@ -0,0 +1,77 @@
+# dedup com 1M IDs de mensagem simulados (2000 msg/s no relógio falso, 2% repetidas):
+# custo por mensagem a cada 100k e memória, MapaExpiravel vs dict + varredura antiga
+import random
+import time
+import tracemalloc
+
+from _comum import importar_bot
+
+TOTAL = 1_000_000
+TAXA = 2000.0          # msg/s simuladas -> com TTL 120s ficam ~240k vivas
+AMOSTRA_ANTIGO = 10_000
+
+def ids_simulados(n: int):
+    rnd = random.Random(11)
+    recentes = []
+    for i in range(n):
+        agora = i / TAXA
+        if recentes and rnd.random() < 0.02:
+            yield rnd.choice(recentes), agora
+            continue
+        mid = 10**18 + i
+        recentes.append(mid)
+        if len(recentes) > 64:
+            recentes.pop(0)
+        yield mid, agora
+
+def antigo(ttl: float):
+    processed = {}
+
+    def already_processed(message_id, loop_time):
+        to_del = [mid for mid, ts in processed.items() if (loop_time - ts) > ttl]
+        for mid in to_del:
+            processed.pop(mid, None)
+        if message_id in processed:
+            return True
+        processed[message_id] = loop_time
+        return False
+
+    return already_processed
+
+def main() -> None:
+    bot = importar_bot()
+
+    fn = antigo(bot.PROCESSED_TTL)
+    t0 = time.perf_counter()
+    for mid, agora in ids_simulados(AMOSTRA_ANTIGO):
+        fn(mid, agora)
+    dt = time.perf_counter() - t0
+    print(f"antigo: {AMOSTRA_ANTIGO} msgs em {dt:.1f}s ({dt / AMOSTRA_ANTIGO * 1e6:.0f} us/msg e subindo; 1M inviável)")
+
+    # tempo (sem tracemalloc, que distorce o custo de alocação)
+    mapa = bot.MapaExpiravel(bot.PROCESSED_TTL, bot.PROCESSED_MAX)
+    t0 = time.perf_counter()
+    dups = 0
+    print(f"{'msgs':>9}{'ns/msg (faixa)':>16}{'vivos':>10}")
+    for i, (mid, agora) in enumerate(ids_simulados(TOTAL), 1):
+        if not mapa.adicionar_se_novo(mid, agora):
+            dups += 1
+        if i % 100_000 == 0:
+            agora_t = time.perf_counter()
+            print(f"{i:>9}{(agora_t - t0) / 100_000 * 1e9:>16.0f}{len(mapa):>10}")
+            t0 = time.perf_counter()
+    print(f"duplicadas barradas: {dups}")
+
+    # memória: repete com tracemalloc e acompanha o teto
+    mapa = bot.MapaExpiravel(bot.PROCESSED_TTL, bot.PROCESSED_MAX)
+    tracemalloc.start()
+    for i, (mid, agora) in enumerate(ids_simulados(TOTAL), 1):
+        mapa.adicionar_se_novo(mid, agora)
+        if i % 250_000 == 0:
+            atual, _ = tracemalloc.get_traced_memory()
+            print(f"{i:>9} msgs: {len(mapa)} vivos, {atual / 1e6:.1f} MB")
+    _, pico = tracemalloc.get_traced_memory()
+    print(f"pico de memória {pico / 1e6:.1f} MB (teto {bot.PROCESSED_MAX} itens)")
+
+if __name__ == "__main__":
+    main()
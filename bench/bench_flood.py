@@ -0,0 +1,220 @@
+# anti-flood local: stream rotulado (conversa normal + 5 tipos de spam) passando
+# pelo tratar_mensagem com relógio virtual (a janela do detector vale em tempo de
+# Discord, não em tempo de CPU). Mede vazão, custo do detector por mensagem e acerto
+# dos mutes. O stub da OpenAI fica no ar só pra provar que ninguém chamou API.
+# uso: python bench/bench_flood.py [--minutos 10] [--usuarios 300]
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List, Tuple
+
+import discord
+from openai import AsyncOpenAI
+
+from _comum import importar_bot, percentis
+from _falsos import CanalFalso, Efeitos, GuildFalsa, MembroFalso, MensagemFalsa
+from stub_openai import StubOpenAI
+
+GUILD_ID = 4242
+BOT_ID = 500_000_000_000_000_001
+CANAIS = 6
+
+PALAVRAS = (
+    "eu voce ele nos hoje amanha ontem jogo time partida boa ruim mapa arma carro casa rua festa "
+    "treino servidor cargo patente missao base equipe radio comando sargento tenente pelotao "
+    "alguem quer jogar agora depois noite tarde cedo vamos bora entra call voz canal ranking "
+    "ganhamos perdemos empate placar campeonato evento sabado domingo horario regra mudou "
+    "atualizacao bug lag ping caiu voltou certo errado talvez sempre nunca muito pouco mais menos"
+).split()
+CURTAS = ["kkkk", "kkkkkkk", "sim", "nao", "gg", "vlw", "boa", "tmj", "ss", "?", "pse", "eita"]
+SAUDACOES = ["bom dia pessoal", "boa noite galera", "bom dia", "boa tarde, tudo certo?", "salve salve",
+             "bom dia pessoal, tudo certo?", "opa, boa noite"]
+PARABENS = ["parabéns pelo aniversário mano, muitas felicidades!", "feliz aniversário!! 🎉",
+            "parabéns irmão, tudo de bom", "parabens, felicidades e muito sucesso pra você!",
+            "feliz aniver, aproveita o dia"]
+ANUNCIO = "ENTREM NO NOSSO SERVIDOR NOVO discord.gg/{c} sorteio de nitro gratis pra todo mundo, corre"
+COPYPASTA = ("ESTE SERVIDOR FOI DOMINADO PELA LEGIAO, saiam enquanto podem, "
+             "todos os cargos serao removidos hoje, entrem em discord.gg/legiao")
+EMOJIS = ["😂", "🔥", "💀", "🤡", "👍", "😭", "🎉", "<:pepe:123456789012345678>", "<a:gira:876543210987654321>"]
+
+Evento = Tuple[float, int, str, str, List[str]]  # (t, canal, autor, texto, mencionados)
+
+def frase(rnd: random.Random) -> str:
+    return " ".join(rnd.choices(PALAVRAS, k=rnd.randint(3, 14)))
+
+def gerar(rnd: random.Random, duracao: float, usuarios: int) -> Tuple[List[Evento], Dict[str, str]]:
+    ev: List[Evento] = []
+    rotulo: Dict[str, str] = {}
+
+    # conversa normal: ~1 mensagem a cada 25 s por pessoa, às vezes 2-3 em sequência
+    for u in range(usuarios):
+        autor = f"u{u}"
+        rotulo[autor] = "normal"
+        canal = rnd.randrange(CANAIS)
+        t = rnd.uniform(0, 25)
+        while t < duracao:
+            r = rnd.random()
+            texto = rnd.choice(CURTAS) if r < 0.15 else frase(rnd)
+            ev.append((t, canal, autor, texto, []))
+            if rnd.random() < 0.15:
+                for _ in range(rnd.randint(1, 2)):
+                    t += rnd.uniform(0.8, 3.0)
+                    ev.append((t, canal, autor, frase(rnd), []))
+            if rnd.random() < 0.05:
+                canal = rnd.randrange(CANAIS)
+            t += rnd.expovariate(1 / 25)
+
+    # momentos em que todo mundo fala a mesma coisa junto (falso positivo clássico)
+    for t0 in range(30, int(duracao), 60):
+        canal = rnd.randrange(CANAIS)
+        frases = SAUDACOES if (t0 // 60) % 2 else PARABENS
+        for autor in rnd.sample([f"u{u}" for u in range(usuarios)], 12):
+            ev.append((t0 + rnd.uniform(0, 8), canal, autor, rnd.choice(frases), []))
+        for autor in rnd.sample([f"u{u}" for u in range(usuarios)], 15):
+            ev.append((t0 + rnd.uniform(0, 5), canal, autor, rnd.choice(["gg", "GG", "ggwp", "F"]), []))
+
+    # superior dando ordem com muita gente marcada: não pode levar mute
+    for i in range(3):
+        alvos = [f"u{u}" for u in rnd.sample(range(usuarios), 12)]
+        ev.append((rnd.uniform(0, duracao), 0, f"cel{i}", "muta essa galera toda aí " + "{alvos}", alvos))
+        rotulo[f"cel{i}"] = "superior"
+
+    def spammer(tipo: str, n: int, passo: Tuple[float, float], qtd: int, texto) -> None:
+        for i in range(n):
+            autor = f"{tipo}{i}"
+            rotulo[autor] = tipo
+            canal = rnd.randrange(CANAIS)
+            t = rnd.uniform(0, duracao - 60)
+            for k in range(qtd):
+                txt, menc = texto(k)
+                ev.append((t, canal, autor, txt, menc))
+                t += rnd.uniform(*passo)
+
+    spammer("rajada", 6, (0.3, 1.0), 25, lambda k: (frase(rnd), []))
+    spammer("repetida", 6, (1.5, 3.0), 15, lambda k: (ANUNCIO.format(c=rnd.choice("abc")) + f" {k}", []))
+    spammer("emoji", 4, (2.0, 5.0), 8,
+            lambda k: ("".join(rnd.choices(EMOJIS, k=rnd.randint(35, 60))), []))
+
+    def bomba(k: int):
+        alvos = [f"u{u}" for u in rnd.sample(range(usuarios), 10)]
+        return "olha isso " + "{alvos}", alvos
+    spammer("mencoes", 4, (3.0, 6.0), 5, bomba)
+
+    # raid: 15 contas novas colando o mesmo texto (com variação) no mesmo canal em 10 s
+    t_raid = rnd.uniform(60, duracao - 60)
+    canal = rnd.randrange(CANAIS)
+    for i in range(15):
+        autor = f"raid{i}"
+        rotulo[autor] = "raid"
+        t = t_raid + rnd.uniform(0, 10)
+        for _ in range(rnd.randint(1, 3)):
+            alvo = f"u{rnd.randrange(usuarios)}"
+            var = rnd.choice(["", "!!!", " 🔥", " JA"])
+            ev.append((t, canal, autor, "{alvos} " + COPYPASTA + var, [alvo]))
+            t += rnd.uniform(1, 4)
+
+    ev.sort(key=lambda e: e[0])
+    return ev, rotulo
+
+def montar_guild(efeitos: Efeitos, rotulo: Dict[str, str]):
+    g = GuildFalsa(GUILD_ID, efeitos)
+    cargo_bot = g.criar_cargo("[Cap] Japex Bot", 50)
+    cargo_cel = g.criar_cargo("[Cel] Oficial", 60)
+    cargo_sld = g.criar_cargo("[Sld] Soldado", 10)
+    perms_bot = discord.Permissions(moderate_members=True, ban_members=True, manage_roles=True)
+    eu = g.adicionar(MembroFalso(g, BOT_ID, "Japex Bot", [cargo_bot], perms_bot, bot=True))
+    membros: Dict[str, MembroFalso] = {}
+    for i, autor in enumerate(sorted(rotulo)):
+        cargos = [cargo_cel] if rotulo[autor] == "superior" else [cargo_sld]
+        membros[autor] = g.adicionar(MembroFalso(g, 700_000_000_000_000_000 + i, autor, cargos))
+    return g, eu, membros
+
+async def rodar(args) -> None:
+    stub = StubOpenAI(args.porta, 0.05, 0.0)
+    await stub.subir()
+    bot = importar_bot(METRICAS_PORTA="0")
+    rnd = random.Random(args.semente)
+    eventos, rotulo = gerar(rnd, args.minutos * 60.0, args.usuarios)
+    efeitos = Efeitos()
+    guild, eu, membros = montar_guild(efeitos, rotulo)
+    bot.configurar(openai_cliente=AsyncOpenAI(api_key="bench", base_url=stub.base_url, max_retries=0), usuario=eu)
+    canais = [CanalFalso(c, guild, efeitos) for c in range(CANAIS)]
+
+    msgs = []
+    for i, (t, c, autor, texto, menc) in enumerate(eventos):
+        alvos = [membros[a] for a in menc]
+        texto = texto.replace("{alvos}", " ".join(a.mention for a in alvos))
+        msgs.append((t, MensagemFalsa(2_000_000 + i, canais[c], membros[autor], texto, alvos)))
+
+    # 0) simhash com numpy e sem numpy tem que dar o mesmo número (os dois caminhos convivem no detector)
+    if bot.np is not None:
+        textos = [m.content for _, m in msgs] + ["spamspam", "spamspamspam", "a" * 40, "kkkkkkkkkkkk"]
+        com_np = [bot.simhash(t) for t in textos]
+        np_, bot.np = bot.np, None
+        try:
+            sem_np = [bot.simhash(t) for t in textos]
+        finally:
+            bot.np = np_
+        difs = [t for t, a, b in zip(textos, com_np, sem_np) if a != b]
+        print(f"simhash numpy x python puro: {len(textos) - len(difs)}/{len(textos)} iguais")
+        assert not difs, f"simhash diverge entre os caminhos: {difs[:3]}"
+
+    # 1) só o detector, sobre o stream inteiro (ninguém mutado sai do stream)
+    det = bot.DetectorFlood(bot.FLOOD_JANELA_SEGUNDOS, bot.FLOOD_JANELA_REPETIDA_SEGUNDOS, bot.FLOOD_MAX_CHAVES)
+    custos = []
+    for t, m in msgs:
+        t0 = time.perf_counter()
+        det.verificar(m, t)
+        custos.append(time.perf_counter() - t0)
+
+    # 2) caminho do bot: tratar_mensagem com relógio virtual; mutado para de falar,
+    # então o que ele mandou no total é o que mandou até o mute
+    enviadas: Dict[str, int] = {}
+    t0 = time.perf_counter()
+    for t, m in msgs:
+        if m.author.timed_out_until is not None:
+            continue
+        enviadas[m.author.name] = enviadas.get(m.author.name, 0) + 1
+        await bot.tratar_mensagem(m, t)
+    total = time.perf_counter() - t0
+    ate_mute = {a: enviadas.get(a, 0) for a, mb in membros.items() if mb.timed_out_until is not None}
+
+    p = percentis(custos)
+    n = len(msgs)
+    enviadas_total = sum(enviadas.values())
+    print(f"{n} mensagens em {args.minutos} min de Discord ({n / (args.minutos * 60):.0f} msg/s no relógio do Discord), "
+          f"{args.usuarios} usuários normais, {CANAIS} canais")
+    print(f"detector sozinho: {n / sum(custos):,.0f} msg/s | p50 {p[50] * 1e6:.1f} µs  p95 {p[95] * 1e6:.1f} µs  "
+          f"p99 {p[99] * 1e6:.1f} µs")
+    print(f"tratar_mensagem (com mute/aviso/livro): {enviadas_total} em {total:.2f} s -> {enviadas_total / total:,.0f} msg/s")
+    print(f"{'grupo':<10}{'autores':>8}{'mutados':>9}{'msgs até mute (média/máx)':>28}")
+    grupos: Dict[str, List[str]] = {}
+    for a, r in rotulo.items():
+        grupos.setdefault(r, []).append(a)
+    for g in ("rajada", "repetida", "emoji", "mencoes", "raid", "normal", "superior"):
+        autores = grupos.get(g, [])
+        mut = [a for a in autores if a in ate_mute]
+        ns = [ate_mute[a] for a in mut]
+        media = f"{sum(ns) / len(ns):.1f} / {max(ns)}" if ns else "-"
+        print(f"{g:<10}{len(autores):>8}{len(mut):>9}{media:>28}")
+    spam = [a for a, r in rotulo.items() if r not in ("normal", "superior")]
+    vp = sum(1 for a in spam if a in ate_mute)
+    fp = sum(1 for a, r in rotulo.items() if r in ("normal", "superior") and a in ate_mute)
+    print(f"precisão {vp / max(1, vp + fp):.1%} | recall {vp / max(1, len(spam)):.1%}")
+    flood = {dict(r).get("motivo"): int(v) for r, v in bot.metricas.contadores.get("japex_flood_total", {}).items()}
+    print(f"detecções por motivo: {flood}")
+    print(f"efeitos no Discord: {efeitos.contagem()} | chamadas à API (stub): {stub.chamadas}")
+    await bot.infracoes.descarregar()
+    await stub.descer()
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutos", type=float, default=10)
+    ap.add_argument("--usuarios", type=int, default=300)
+    ap.add_argument("--semente", type=int, default=7)
+    ap.add_argument("--porta", type=int, default=18083)
+    asyncio.run(rodar(ap.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# histórico de infrações: vazão de escrita pelo caminho do bot (fila + lote numa thread)
+# e latência de consulta de reincidência numa tabela de 1M linhas
+# uso: python bench/bench_infracoes.py [linhas]
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from _comum import importar_bot, percentis
+
+LINHAS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+GUILDS = 20
+USUARIOS = 50_000
+DIAS = 90
+CONSULTAS = 5_000
+
+async def vigiar_lag(lags, parar) -> None:
+    # quanto o loop atrasa um sleep de 1 ms enquanto a escrita acontece
+    while not parar.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - t - 0.001)
+
+async def rodar() -> None:
+    caminho = os.path.join(tempfile.mkdtemp(), "infracoes.db")
+    bot = importar_bot(METRICAS_PORTA="0", INFRACOES_DB=caminho)
+    livro = bot.LivroInfracoes(caminho)
+    rnd = random.Random(7)
+
+    lags = []
+    parar = asyncio.Event()
+    vigia = asyncio.get_running_loop().create_task(vigiar_lag(lags, parar))
+    t0 = time.perf_counter()
+    for i in range(LINHAS):
+        livro.registrar(1000 + i % GUILDS, rnd.randrange(USUARIOS), "mute", 60, "bench", "auto")
+        if i % 1000 == 999:
+            await asyncio.sleep(0)  # devolve o loop como um bot com tráfego faria
+    enfileirar = time.perf_counter() - t0
+    await livro.descarregar()
+    while livro.gravadas < LINHAS:
+        await asyncio.sleep(0.01)
+    total = time.perf_counter() - t0
+    parar.set()
+    await vigia
+    p = percentis(lags, (50, 99, 100))
+    print(f"{LINHAS} inserções: {LINHAS / total:,.0f} linhas/s (enfileirar {enfileirar:.2f} s, até o último commit {total:.2f} s)")
+    print(f"atraso do loop durante a escrita: p50 {p[50] * 1e3:.2f} ms  p99 {p[99] * 1e3:.2f} ms  máx {p[100] * 1e3:.2f} ms")
+
+    # espalha os ts em DIAS dias pra janela de 7 dias pegar só uma parte (passo só do bench)
+    def espalhar():
+        db = livro._conexao()
+        db.execute("UPDATE infracoes SET ts = ts - (abs(random()) % ?) * 1.0", (DIAS * 86400,))
+        db.execute("ANALYZE")
+    await livro._no_disco(espalhar)
+
+    alvos = [(1000 + rnd.randrange(GUILDS), rnd.randrange(USUARIOS)) for _ in range(CONSULTAS)]
+    lat = []
+    soma = 0
+    for g, u in alvos:
+        t = time.perf_counter()
+        soma += await livro.contar(g, u)
+        lat.append(time.perf_counter() - t)
+    p = percentis(lat, (50, 95, 99))
+    print(f"contar() assíncrona ({CONSULTAS} usuários, janela 7 dias, média {soma / CONSULTAS:.2f} infrações):"
+          f" p50 {p[50] * 1e6:.0f} µs  p95 {p[95] * 1e6:.0f} µs  p99 {p[99] * 1e6:.0f} µs")
+
+    def direto(consultas, sem_indice=False):
+        db = livro._conexao()
+        sql = ("SELECT COUNT(*) FROM infracoes" + (" NOT INDEXED" if sem_indice else "")
+               + " WHERE guild_id = ? AND user_id = ? AND ts >= ?")
+        desde = time.time() - bot.INFRACOES_JANELA_SEGUNDOS
+        out = []
+        for g, u in consultas:
+            t = time.perf_counter()
+            db.execute(sql, (g, u, desde)).fetchone()
+            out.append(time.perf_counter() - t)
+        return out
+
+    p = percentis(await livro._no_disco(direto, alvos), (50, 95, 99))
+    print(f"SELECT direto com índice:  p50 {p[50] * 1e6:.0f} µs  p95 {p[95] * 1e6:.0f} µs  p99 {p[99] * 1e6:.0f} µs")
+    p = percentis(await livro._no_disco(direto, alvos[:20], True), (50, 95, 99))
+    print(f"SELECT direto sem índice:  p50 {p[50] * 1e3:.0f} ms  p95 {p[95] * 1e3:.0f} ms")
+    print(f"arquivo: {os.path.getsize(caminho) / 1e6:.0f} MB (+ WAL {os.path.getsize(caminho + '-wal') / 1e6:.0f} MB)")
+
+if __name__ == "__main__":
+    asyncio.run(rodar())
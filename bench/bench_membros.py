@@ -0,0 +1,79 @@
+# partida com chunk de todos os membros vs sem chunk + cache de ativos
+# cada modo roda num processo separado; os Members são montados pelo próprio
+# discord.py (ConnectionState real, sem rede) a partir de payloads sintéticos.
+# O tempo é só CPU de montar o cache: no gateway de verdade ainda tem a rede
+# (o Discord manda 1000 membros por GUILD_MEMBERS_CHUNK).
+import os
+import subprocess
+import sys
+import time
+
+MEMBROS = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 200_000
+ATIVOS = 0.03  # fração que fala/é marcada num dia
+CARGOS = 60
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+def payload_membro(i: int) -> dict:
+    return {
+        "user": {"id": str(800_000_000_000_000_000 + i), "username": f"user{i}", "discriminator": "0",
+                 "avatar": None, "global_name": f"Usuario {i}"},
+        "roles": [str(100 + (i % CARGOS)), str(100 + ((i * 7) % CARGOS))],
+        "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0, "nick": None,
+    }
+
+def filho(modo: str, n: int) -> None:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from _comum import importar_bot
+    bot = importar_bot()
+    import discord
+
+    chunk = modo == "chunk"
+    intents = bot.intents
+    client = discord.Client(
+        intents=intents, chunk_guilds_at_startup=chunk,
+        member_cache_flags=discord.MemberCacheFlags.from_intents(intents) if chunk else discord.MemberCacheFlags.none(),
+    )
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data={"id": "1", "username": "bot", "discriminator": "0", "avatar": None, "bot": True})
+    bot.configurar(usuario=state.user)
+    payloads = [payload_membro(i) for i in range(n)]
+    base = rss_mb()
+
+    t0 = time.perf_counter()
+    roles = [{"id": str(100 + r), "name": f"[Sld] cargo {r}", "position": r + 1, "permissions": "0", "color": 0,
+              "hoist": False, "managed": False, "mentionable": False, "flags": 0} for r in range(CARGOS)]
+    eu = {"user": {"id": "1", "username": "bot", "discriminator": "0", "avatar": None, "bot": True}, "roles": [],
+          "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+    guild = discord.Guild(data={"id": "42", "name": "g", "roles": roles, "members": [eu], "member_count": n,
+                                "channels": [], "emojis": [], "stickers": [], "features": []}, state=state)
+    state._add_guild(guild)
+    if chunk:
+        for i in range(0, n, 1000):
+            for m in [discord.Member(data=p, guild=guild, state=state) for p in payloads[i:i + 1000]]:
+                guild._add_member(m)
+    partida = time.perf_counter() - t0
+    rss_partida = rss_mb() - base
+
+    # um dia de tráfego: só os ativos aparecem (autor/menção de mensagem)
+    if not chunk:
+        passo = max(1, int(1 / ATIVOS))
+        for p in payloads[::passo]:
+            bot.lembrar_membro(discord.Member(data=p, guild=guild, state=state))
+    rss_dia = rss_mb() - base
+    cache = len(guild._members) if chunk else len(bot._membros_ativos) + len(bot._membros_autoridade)
+    print(f"{modo:<6} partida {partida * 1e3:8.0f} ms  RSS partida +{rss_partida:7.1f} MB  "
+          f"RSS após tráfego +{rss_dia:7.1f} MB  membros em cache {cache}")
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--filho":
+        filho(sys.argv[2], int(sys.argv[3]))
+        return
+    print(f"guild com {MEMBROS} membros, {ATIVOS:.0%} ativos no dia")
+    for modo in ("chunk", "lazy"):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--filho", modo, str(MEMBROS)], check=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# p50/p99 de chamadas à Responses API contra um stub local:
+#   antes  -> OpenAI síncrono + asyncio.to_thread (como era)
+#   depois -> bot.chat_llm (AsyncOpenAI no pool compartilhado)
+import asyncio
+import sys
+import time
+
+from aiohttp import web
+from openai import OpenAI
+
+from _comum import importar_bot, percentis
+
+LATENCIA_STUB = 0.05
+PORTA = 18081
+
+RESPOSTA = {
+    "id": "resp_bench", "object": "response", "created_at": 0, "model": "stub", "status": "completed",
+    "output": [{
+        "type": "message", "id": "msg_bench", "status": "completed", "role": "assistant",
+        "content": [{"type": "output_text", "text": "Entendido.", "annotations": []}],
+    }],
+}
+
+async def _responses(request: web.Request) -> web.Response:
+    await request.read()
+    await asyncio.sleep(LATENCIA_STUB)
+    return web.json_response(RESPOSTA)
+
+async def subir_stub() -> web.AppRunner:
+    app = web.Application()
+    app.router.add_post("/v1/responses", _responses)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORTA).start()
+    return runner
+
+async def medir(chamada, concorrencia: int, total: int) -> dict:
+    lat = []
+    sem = asyncio.Semaphore(concorrencia)
+
+    async def uma():
+        async with sem:
+            t0 = time.perf_counter()
+            await chamada()
+            lat.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(uma() for _ in range(total)))
+    dt = time.perf_counter() - t0
+    p = percentis(lat, (50, 99))
+    return {"p50": p[50] * 1000, "p99": p[99] * 1000, "rps": total / dt}
+
+async def main() -> None:
+    base = f"http://127.0.0.1:{PORTA}/v1"
+    bot = importar_bot(OPENAI_BASE_URL=base)
+    runner = await subir_stub()
+    sync = OpenAI(api_key="bench", base_url=base, max_retries=0)
+
+    def sync_call():
+        return sync.responses.create(model=bot.MODEL_MAIN, input="oi", max_output_tokens=10)
+
+    async def antes():
+        await asyncio.wait_for(asyncio.to_thread(sync_call), timeout=12)
+
+    async def depois():
+        await asyncio.wait_for(bot.chat_llm("MENSAGEM: oi", 0, 10, 0.5), timeout=12)
+
+    print(f"stub com {LATENCIA_STUB * 1000:.0f} ms de latência")
+    print(f"{'modo':<10}{'conc':>6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for conc in (1, 10, 100):
+        total = max(50, conc * 5)
+        for nome, fn in (("to_thread", antes), ("async", depois)):
+            await medir(fn, conc, min(total, 20))  # aquece conexões
+            r = await medir(fn, conc, total)
+            print(f"{nome:<10}{conc:>6}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['rps']:>10.0f}")
+    await bot.openai.close()
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
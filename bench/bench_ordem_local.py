@@ -0,0 +1,44 @@
+# gramática local de ordens: acerto contra o corpus e custo por mensagem
+# (esperado null = a gramática tem que devolver None e deixar pro modelo)
+# "mentions" = menções de usuário do Discord; IDs soltos saem do texto via montar_alvos, como no bot
+import json
+import os
+import time
+
+from _comum import RAIZ, importar_bot, percentis
+
+CORPUS = os.path.join(RAIZ, "bench", "corpus_ordens.jsonl")
+REPETICOES = 2_000
+
+def carregar():
+    with open(CORPUS, "r", encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+def main() -> None:
+    bot = importar_bot()
+    casos = carregar()
+    erros = 0
+    locais = 0
+    for c in casos:
+        mentions = bot.montar_alvos([(uid, "") for uid in c["mentions"]], c["texto"])
+        got = bot.parse_ordem_local(c["texto"], mentions)
+        if got is not None:
+            locais += 1
+        if got != c["esperado"]:
+            erros += 1
+            print(f"ERRO {c['texto']!r}\n  esperado {c['esperado']}\n  obtido   {got}")
+    print(f"{len(casos)} casos, {erros} erros, {locais} resolvidos localmente ({locais / len(casos):.0%})")
+
+    tempos = []
+    for _ in range(REPETICOES):
+        for c in casos:
+            mentions = bot.montar_alvos([(uid, "") for uid in c["mentions"]], c["texto"])
+            t0 = time.perf_counter()
+            bot.parse_ordem_local(c["texto"], mentions)
+            tempos.append(time.perf_counter() - t0)
+    p = percentis(tempos)
+    print(f"parse_ordem_local: p50 {p[50] * 1e6:.1f} µs  p95 {p[95] * 1e6:.1f} µs  p99 {p[99] * 1e6:.1f} µs")
+    raise SystemExit(1 if erros else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# layout do prompt: quanto do input é prefixo idêntico entre chamadas seguidas
+# (o que o cache de prefixo do provedor consegue reaproveitar) e custo de montar
+# "antigo" = system com Vocativo/BASE no meio (como era antes), mensagem sozinha no user
+import json
+import os
+import time
+
+from _comum import RAIZ, importar_bot
+
+CORPUS = os.path.join(RAIZ, "bench", "corpus_replay.jsonl")
+VOCATIVOS = ["Soldado", "Cabo Silva", "Sargento Lima", "General", "Oficial Souza", "Criador do Exército"]
+
+def prefixo_comum(a: str, b: str) -> str:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return a[:n]
+
+def main() -> None:
+    bot = importar_bot(METRICAS_PORTA="0")
+    with open(CORPUS, "r", encoding="utf-8") as f:
+        textos = [json.loads(l)["texto"].replace("{bot}", "").replace("{alvo}", "<@1>").strip() for l in f if l.strip()]
+    textos = [t for t in textos if t]
+    com_base = [t for t in textos if bot.buscar_contexto_dados(t, max_chars=650)]
+    textos = textos[:300]
+
+    def antigo(texto: str, voc: str) -> str:
+        ctx = bot.buscar_contexto_dados(texto, max_chars=650)
+        system = bot.PERSONA_BASE + f"\nVocativo: {voc}.\n" + (f"BASE: {ctx}\n" if ctx else "") + "Saída: 1 linha.\n"
+        return system + "\x00" + texto
+
+    def novo(texto: str, voc: str) -> str:
+        conteudo, _ = bot.PROMPT_CHAT.montar(texto, VOCATIVO=voc, BASE=bot.buscar_contexto_dados(texto, max_chars=650))
+        return bot.PROMPT_CHAT.system + "\x00" + conteudo
+
+    print(f"{len(VOCATIVOS)} vocativos em rodízio | tokenizador: "
+          f"{'tiktoken o200k_base' if bot.codificador() is not None else 'estimativa por caracteres'}")
+    print(f"prefixo fixo do chat (system inteiro): {bot.PROMPT_CHAT.tokens_fixos} tokens "
+          f"(cache do provedor a partir de {bot.CACHE_PREFIXO_MIN_TOKENS}: "
+          f"{'sim' if bot.PROMPT_CHAT.cacheavel else 'não, conta o total por chamada'})")
+    print(f"{'amostra':<14}{'layout':<8}{'tokens/chamada':>16}{'prefixo igual':>15}{'fração':>9}{'montar µs':>11}")
+    for grupo, lista in ((f"todas ({len(textos)})", textos), (f"com BASE ({len(com_base)})", com_base)):
+        medir(bot, grupo, lista, antigo, novo)
+
+def medir(bot, grupo, textos, antigo, novo) -> None:
+    for nome, fn in (("antigo", antigo), ("novo", novo)):
+        entradas = [fn(t, VOCATIVOS[i % len(VOCATIVOS)]) for i, t in enumerate(textos)]
+        t0 = time.perf_counter()
+        for i, t in enumerate(textos):
+            fn(t, VOCATIVOS[i % len(VOCATIVOS)])
+        custo = (time.perf_counter() - t0) / len(textos)
+        total = sum(bot.contar_tokens(e) for e in entradas) / len(entradas)
+        comum = sum(bot.contar_tokens(prefixo_comum(a, b)) for a, b in zip(entradas, entradas[1:])) / (len(entradas) - 1)
+        print(f"{grupo:<14}{nome:<8}{total:>16.0f}{comum:>15.0f}{comum / total:>9.0%}{custo * 1e6:>11.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# vazão (eventos/s) com 1, 2 e 4 processos de shard dividindo as mesmas guilds
+# cada filho monta só as guilds do seu shard ((guild_id >> 22) % K, a regra do Discord),
+# espera a largada (barreira no stdin) e despeja o corpus de replay no on_message.
+# Estado compartilhado: servidor RESP local (bench/resp_local.py) ou sqlite em /tmp.
+# uso: python bench/bench_shards.py [--eventos 20000] [--guilds 64] [--backend redis|sqlite]
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from _comum import RAIZ, importar_bot
+from resp_local import RESPLocal
+from stub_openai import StubOpenAI
+
+CORPUS = os.path.join(RAIZ, "bench", "corpus_replay.jsonl")
+BOT_ID = 500_000_000_000_000_001
+CANAIS_POR_GUILD = 4
+TAXA_JANELA = 4.0  # TAXA_GLOBAL do bot: 20 por 4 s
+
+def guild_id(i: int) -> int:
+    # snowflake com timestamp i+1: (id >> 22) == i+1
+    return ((i + 1) << 22) | 7
+
+async def filho(args) -> None:
+    import discord
+    from openai import AsyncOpenAI
+    from _falsos import CanalFalso, Efeitos, GuildFalsa, MembroFalso, MensagemFalsa
+
+    bot = importar_bot(METRICAS_PORTA="0")
+    bot.TYPING_COSMETICO = False
+    efeitos = Efeitos()
+    perms = discord.Permissions(moderate_members=True, ban_members=True, manage_guild=True, manage_roles=True)
+    with open(CORPUS, "r", encoding="utf-8") as f:
+        corpus = [json.loads(l) for l in f if l.strip()]
+
+    minhas: Dict[int, tuple] = {}
+    eu = None
+    for i in range(args.guilds):
+        gid = guild_id(i)
+        if (gid >> 22) % args.k != args.indice:
+            continue
+        g = GuildFalsa(gid, efeitos, args.rest)
+        cargo_bot = g.criar_cargo("[Cap] Japex Bot", 50)
+        cargo_sld = g.criar_cargo("[Sld] Soldado", 10)
+        eu_g = g.adicionar(MembroFalso(g, BOT_ID, "Japex Bot", [cargo_bot], perms, bot=True, latencia_rest=args.rest))
+        eu = eu or eu_g
+        autores = [g.adicionar(MembroFalso(g, 700_000_000_000_000_000 + i * 1000 + a, f"Soldado{a}", [cargo_sld],
+                                           latencia_rest=args.rest)) for a in range(50)]
+        canais = [CanalFalso(gid * 10 + c, g, efeitos, args.rest) for c in range(CANAIS_POR_GUILD)]
+        minhas[i] = (g, eu_g, autores, canais)
+    bot.configurar(openai_cliente=AsyncOpenAI(api_key="bench", base_url=f"http://127.0.0.1:{args.porta_stub}/v1",
+                                              max_retries=0), usuario=eu)
+
+    # profundidade() não conta o que já saiu da fila: conta as menções em execução à parte
+    rodando = [0]
+    original = bot.responder_mencao_medida
+
+    async def medido(mensagem) -> None:
+        rodando[0] += 1
+        try:
+            await original(mensagem)
+        finally:
+            rodando[0] -= 1
+
+    bot.responder_mencao_medida = medido
+
+    # evento n vai pra guild n % G; cada filho só recebe os das guilds dele (como o gateway faz)
+    mensagens = []
+    for n in range(args.eventos):
+        gi = n % args.guilds
+        if gi not in minhas:
+            continue
+        g, eu_g, autores, canais = minhas[gi]
+        e = corpus[n % len(corpus)]
+        alvos = [autores[(n + j) % len(autores)] for j in range(len(e.get("alvos", [])))]
+        texto = e["texto"].replace("{bot}", eu_g.mention).replace("{alvo}", " ".join(a.mention for a in alvos))
+        mentions = ([eu_g] if "{bot}" in e["texto"] else []) + alvos
+        mensagens.append(MensagemFalsa(args.base + n, canais[e["canal"] % CANAIS_POR_GUILD],
+                                       autores[n % len(autores)], texto, mentions))
+
+    if bot.armazem.compartilhado:
+        await bot.armazem.adicionar_se_novo("aquecimento", 1.0)
+    print("pronto", flush=True)
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)
+
+    inicio = time.time()
+    await asyncio.gather(*[bot.on_message(m) for m in mensagens])
+    while rodando[0] or bot.agendador.profundidade():
+        await asyncio.sleep(0.005)
+    fim = time.time()
+    descartes = {dict(r).get("motivo"): int(v) for r, v in bot.metricas.contadores.get("japex_descartes_total", {}).items()}
+    print(json.dumps({"eventos": len(mensagens), "inicio": inicio, "fim": fim, "descartes": descartes,
+                      "efeitos": efeitos.contagem()}), flush=True)
+    await bot.armazem.fechar()
+
+def rodar_k(args, k: int, env_extra: Dict[str, str], base: int) -> dict:
+    env = dict(os.environ, **env_extra)
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--filho", "--k", str(k), "--indice", str(i),
+                               "--eventos", str(args.eventos), "--guilds", str(args.guilds), "--rest", str(args.rest),
+                               "--porta-stub", str(args.porta_stub), "--base", str(base)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, text=True, cwd=RAIZ)
+             for i in range(k)]
+    for p in procs:
+        assert p.stdout.readline().strip() == "pronto"
+    largada = time.time()
+    for p in procs:
+        p.stdin.write("vai\n")
+        p.stdin.flush()
+    res = [json.loads(p.stdout.readline()) for p in procs]
+    for p in procs:
+        p.wait()
+    total = sum(r["eventos"] for r in res)
+    dur = max(r["fim"] for r in res) - largada
+    descartes: Dict[str, int] = {}
+    for r in res:
+        for m, v in r["descartes"].items():
+            descartes[m] = descartes.get(m, 0) + v
+    return {"eventos": total, "dur": dur, "por_proc": [r["eventos"] for r in res], "descartes": descartes}
+
+async def servidores(args):
+    stub = StubOpenAI(args.porta_stub, args.latencia, args.latencia / 3)
+    await stub.subir()
+    resp = RESPLocal(args.porta_resp)
+    await resp.subir()
+    return stub, resp
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--filho", action="store_true")
+    ap.add_argument("--k", type=int, default=1)
+    ap.add_argument("--indice", type=int, default=0)
+    ap.add_argument("--eventos", type=int, default=20_000)
+    ap.add_argument("--guilds", type=int, default=64)
+    ap.add_argument("--rest", type=float, default=0.02)
+    ap.add_argument("--latencia", type=float, default=0.05)
+    ap.add_argument("--backend", default="redis", choices=("redis", "sqlite"))
+    ap.add_argument("--porta-stub", type=int, default=18083)
+    ap.add_argument("--porta-resp", type=int, default=16379)
+    ap.add_argument("--base", type=int, default=10_000_000, help="id da 1ª mensagem (cada rodada usa ids novos)")
+    args = ap.parse_args()
+    if args.filho:
+        asyncio.run(filho(args))
+        return
+
+    # stub + RESP num loop em thread própria, pros filhos falarem com eles durante a medição
+    import threading
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(servidores(args), loop).result()
+
+    db = os.path.join(tempfile.mkdtemp(), "estado.db")
+    compartilhado = ({"ESTADO_BACKEND": "redis", "ESTADO_URL": f"redis://127.0.0.1:{args.porta_resp}"}
+                     if args.backend == "redis" else {"ESTADO_BACKEND": "sqlite", "ESTADO_URL": db})
+    print(f"{args.eventos} eventos em {args.guilds} guilds | stub {args.latencia * 1000:.0f} ms | REST {args.rest * 1000:.0f} ms"
+          f" | {os.cpu_count()} CPU(s)")
+    print(f"{'modo':<18}{'eventos/s':>12}{'dur s':>9}  eventos por processo | descartes")
+    linhas = [("memoria K=1", 1, {"ESTADO_BACKEND": "memoria"})]
+    linhas += [(f"{args.backend} K={k}", k, compartilhado) for k in (1, 2, 4)]
+    for j, (nome, k, env) in enumerate(linhas):
+        r = rodar_k(args, k, env, args.base * (j + 1))
+        time.sleep(TAXA_JANELA)  # janela global do armazém zera entre rodadas
+        print(f"{nome:<18}{r['eventos'] / r['dur']:>12.0f}{r['dur']:>9.2f}  {r['por_proc']} | {r['descartes']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# replay offline do pipeline do on_message: Discord falso + OpenAI stub local
+# uso: python bench/replay.py [--latencia 0.3] [--jitter 0.1] [--falhas 0.05] [--ritmo 1.0] [--sem-typing]
+#   --ritmo 0 despeja o corpus o mais rápido possível; 2.0 = dobro do tempo
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List
+
+import discord
+from openai import AsyncOpenAI
+
+from _comum import RAIZ, importar_bot, percentis
+from _falsos import (CanalFalso, Efeitos, GuildFalsa, MembroFalso, MensagemFalsa, MensagemResolvidaFalsa,
+                     ReferenciaFalsa, UsuarioFalso)
+from stub_openai import StubOpenAI
+
+CORPUS = os.path.join(RAIZ, "bench", "corpus_replay.jsonl")
+GUILD_ID = 4242
+BOT_ID = 500_000_000_000_000_001
+
+def montar_guild(efeitos: Efeitos, rest: float):
+    g = GuildFalsa(GUILD_ID, efeitos, rest)
+    cargo_bot = g.criar_cargo("[Cap] Japex Bot", 50)
+    cargo_cel = g.criar_cargo("[Cel] Oficial", 60)
+    cargo_sld = g.criar_cargo("[Sld] Soldado", 10)
+    perms_bot = discord.Permissions(moderate_members=True, ban_members=True, manage_guild=True, manage_roles=True)
+    eu = g.adicionar(MembroFalso(g, BOT_ID, "Japex Bot", [cargo_bot], perms_bot, bot=True, latencia_rest=rest))
+    autores: Dict[str, MembroFalso] = {}
+    for i in range(3):
+        autores[f"cel:{i}"] = g.adicionar(MembroFalso(g, 600_000_000_000_000_000 + i, f"Oficial{i}", [cargo_cel], latencia_rest=rest))
+    for i in range(200):
+        autores[f"sld:{i}"] = g.adicionar(MembroFalso(g, 700_000_000_000_000_000 + i, f"Soldado{i}", [cargo_sld], latencia_rest=rest))
+    return g, eu, autores
+
+def carregar_corpus(caminho: str) -> List[dict]:
+    with open(caminho, "r", encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+async def rodar(args) -> None:
+    stub = StubOpenAI(args.porta, args.latencia, args.jitter, args.falhas)
+    await stub.subir()
+    bot = importar_bot(METRICAS_PORTA="0")
+    if args.sem_typing:
+        bot.TYPING_COSMETICO = False
+    efeitos = Efeitos()
+    guild, eu, autores = montar_guild(efeitos, args.rest)
+    bot.configurar(openai_cliente=AsyncOpenAI(api_key="replay", base_url=stub.base_url, max_retries=0), usuario=eu)
+    canais = {c: CanalFalso(c, guild, efeitos, args.rest) for c in (1, 2, 3, 4, 5)}
+
+    inicio: Dict[int, float] = {}
+    fim_on_message: Dict[int, float] = {}
+    fim_mencao: Dict[int, float] = {}
+    rodando = [0]
+    original = bot.responder_mencao_medida
+
+    async def medido(mensagem) -> None:
+        # só a parte agendada das menções; o on_message em si é medido em volta do await abaixo
+        rodando[0] += 1
+        try:
+            await original(mensagem)
+        finally:
+            fim_mencao[mensagem.id] = time.perf_counter()
+            rodando[0] -= 1
+
+    bot.responder_mencao_medida = medido
+
+    async def despachar(mensagem: MensagemFalsa) -> None:
+        inicio[mensagem.id] = time.perf_counter()
+        await bot.on_message(mensagem)
+        fim_on_message[mensagem.id] = time.perf_counter()
+
+    corpus = carregar_corpus(args.corpus)
+    caminhos: Dict[int, str] = {}
+    citados: Dict[int, int] = {}  # mensagem de denúncia -> autor citado
+    tarefas = []
+    t0 = time.perf_counter()
+    for i, e in enumerate(corpus):
+        if args.ritmo > 0:
+            espera = e["t"] * args.ritmo - (time.perf_counter() - t0)
+            if espera > 0:
+                await asyncio.sleep(espera)
+        alvos = [autores[a] for a in e.get("alvos", [])]
+        texto = e["texto"].replace("{bot}", eu.mention).replace("{alvo}", " ".join(a.mention for a in alvos))
+        mentions = ([eu] if "{bot}" in e["texto"] else []) + alvos
+        mid = 1_000_000 + i
+        caminhos[mid] = e["caminho"]
+        ref = None
+        if "responde" in e:
+            # reply a uma mensagem fora do cache: autor chega como User, igual ao gateway
+            citado = autores[e["responde"]["autor"]]
+            resolvida = MensagemResolvidaFalsa(500_000 + i, UsuarioFalso(citado.id, citado.name), e["responde"]["texto"])
+            ref = ReferenciaFalsa(resolvida)
+            citados[mid] = citado.id
+        msg = MensagemFalsa(mid, canais[e["canal"]], autores[e["autor"]], texto, mentions, ref)
+        tarefas.append(asyncio.create_task(despachar(msg)))
+
+    await asyncio.gather(*tarefas)
+    while rodando[0] or bot.agendador.profundidade():
+        await asyncio.sleep(0.01)
+    total = time.perf_counter() - t0
+
+    por_caminho: Dict[str, List[float]] = {}
+    descartadas: Dict[str, int] = {}
+    contagem: Dict[str, int] = {}
+    for mid, cam in caminhos.items():
+        contagem[cam] = contagem.get(cam, 0) + 1
+        if cam in ("chat", "ordem", "denuncia"):
+            if mid not in fim_mencao:
+                descartadas[cam] = descartadas.get(cam, 0) + 1
+                continue
+            por_caminho.setdefault(cam, []).append(fim_mencao[mid] - inicio[mid])
+        else:
+            por_caminho.setdefault(cam, []).append(fim_on_message[mid] - inicio[mid])
+
+    print(f"stub: latência {args.latencia * 1000:.0f}±{args.jitter * 1000:.0f} ms, falhas {args.falhas:.0%}"
+          f" | REST Discord {args.rest * 1000:.0f} ms | typing {'off' if args.sem_typing else 'on'}")
+    print(f"{len(corpus)} mensagens em {total:.2f} s -> {len(corpus) / total:.1f} msg/s"
+          f" | chamadas stub: {stub.chamadas}")
+    print(f"{'caminho':<9}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'descarte':>10}")
+    for cam in ("chat", "ordem", "denuncia", "automod", "ruido"):
+        lat = por_caminho.get(cam, [])
+        p = percentis(lat)
+        n = contagem.get(cam, 0)
+        taxa = descartadas.get(cam, 0) / n if n else 0.0
+        print(f"{cam:<9}{n:>6}{p[50] * 1e3:>10.1f}{p[95] * 1e3:>10.1f}{p[99] * 1e3:>10.1f}{taxa:>10.1%}")
+    descartes = {dict(r).get("motivo"): int(v) for r, v in bot.metricas.contadores.get("japex_descartes_total", {}).items()}
+    erros = {f"{dict(r)['api']}/{dict(r)['tipo']}": int(v) for r, v in bot.metricas.contadores.get("japex_api_erros_total", {}).items()}
+    tokens = {f"{dict(r)['site']}/{dict(r)['tipo']}": int(v) for r, v in bot.metricas.contadores.get("japex_llm_tokens_total", {}).items()}
+    print(f"descartes por motivo: {descartes or '-'}")
+    print(f"tokens por chamada/tipo: {tokens or '-'}")
+    print(f"erros de API: {erros or '-'}")
+    mutados = {d for _, tipo, d in efeitos.log if tipo == "mute"}
+    if citados:
+        print(f"denúncias por reply (autor citado como User): {len(citados)}, "
+              f"autor citado mutado em {sum(1 for u in set(citados.values()) if u in mutados)}/{len(set(citados.values()))}")
+    print(f"efeitos no Discord: {efeitos.contagem()}")
+    await stub.descer()
+    # ordem de superior nunca pode cair nos baldes de taxa (chat lotando o canal não barra moderador)
+    assert descartadas.get("ordem", 0) == 0, f"{descartadas['ordem']} ordens de superior descartadas"
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default=CORPUS)
+    ap.add_argument("--latencia", type=float, default=0.3)
+    ap.add_argument("--jitter", type=float, default=0.1)
+    ap.add_argument("--falhas", type=float, default=0.0)
+    ap.add_argument("--rest", type=float, default=0.05, help="latência das ações REST falsas do Discord")
+    ap.add_argument("--ritmo", type=float, default=1.0)
+    ap.add_argument("--porta", type=int, default=18082)
+    ap.add_argument("--sem-typing", action="store_true")
+    asyncio.run(rodar(ap.parse_args()))
+
+if __name__ == "__main__":
+    main()
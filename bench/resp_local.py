@@ -0,0 +1,100 @@
+# servidor RESP mínimo (subconjunto do Redis) pra testar ESTADO_BACKEND=redis sem Redis instalado
+# comandos: PING GET SET [NX] [PX ms|EX s] INCR PEXPIRE [NX] DEL
+# uso: python bench/resp_local.py [porta]
+import asyncio
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+class RESPLocal:
+    def __init__(self, porta: int):
+        self.porta = porta
+        self.dados: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.comandos = 0
+        self._servidor: Optional[asyncio.AbstractServer] = None
+
+    def _vivo(self, chave: bytes) -> Optional[Tuple[bytes, Optional[float]]]:
+        item = self.dados.get(chave)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.dados[chave]
+            return None
+        return item
+
+    def _executar(self, args: List[bytes]) -> bytes:
+        self.comandos += 1
+        cmd = args[0].upper()
+        if cmd == b"PING":
+            return b"+PONG\r\n"
+        if cmd == b"GET":
+            item = self._vivo(args[1])
+            return b"$-1\r\n" if item is None else b"$%d\r\n%s\r\n" % (len(item[0]), item[0])
+        if cmd == b"SET":
+            chave, valor, expira, nx = args[1], args[2], None, False
+            i = 3
+            while i < len(args):
+                op = args[i].upper()
+                if op == b"NX":
+                    nx = True
+                elif op == b"PX":
+                    expira = time.monotonic() + int(args[i + 1]) / 1000
+                    i += 1
+                elif op == b"EX":
+                    expira = time.monotonic() + int(args[i + 1])
+                    i += 1
+                i += 1
+            if nx and self._vivo(chave) is not None:
+                return b"$-1\r\n"
+            self.dados[chave] = (valor, expira)
+            return b"+OK\r\n"
+        if cmd == b"INCR":
+            item = self._vivo(args[1])
+            n = (int(item[0]) if item else 0) + 1
+            self.dados[args[1]] = (str(n).encode(), item[1] if item else None)
+            return b":%d\r\n" % n
+        if cmd == b"PEXPIRE":
+            item = self._vivo(args[1])
+            if item is None or (len(args) > 3 and args[3].upper() == b"NX" and item[1] is not None):
+                return b":0\r\n"
+            self.dados[args[1]] = (item[0], time.monotonic() + int(args[2]) / 1000)
+            return b":1\r\n"
+        if cmd == b"DEL":
+            return b":%d\r\n" % sum(1 for k in args[1:] if self.dados.pop(k, None) is not None)
+        return b"-ERR comando desconhecido\r\n"
+
+    async def _cliente(self, r: asyncio.StreamReader, w: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                linha = await r.readline()
+                if not linha:
+                    break
+                n = int(linha[1:-2])
+                args = []
+                for _ in range(n):
+                    tam = int((await r.readline())[1:-2])
+                    args.append((await r.readexactly(tam + 2))[:-2])
+                w.write(self._executar(args))
+                await w.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            w.close()
+
+    async def subir(self) -> None:
+        self._servidor = await asyncio.start_server(self._cliente, "127.0.0.1", self.porta)
+
+    async def descer(self) -> None:
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+
+async def _rodar(porta: int) -> None:
+    s = RESPLocal(porta)
+    await s.subir()
+    print(f"RESP local em 127.0.0.1:{porta}", flush=True)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_rodar(int(sys.argv[1]) if len(sys.argv) > 1 else 16379))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,136 @@
+# servidor falso da OpenAI (Responses + Moderations) com latência e falha injetáveis
+# responde no formato que o SDK espera; o conteúdo sai de heurísticas simples do prompt
+import asyncio
+import json
+import random
+import re
+from typing import Optional
+
+from aiohttp import web
+
+_RE_ORDEM = re.compile(r"\b(muta|mutar|bane|banir|desmuta|cargos|silencia)\b", re.IGNORECASE)
+_RE_OFENSA = re.compile(r"\b(idiota|lixo|burro|otario|corrupto|ladrao)\b", re.IGNORECASE)
+
+def _resposta(texto: str, entrada: str = "") -> dict:
+    # uso aproximado (4 chars/token) só pra exercitar as métricas de tokens do bot
+    return {
+        "id": "resp_stub", "object": "response", "created_at": 0, "model": "stub", "status": "completed",
+        "output": [{
+            "type": "message", "id": "msg_stub", "status": "completed", "role": "assistant",
+            "content": [{"type": "output_text", "text": texto, "annotations": []}],
+        }],
+        "usage": {"input_tokens": len(entrada) // 4, "output_tokens": len(texto) // 4,
+                  "total_tokens": (len(entrada) + len(texto)) // 4,
+                  "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}},
+    }
+
+def _campo(user: str, nome: str) -> str:
+    m = re.search(rf"^{nome}: (.*)$", user, flags=re.MULTILINE)
+    return m.group(1) if m else ""
+
+def _ordem(user: str) -> dict:
+    msg = _campo(user, "MENSAGEM")
+    try:
+        mentions = json.loads(_campo(user, "MENTIONS") or "[]")
+    except ValueError:
+        mentions = []
+    ids = [str(m["user_id"]) for m in mentions]
+    if not ids or not _RE_ORDEM.search(msg):
+        return {"action": "none", "target_user_ids": [], "duration_seconds": None, "reason": ""}
+    low = msg.lower()
+    if "desmuta" in low:
+        action = "unmute"
+    elif "bane" in low or "banir" in low:
+        action = "ban"
+    elif "cargos" in low:
+        action = "remove_all_roles"
+    else:
+        action = "mute"
+    return {"action": action, "target_user_ids": ids, "duration_seconds": 600 if action == "mute" else None,
+            "reason": "ordem"}
+
+class StubOpenAI:
+    def __init__(self, porta: int, latencia: float = 0.3, jitter: float = 0.1, taxa_falha: float = 0.0,
+                 semente: int = 1):
+        self.porta = porta
+        self.latencia = latencia
+        self.jitter = jitter
+        self.taxa_falha = taxa_falha
+        self.rnd = random.Random(semente)
+        self.chamadas = {"responses": 0, "moderations": 0, "falhas": 0}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.porta}/v1"
+
+    async def _atrasar_ou_falhar(self) -> Optional[web.Response]:
+        await asyncio.sleep(max(0.0, self.latencia + self.rnd.uniform(-self.jitter, self.jitter)))
+        if self.rnd.random() < self.taxa_falha:
+            self.chamadas["falhas"] += 1
+            return web.json_response({"error": {"message": "falha injetada", "type": "server_error"}}, status=500)
+        return None
+
+    async def _responses(self, req: web.Request) -> web.Response:
+        corpo = await req.json()
+        self.chamadas["responses"] += 1
+        erro = await self._atrasar_ou_falhar()
+        if erro is not None:
+            return erro
+        entrada = corpo.get("input") or []
+        system = entrada[0]["content"] if entrada else ""
+        user = entrada[-1]["content"] if entrada else ""
+        formato = ((corpo.get("text") or {}).get("format") or {}).get("name")
+        tudo = system + user
+        if formato == "roteador":
+            obj = _ordem(user)
+            obj["target_user_ids"] = [str(x) for x in obj["target_user_ids"]]
+            obj["reply"] = "" if obj["action"] != "none" else "Certo, tô por aqui."
+            return web.json_response(_resposta(json.dumps(obj), tudo))
+        if system.startswith("Você interpreta ordens"):
+            return web.json_response(_resposta(json.dumps(_ordem(user)), tudo))
+        if system.startswith("Você decide punição"):
+            return web.json_response(_resposta('{"action":"mute","duration_seconds":300,"reason":"ofensa"}', tudo))
+        return web.json_response(_resposta("Certo, tô por aqui.", tudo))
+
+    async def _moderations(self, req: web.Request) -> web.Response:
+        corpo = await req.json()
+        self.chamadas["moderations"] += 1
+        erro = await self._atrasar_ou_falhar()
+        if erro is not None:
+            return erro
+        entradas = corpo.get("input") or []
+        if isinstance(entradas, str):
+            entradas = [entradas]
+        results = []
+        for t in entradas:
+            ofende = bool(_RE_OFENSA.search(t))
+            results.append({"flagged": ofende, "categories": {"harassment": ofende}, "category_scores": {"harassment": 0.9 if ofende else 0.01}})
+        return web.json_response({"id": "modr_stub", "model": "stub", "results": results})
+
+    async def subir(self) -> None:
+        app = web.Application()
+        app.router.add_post("/v1/responses", self._responses)
+        app.router.add_post("/v1/moderations", self._moderations)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        # backlog alto: rajada de conexões novas (pool do SDK vazio) não pode cair em retransmissão de SYN
+        await web.TCPSite(self._runner, "127.0.0.1", self.porta, backlog=1024).start()
+
+    async def descer(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+async def _rodar(porta: int, latencia: float) -> None:
+    stub = StubOpenAI(porta, latencia, latencia / 3)
+    await stub.subir()
+    print(f"stub OpenAI em {stub.base_url}", flush=True)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    import sys
+    try:
+        asyncio.run(_rodar(int(sys.argv[1]) if len(sys.argv) > 1 else 18082,
+                           float(sys.argv[2]) if len(sys.argv) > 2 else 0.3))
+    except KeyboardInterrupt:
+        pass
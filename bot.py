@@ -1,26 +1,71 @@
 import os
 import re
+import sys
 import json
+import struct
+import ctypes
+import ctypes.util
+import time
 import random
+import math
+import hashlib
+import functools
+import unicodedata
+import heapq
+import zlib
+import bisect
+import contextlib
+import tempfile
 import asyncio
 import datetime
-from typing import Dict, List, Optional, Set, Tuple
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple, TypeVar
 
 import discord
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+try:
+    import httpx2 as httpx  # openai >= 3 roda em cima do httpx2
+except ImportError:
+    import httpx
+try:
+    import numpy as np
+except ImportError:
+    np = None  # sem numpy o modo "trigramas" do dados.txt cai pro BM25
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None  # sem tiktoken o orçamento de prompt usa estimativa por caracteres
 
 # =========================================================
 # ENV
 # =========================================================
-load_dotenv()
+# importado (bench/replay) não lê .env nem exige token: quem roda é main()
+if __name__ == "__main__":
+    load_dotenv()
 TOKEN_DISCORD = os.getenv("DISCORD_BOT_TOKEN")
 CHAVE_OPENAI = os.getenv("OPENAI_API_KEY")
 
-if not TOKEN_DISCORD or not CHAVE_OPENAI:
-    raise SystemExit("faltou DISCORD_BOT_TOKEN ou OPENAI_API_KEY no .env")
+# pool HTTP único pra todas as chamadas (keep-alive + limites)
+OPENAI_MAX_CONEXOES = int(os.getenv("OPENAI_MAX_CONEXOES", "64"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "32"))
+OPENAI_KEEPALIVE_SEGUNDOS = 60.0
+OPENAI_TIMEOUT_SEGUNDOS = 15.0
+OPENAI_MAX_RETRIES = 1
+
+def criar_cliente_openai() -> AsyncOpenAI:
+    http = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONEXOES,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_SEGUNDOS,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SEGUNDOS, connect=5.0),
+    )
+    return AsyncOpenAI(api_key=CHAVE_OPENAI, http_client=http, max_retries=OPENAI_MAX_RETRIES)
 
-openai = OpenAI(api_key=CHAVE_OPENAI)
+openai: Optional[AsyncOpenAI] = criar_cliente_openai() if CHAVE_OPENAI else None
 
 # =========================================================
 # MODELO ÚNICO
@@ -90,29 +135,598 @@ PATENTES = [
     ("[Rct]", "Recruta", 20),
 ]
 
+# =========================================================
+# MAPA COM VALIDADE (dedup / cooldown)
+# =========================================================
+class MapaExpiravel:
+    # dict em ordem de inserção; toda escrita vai pro fim com o `agora` dela,
+    # então o item mais velho está sempre na frente: expirar é tirar da frente
+    # (O(1) amortizado). `agora` tem que ser monotônico (loop.time()).
+    def __init__(self, ttl: float, max_itens: int):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._d: "OrderedDict[object, Tuple[float, object]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._d)
+
+    def _expirar(self, agora: float) -> None:
+        d = self._d
+        limite = agora - self.ttl
+        while d:
+            ts = next(iter(d.values()))[0]
+            if ts >= limite:
+                return
+            d.popitem(last=False)
+
+    def get(self, chave: object, agora: float, padrao: object = None) -> object:
+        self._expirar(agora)
+        item = self._d.get(chave)
+        return padrao if item is None else item[1]
+
+    def set(self, chave: object, valor: object, agora: float) -> None:
+        self._expirar(agora)
+        d = self._d
+        if chave in d:
+            d.move_to_end(chave)
+        d[chave] = (agora, valor)
+        if len(d) > self.max_itens:
+            d.popitem(last=False)
+
+    def adicionar_se_novo(self, chave: object, agora: float) -> bool:
+        self._expirar(agora)
+        if chave in self._d:
+            return False
+        self.set(chave, agora, agora)
+        return True
+
+class LimitadorTaxa:
+    # um token bucket por chave; balde parado tempo suficiente pra encher
+    # de novo é igual a balde novo, então pode expirar do mapa
+    def __init__(self, capacidade: float, por_segundo: float, max_chaves: int):
+        self.capacidade = float(capacidade)
+        self.por_segundo = float(por_segundo)
+        self._baldes = MapaExpiravel(self.capacidade / self.por_segundo, max_chaves)
+        self.recusas = 0
+
+    def _fichas(self, chave: object, agora: float) -> float:
+        b = self._baldes.get(chave, agora)
+        if b is None:
+            return self.capacidade
+        fichas, desde = b
+        return min(self.capacidade, fichas + (agora - desde) * self.por_segundo)
+
+    def pode(self, chave: object, agora: float, custo: float = 1.0) -> bool:
+        return self._fichas(chave, agora) >= custo
+
+    def consumir(self, chave: object, agora: float, custo: float = 1.0) -> None:
+        self._baldes.set(chave, (self._fichas(chave, agora) - custo, agora), agora)
+
+# =========================================================
+# MÉTRICAS (formato texto do Prometheus em /metrics)
+# =========================================================
+METRICAS_HOST = "127.0.0.1"
+METRICAS_PORTA = int(os.getenv("METRICAS_PORTA", "9108") or 0)  # 0 = sem endpoint
+METRICAS_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0)
+LAG_AMOSTRA_SEGUNDOS = 0.5
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+class Histograma:
+    __slots__ = ("contagens", "soma", "total")
+
+    def __init__(self):
+        self.contagens = [0] * len(METRICAS_BUCKETS)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        i = bisect.bisect_left(METRICAS_BUCKETS, valor)
+        if i < len(self.contagens):
+            self.contagens[i] += 1
+        self.soma += valor
+        self.total += 1
+
+class Metricas:
+    # contadores/gauges/histogramas com rótulos; coletores puxam stats que já existem
+    # nas outras estruturas (cache, lote, etc.) na hora de gerar o texto
+    def __init__(self):
+        self.contadores: Dict[str, Dict[Rotulos, float]] = {}
+        self.gauges: Dict[str, Dict[Rotulos, float]] = {}
+        self.histogramas: Dict[str, Dict[Rotulos, Histograma]] = {}
+        self.coletores: List[Callable[[], None]] = []
+
+    @staticmethod
+    def _rotulos(rotulos: Dict[str, object]) -> Rotulos:
+        return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+    def incr(self, nome: str, valor: float = 1.0, **rotulos: object) -> None:
+        serie = self.contadores.setdefault(nome, {})
+        r = self._rotulos(rotulos)
+        serie[r] = serie.get(r, 0.0) + valor
+
+    def fixar(self, nome: str, valor: float, **rotulos: object) -> None:
+        # contador que já é acumulado em outro lugar (ex.: CacheTTL.hits)
+        self.contadores.setdefault(nome, {})[self._rotulos(rotulos)] = float(valor)
+
+    def gauge(self, nome: str, valor: float, **rotulos: object) -> None:
+        self.gauges.setdefault(nome, {})[self._rotulos(rotulos)] = float(valor)
+
+    def observar(self, nome: str, segundos: float, **rotulos: object) -> None:
+        serie = self.histogramas.setdefault(nome, {})
+        r = self._rotulos(rotulos)
+        h = serie.get(r)
+        if h is None:
+            h = serie[r] = Histograma()
+        h.observar(segundos)
+
+    @contextlib.contextmanager
+    def medir(self, etapa: str, **rotulos: object):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar("japex_etapa_segundos", time.perf_counter() - t0, etapa=etapa, **rotulos)
+
+    def erro(self, api: str, e: BaseException) -> None:
+        self.incr("japex_api_erros_total", api=api, tipo=type(e).__name__)
+
+    def descarte(self, motivo: str) -> None:
+        self.incr("japex_descartes_total", motivo=motivo)
+
+    @staticmethod
+    def _fmt(nome: str, r: Rotulos, extra: Rotulos = ()) -> str:
+        todos = r + extra
+        if not todos:
+            return nome
+        corpo = ",".join(f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"' for k, v in todos)
+        return f"{nome}{{{corpo}}}"
+
+    def texto(self) -> str:
+        for coletor in self.coletores:
+            try:
+                coletor()
+            except Exception:
+                pass
+        linhas: List[str] = []
+        for tipo, series in (("counter", self.contadores), ("gauge", self.gauges)):
+            for nome in sorted(series):
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for r, v in series[nome].items():
+                    linhas.append(f"{self._fmt(nome, r)} {v:g}")
+        for nome in sorted(self.histogramas):
+            linhas.append(f"# TYPE {nome} histogram")
+            for r, h in self.histogramas[nome].items():
+                acumulado = 0
+                for limite, n in zip(METRICAS_BUCKETS, h.contagens):
+                    acumulado += n
+                    linhas.append(f"{self._fmt(nome + '_bucket', r, (('le', f'{limite:g}'),))} {acumulado}")
+                linhas.append(f"{self._fmt(nome + '_bucket', r, (('le', '+Inf'),))} {h.total}")
+                linhas.append(f"{self._fmt(nome + '_sum', r)} {h.soma:g}")
+                linhas.append(f"{self._fmt(nome + '_count', r)} {h.total}")
+        return "\n".join(linhas) + "\n"
+
+metricas = Metricas()
+
+def coletar_cache(nome: str, cache: "CacheTTL") -> None:
+    def coletor() -> None:
+        st = cache.stats()
+        metricas.fixar("japex_cache_total", st["hits"], cache=nome, resultado="hit")
+        metricas.fixar("japex_cache_total", st["misses"], cache=nome, resultado="miss")
+        metricas.fixar("japex_cache_evictions_total", st["evictions"] + st["expirados"], cache=nome)
+        metricas.gauge("japex_cache_bytes", st["bytes"], cache=nome)
+        metricas.gauge("japex_cache_itens", st["itens"], cache=nome)
+    metricas.coletores.append(coletor)
+
+async def medir_lag_loop() -> None:
+    # quanto o loop atrasa pra acordar um sleep curto = quanto tudo mais está atrasando
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(LAG_AMOSTRA_SEGUNDOS)
+        metricas.gauge("japex_event_loop_lag_segundos", max(0.0, loop.time() - t0 - LAG_AMOSTRA_SEGUNDOS))
+
+async def servir_metricas() -> None:
+    if not METRICAS_PORTA:
+        return
+    from aiohttp import web  # vem junto com o discord.py
+
+    async def handler(_req: "web.Request") -> "web.Response":
+        return web.Response(text=metricas.texto(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, METRICAS_HOST, METRICAS_PORTA).start()
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+# =========================================================
+# ESTADO COMPARTILHADO (dedup / janela global / vereditos entre processos)
+# =========================================================
+# "memoria": tudo no processo (1 processo só, como sempre foi)
+# "sqlite":  arquivo WAL na mesma máquina (ESTADO_URL = caminho do .db)
+# "redis":   qualquer servidor que fale RESP (ESTADO_URL = redis://host:porta)
+ESTADO_BACKEND = os.getenv("ESTADO_BACKEND", "memoria").strip().lower()
+ESTADO_URL = os.getenv("ESTADO_URL", "")
+ESTADO_MAX_ITENS = 200_000      # por TTL distinto, no backend de memória
+ESTADO_LIMPEZA_OPS = 5_000      # sqlite: varre expirados a cada N escritas
+ESTADO_TIMEOUT_SEGUNDOS = 2.0   # redis: conexão meio aberta não pode segurar a mensagem
+
+class ArmazemMemoria:
+    compartilhado = False
+
+    def __init__(self):
+        self._mapas: Dict[float, MapaExpiravel] = {}
+
+    def _mapa(self, ttl: float) -> MapaExpiravel:
+        m = self._mapas.get(ttl)
+        if m is None:
+            m = self._mapas[ttl] = MapaExpiravel(ttl, ESTADO_MAX_ITENS)
+        return m
+
+    async def adicionar_se_novo(self, chave: str, ttl: float) -> bool:
+        return self._mapa(ttl).adicionar_se_novo(chave, time.monotonic())
+
+    async def incrementar(self, chave: str, ttl: float) -> int:
+        m = self._mapa(ttl)
+        agora = time.monotonic()
+        n = int(m.get(chave, agora, 0)) + 1
+        if n == 1:
+            m.set(chave, n, agora)
+        else:
+            m._d[chave] = (m._d[chave][0], n)  # não renova a janela
+        return n
+
+    async def get(self, chave: str, ttl: float) -> Optional[str]:
+        return self._mapa(ttl).get(chave, time.monotonic())
+
+    async def set(self, chave: str, valor: str, ttl: float) -> None:
+        self._mapa(ttl).set(chave, valor, time.monotonic())
+
+    async def fechar(self) -> None:
+        pass
+
+class ArmazemSQLite:
+    # sqlite é síncrono e pode esperar até `timeout` pelo lock de outro processo:
+    # toda chamada roda numa thread só (como o LivroInfracoes), nunca no loop
+    compartilhado = True
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho or os.path.join(PASTA_ATUAL, "estado.db")
+        self._db = None
+        self._executor = None
+        self._escritas = 0
+
+    def _conexao(self):
+        if self._db is None:
+            import sqlite3
+            self._db = sqlite3.connect(self.caminho, isolation_level=None, check_same_thread=False, timeout=2.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS estado (chave TEXT PRIMARY KEY, valor TEXT, expira REAL) WITHOUT ROWID")
+        return self._db
+
+    async def _no_disco(self, fn, *args):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="estado")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _limpar_talvez(self, agora: float) -> None:
+        self._escritas += 1
+        if self._escritas % ESTADO_LIMPEZA_OPS == 0:
+            self._conexao().execute("DELETE FROM estado WHERE expira < ?", (agora,))
+
+    def _adicionar_se_novo(self, chave: str, ttl: float) -> bool:
+        agora = time.time()
+        cur = self._conexao().execute(
+            "INSERT INTO estado VALUES (?, '1', ?) ON CONFLICT(chave) DO UPDATE SET valor = '1', expira = excluded.expira"
+            " WHERE estado.expira < ?",
+            (chave, agora + ttl, agora),
+        )
+        self._limpar_talvez(agora)
+        return cur.rowcount == 1
+
+    def _incrementar(self, chave: str, ttl: float) -> int:
+        agora = time.time()
+        row = self._conexao().execute(
+            "INSERT INTO estado VALUES (?, '1', ?) ON CONFLICT(chave) DO UPDATE SET"
+            " valor = CASE WHEN estado.expira < ? THEN '1' ELSE CAST(CAST(estado.valor AS INTEGER) + 1 AS TEXT) END,"
+            " expira = CASE WHEN estado.expira < ? THEN excluded.expira ELSE estado.expira END"
+            " RETURNING valor",
+            (chave, agora + ttl, agora, agora),
+        ).fetchone()
+        self._limpar_talvez(agora)
+        return int(row[0])
+
+    def _get(self, chave: str) -> Optional[str]:
+        row = self._conexao().execute("SELECT valor FROM estado WHERE chave = ? AND expira >= ?", (chave, time.time())).fetchone()
+        return row[0] if row else None
+
+    def _set(self, chave: str, valor: str, ttl: float) -> None:
+        agora = time.time()
+        self._conexao().execute("INSERT OR REPLACE INTO estado VALUES (?, ?, ?)", (chave, valor, agora + ttl))
+        self._limpar_talvez(agora)
+
+    async def adicionar_se_novo(self, chave: str, ttl: float) -> bool:
+        return await self._no_disco(self._adicionar_se_novo, chave, ttl)
+
+    async def incrementar(self, chave: str, ttl: float) -> int:
+        return await self._no_disco(self._incrementar, chave, ttl)
+
+    async def get(self, chave: str, ttl: float) -> Optional[str]:
+        return await self._no_disco(self._get, chave)
+
+    async def set(self, chave: str, valor: str, ttl: float) -> None:
+        await self._no_disco(self._set, chave, valor, ttl)
+
+    async def fechar(self) -> None:
+        if self._executor is not None:
+            if self._db is not None:
+                await self._no_disco(self._db.close)
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._db = None
+
+class ErroRESP(Exception):
+    pass
+
+class ArmazemRedis:
+    # cliente RESP mínimo: 1 conexão, comandos em pipeline, respostas casadas em ordem (FIFO)
+    compartilhado = True
+
+    def __init__(self, url: str):
+        m = re.match(r"^redis://([^:/]+)(?::(\d+))?", url or "redis://127.0.0.1:6379")
+        self.host = m.group(1) if m else "127.0.0.1"
+        self.porta = int(m.group(2) or 6379) if m else 6379
+        self._escritor: Optional[asyncio.StreamWriter] = None
+        self._leitor_tarefa: Optional[asyncio.Task] = None
+        self._pendentes: Deque[asyncio.Future] = deque()
+        self._conectando: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def _codificar(args: Tuple[object, ...]) -> bytes:
+        partes = [b"*%d\r\n" % len(args)]
+        for a in args:
+            b = a if isinstance(a, bytes) else str(a).encode("utf-8")
+            partes.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(partes)
+
+    @staticmethod
+    async def _ler_resposta(r: asyncio.StreamReader) -> object:
+        linha = await r.readline()
+        if not linha:
+            raise ConnectionError("conexão RESP fechada")
+        tipo, corpo = linha[:1], linha[1:-2]
+        if tipo == b"+":
+            return corpo.decode()
+        if tipo == b"-":
+            return ErroRESP(corpo.decode())
+        if tipo == b":":
+            return int(corpo)
+        if tipo == b"$":
+            n = int(corpo)
+            if n < 0:
+                return None
+            dado = await r.readexactly(n + 2)
+            return dado[:-2].decode("utf-8")
+        if tipo == b"*":
+            n = int(corpo)
+            return None if n < 0 else [await ArmazemRedis._ler_resposta(r) for _ in range(n)]
+        raise ConnectionError(f"resposta RESP inválida: {linha!r}")
+
+    async def _ler(self, r: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                valor = await self._ler_resposta(r)
+                fut = self._pendentes.popleft()
+                if not fut.done():
+                    fut.set_result(valor)
+        except Exception as e:
+            self._escritor = None
+            while self._pendentes:
+                fut = self._pendentes.popleft()
+                if not fut.done():
+                    fut.set_exception(ConnectionError(repr(e)))
+
+    def _derrubar(self, motivo: str) -> None:
+        # sem resposta no prazo a ordem FIFO não é mais confiável: fecha e falha o que estava na fila
+        if self._escritor is not None:
+            self._escritor.close()
+            self._escritor = None
+        if self._leitor_tarefa is not None:
+            self._leitor_tarefa.cancel()
+            self._leitor_tarefa = None
+        while self._pendentes:
+            fut = self._pendentes.popleft()
+            if not fut.done():
+                fut.set_exception(ConnectionError(motivo))
+
+    async def _conectar(self) -> asyncio.StreamWriter:
+        if self._conectando is None:
+            self._conectando = asyncio.Lock()
+        async with self._conectando:
+            if self._escritor is None:
+                r, w = await asyncio.wait_for(asyncio.open_connection(self.host, self.porta), ESTADO_TIMEOUT_SEGUNDOS)
+                self._escritor = w
+                self._leitor_tarefa = asyncio.get_running_loop().create_task(self._ler(r))
+        return self._escritor
+
+    async def comandos(self, *cmds: Tuple[object, ...]) -> List[object]:
+        w = self._escritor or await self._conectar()
+        futs = [asyncio.get_running_loop().create_future() for _ in cmds]
+        self._pendentes.extend(futs)
+        w.write(b"".join(self._codificar(c) for c in cmds))
+        try:
+            # respostas chegam em ordem: a última resolvida implica todas as anteriores
+            await asyncio.wait_for(futs[-1], ESTADO_TIMEOUT_SEGUNDOS)
+        except asyncio.TimeoutError:
+            self._derrubar("redis sem resposta")
+            raise
+        finally:
+            for f in futs[:-1]:
+                if f.done() and not f.cancelled():
+                    f.exception()  # o erro já sobe pelo último; evita aviso de exceção não lida
+        out = [f.result() for f in futs]
+        for v in out:
+            if isinstance(v, ErroRESP):
+                raise v
+        return out
+
+    async def adicionar_se_novo(self, chave: str, ttl: float) -> bool:
+        (r,) = await self.comandos(("SET", chave, "1", "NX", "PX", int(ttl * 1000)))
+        return r == "OK"
+
+    async def incrementar(self, chave: str, ttl: float) -> int:
+        n, _ = await self.comandos(("INCR", chave), ("PEXPIRE", chave, int(ttl * 1000), "NX"))
+        return int(n)
+
+    async def get(self, chave: str, ttl: float) -> Optional[str]:
+        (r,) = await self.comandos(("GET", chave))
+        return r
+
+    async def set(self, chave: str, valor: str, ttl: float) -> None:
+        await self.comandos(("SET", chave, valor, "PX", int(ttl * 1000)))
+
+    async def fechar(self) -> None:
+        self._derrubar("armazém fechado")
+
+def criar_armazem():
+    if ESTADO_BACKEND == "sqlite":
+        return ArmazemSQLite(ESTADO_URL)
+    if ESTADO_BACKEND == "redis":
+        return ArmazemRedis(ESTADO_URL)
+    return ArmazemMemoria()
+
+armazem = criar_armazem()
+
+async def compartilhado_ou_calcular(chave: str, ttl: float, calcular: Callable[[], Awaitable[object]]) -> object:
+    # 2º nível atrás do CacheTTL local: veredito calculado por um processo serve pros outros
+    if not armazem.compartilhado:
+        return await calcular()
+    try:
+        salvo = await armazem.get(chave, ttl)
+        if salvo is not None:
+            metricas.incr("japex_estado_total", resultado="hit")
+            return json.loads(salvo)
+    except Exception as e:
+        metricas.erro("estado", e)
+    metricas.incr("japex_estado_total", resultado="miss")
+    valor = await calcular()
+    if valor is not None:
+        try:
+            await armazem.set(chave, json.dumps(valor), ttl)
+        except Exception as e:
+            metricas.erro("estado", e)
+    return valor
+
+async def estado_novo(chave: str, ttl: float) -> bool:
+    # armazém fora do ar não pode travar o bot: na dúvida, é novo
+    try:
+        return await armazem.adicionar_se_novo(chave, ttl)
+    except Exception as e:
+        metricas.erro("estado", e)
+        return True
+
+async def admitir_global_compartilhado() -> bool:
+    # balde global vira janela fixa no armazém: todos os processos somam no mesmo contador
+    janela = TAXA_GLOBAL[0] / TAXA_GLOBAL[1]
+    try:
+        n = await armazem.incrementar(f"taxa:global:{int(time.time() // janela)}", janela * 2)
+    except Exception as e:
+        metricas.erro("estado", e)
+        return True
+    if n > TAXA_GLOBAL[0]:
+        _taxa_global.recusas += 1
+        metricas.descarte("taxa_global")
+        return False
+    return True
+
 # =========================================================
 # DISCORD
 # =========================================================
+_usuario_bot: Optional[discord.abc.User] = None
+
+def usuario_bot() -> Optional[discord.abc.User]:
+    # o próprio bot; no replay offline vem de configurar() porque não há gateway
+    return _usuario_bot or cliente.user
+
+def configurar(openai_cliente: Optional[AsyncOpenAI] = None, usuario: Optional[discord.abc.User] = None) -> None:
+    # injeta dependências: main() usa as reais, o replay usa stub da OpenAI + usuário falso
+    global openai, _usuario_bot
+    if openai_cliente is not None:
+        openai = openai_cliente
+    elif openai is None:
+        openai = criar_cliente_openai()
+    if usuario is not None:
+        _usuario_bot = usuario
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 intents.messages = True
 intents.members = True
 
-cliente = discord.Client(intents=intents)
-ocupado = asyncio.Lock()
+# padrão: não baixa a lista inteira de membros no login (guild grande demora e pesa);
+# o bot guarda só quem aparece + autoridades e busca o resto sob demanda
+CHUNK_NA_PARTIDA = os.getenv("MEMBROS_CHUNK_PARTIDA", "0") == "1"
+
+# sharding: SHARD_COUNT=0 é o Client de sempre (1 conexão). Com SHARD_COUNT>0 o main()
+# sobe SHARD_PROCESSOS filhos, cada um um AutoShardedClient com a sua fatia (SHARD_IDS).
+# Uma guild cai sempre no mesmo shard, então a ordem por canal continua garantida pelo agendador.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0") or 0)
+SHARD_IDS = [int(x) for x in os.getenv("SHARD_IDS", "").split(",") if x.strip().isdigit()]
+SHARD_PROCESSOS = max(1, int(os.getenv("SHARD_PROCESSOS", "1") or 1))
+
+def criar_cliente() -> discord.Client:
+    kw = dict(
+        intents=intents,
+        chunk_guilds_at_startup=CHUNK_NA_PARTIDA,
+        member_cache_flags=discord.MemberCacheFlags.from_intents(intents) if CHUNK_NA_PARTIDA else discord.MemberCacheFlags.none(),
+    )
+    if SHARD_COUNT > 0:
+        return discord.AutoShardedClient(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS or None, **kw)
+    return discord.Client(**kw)
+
+cliente = criar_cliente()
 
 # anti-duplicação
-_PROCESSED: Dict[int, float] = {}
 PROCESSED_TTL = 120.0
+PROCESSED_MAX = 50_000
+_PROCESSED = MapaExpiravel(PROCESSED_TTL, PROCESSED_MAX)
 
 # cooldown + typing
-MIN_DELAY_SECONDS = 1.1
-EXTRA_TYPING_RANGE = (1.4, 2.1)
-USER_COOLDOWN_SECONDS = 1.3
-_last_user_action: Dict[int, float] = {}
+# token bucket: (rajada, recarga por segundo) — admite ou recusa na hora, sem sleep
+TAXA_USUARIO = (2, 1 / 1.3)
+TAXA_CANAL = (6, 1.0)
+TAXA_GLOBAL = (20, 5.0)
+TAXA_SUPERIOR = (8, 2.0)  # ordem de superior não disputa ficha com o chat do canal
+TAXA_MAX_CHAVES = 50_000
+
+# "digitando..." cosmético: opcional e com teto (orçamento de latência)
+TYPING_COSMETICO = True
+TYPING_ORCAMENTO_SEGUNDOS = 1.0
+EXTRA_TYPING_RANGE = (0.5, 1.0)
+
+_taxa_usuario = LimitadorTaxa(*TAXA_USUARIO, TAXA_MAX_CHAVES)
+_taxa_canal = LimitadorTaxa(*TAXA_CANAL, TAXA_MAX_CHAVES)
+_taxa_global = LimitadorTaxa(*TAXA_GLOBAL, 1)
+_taxa_superior = LimitadorTaxa(*TAXA_SUPERIOR, TAXA_MAX_CHAVES)
 
 MAX_MASS_TARGETS = 20
+# ban em massa (raid): Guild.bulk_ban aceita até 200 por chamada
+MAX_BULK_BAN_TARGETS = 1000
+BULK_BAN_LOTE = 200
+
+# agendador de respostas (fila por canal)
+MAX_EM_VOO = 4               # chamadas de LLM simultâneas (global)
+MAX_FILA_CANAL = 5           # pendentes por canal
+MAX_FILA_PRIORIDADE = 50     # pendentes na fila de superiores
 
 # =========================================================
 # UTIL
@@ -130,40 +744,67 @@ def is_badd(uid: int) -> bool:
     return uid == BADD_ID
 
 def esta_silenciado() -> bool:
-    return os.path.exists(CAMINHO_SILENCIO)
-
-def _cleanup_processed(loop_time: float) -> None:
-    to_del = [mid for mid, ts in _PROCESSED.items() if (loop_time - ts) > PROCESSED_TTL]
-    for mid in to_del:
-        _PROCESSED.pop(mid, None)
+    # snapshot mantido pelo vigia de arquivos (sem stat no caminho quente);
+    # como no original, o bot não consulta isso ao responder
+    return _estado.silenciado
 
 def already_processed(message_id: int, loop_time: float) -> bool:
-    _cleanup_processed(loop_time)
-    if message_id in _PROCESSED:
-        return True
-    _PROCESSED[message_id] = loop_time
-    return False
-
-async def respeitar_delay_e_cooldown(user_id: int) -> bool:
-    now = asyncio.get_event_loop().time()
-    if not is_japex(user_id):
-        last = _last_user_action.get(user_id, 0.0)
-        if (now - last) < USER_COOLDOWN_SECONDS:
-            return False
-        _last_user_action[user_id] = now
-        await asyncio.sleep(MIN_DELAY_SECONDS)
-    else:
-        await asyncio.sleep(0.25)
-    return True
+    return not _PROCESSED.adicionar_se_novo(message_id, loop_time)
+
+def _recusa_baldes(baldes, agora: float) -> Optional[str]:
+    for lim, chave, motivo in baldes:
+        if not lim.pode(chave, agora):
+            lim.recusas += 1
+            metricas.descarte(motivo)
+            return motivo
+    return None
+
+def admitir_mencao(user_id: int, channel_id: int, agora: float, superior: bool = False) -> Optional[str]:
+    # None = admitido; senão o motivo da recusa. Só consome se os 3 baldes tiverem ficha.
+    # Superior usa só o balde próprio: chat lotando o canal não pode barrar uma ordem.
+    if is_japex(user_id):
+        return None
+    baldes = ((_taxa_superior, user_id, "taxa_superior"),) if superior else (
+        (_taxa_usuario, user_id, "taxa_usuario"),
+        (_taxa_canal, channel_id, "taxa_canal"),
+        (_taxa_global, 0, "taxa_global"),
+    )
+    motivo = _recusa_baldes(baldes, agora)
+    if motivo is None:
+        for lim, chave, _ in baldes:
+            lim.consumir(chave, agora)
+    return motivo
+
+async def admitir_mencao_compartilhada(user_id: int, channel_id: int, agora: float, superior: bool = False) -> Optional[str]:
+    # vários processos: usuário/canal continuam locais (cada guild vive num shard só),
+    # o global é o contador do armazém. Só consome local depois do global aceitar.
+    if is_japex(user_id):
+        return None
+    if superior:
+        return admitir_mencao(user_id, channel_id, agora, superior=True)
+    baldes = (
+        (_taxa_usuario, user_id, "taxa_usuario"),
+        (_taxa_canal, channel_id, "taxa_canal"),
+    )
+    motivo = _recusa_baldes(baldes, agora)
+    if motivo is not None:
+        return motivo
+    if not await admitir_global_compartilhado():
+        return "taxa_global"
+    for lim, chave, _ in baldes:
+        lim.consumir(chave, agora)
+    return None
 
 def typing_extra(author_id: int) -> float:
-    if is_japex(author_id):
-        return 0.8
-    return random.uniform(*EXTRA_TYPING_RANGE)
+    if not TYPING_COSMETICO:
+        return 0.0
+    extra = 0.8 if is_japex(author_id) else random.uniform(*EXTRA_TYPING_RANGE)
+    return min(extra, TYPING_ORCAMENTO_SEGUNDOS)
 
 def remover_mencao_bot(texto: str) -> str:
-    if cliente.user:
-        texto = texto.replace(cliente.user.mention, "")
+    eu = usuario_bot()
+    if eu:
+        texto = texto.replace(eu.mention, "")
     return normalizar_espacos(texto)
 
 def parece_pergunta(texto: str) -> bool:
@@ -180,17 +821,8 @@ def parece_pergunta(texto: str) -> bool:
     return any(low.startswith(s) for s in starters)
 
 def parece_ordem_rapida(texto: str) -> bool:
-    t = norm(texto)
     # heurística barata: se tem verbos típicos de comando, tratamos como tentativa de ordem
-    keys = [
-        "muta", "mutar", "timeout", "silencia", "silenciar",
-        "desmuta", "desmutar", "unmute",
-        "bane", "banir", "ban",
-        "tira cargo", "tirar cargo", "remove cargo", "remover cargo",
-        "tira todos", "remover todos", "remove all", "remove_all_roles",
-        "ignora", "ignorar", "para de", "não faça", "nao faça",
-    ]
-    return any(k in t for k in keys)
+    return "ordem" in classificar_texto(texto)
 
 _BAD_END = {
     "em","no","na","nos","nas","de","do","da","dos","das","pra","pro","para","por",
@@ -218,20 +850,321 @@ def sanitizar_resposta(msg: str) -> str:
         msg = msg[:280].rstrip() + "..."
     return msg
 
+_RE_ID_SOLTO = re.compile(r"(?<!\d)(\d{17,20})(?!\d)")
+# cargo <@&id>, canal <#id>, emoji <:x:id>, timestamp e link de mensagem também têm ID: não são alvo
+_RE_NAO_ALVO = re.compile(r"<[^<>\s]*>|(?:https?://|\bdiscord(?:app)?\.com/)\S+")
+
+def montar_alvos(mencionados: List[Tuple[int, str]], texto: str) -> List[dict]:
+    # menções de usuário primeiro; depois IDs soltos no texto (lista de contas de raid)
+    alvos = []
+    vistos: Set[int] = set()
+    for uid, nome in mencionados:
+        if uid not in vistos:
+            alvos.append({"user_id": uid, "display_name": nome})
+            vistos.add(uid)
+    for raw_id in _RE_ID_SOLTO.findall(_RE_NAO_ALVO.sub(" ", texto)):
+        uid = int(raw_id)
+        if uid not in vistos and len(alvos) < MAX_BULK_BAN_TARGETS:
+            alvos.append({"user_id": uid, "display_name": ""})
+            vistos.add(uid)
+    return alvos
+
 def limpar_nome(n: str) -> str:
     n = normalizar_espacos(n)
     # remove prefixo tipo "[Rct]" "[Rcr]" "[xxx]" repetido no início
     n = re.sub(r"^\s*(\[[^\]]{1,12}\]\s*)+", "", n).strip()
     return n if n else "Soldado"
 
+# =========================================================
+# PALAVRAS-CHAVE (classificador de uma passada)
+# =========================================================
+PALAVRAS_BRIGA = [
+    "idiota", "burro", "lixo", "verme", "otário", "otario", "vagabundo",
+    "arrombado", "fdp", "foda-se", "foda se", "seu merda", "mlk",
+    "vai tomar no", "vai se foder"
+]
+KW_DIFAMACAO = ["calunia", "calúnia", "difamacao", "difamação", "mentiroso", "acusação", "acusacao"]
+KW_DESRESPEITO = ["desrespeito", "insulto", "humilha", "ameaça", "ameaca"]
+KW_ORDEM = [
+    "muta", "mutar", "timeout", "silencia", "silenciar", "castiga", "castigar",
+    "desmuta", "desmutar", "unmute", "tira o mute", "tirar o mute", "tira o castigo", "tirar o castigo",
+    "bane", "banir", "ban",
+    "tira cargo", "tirar cargo", "remove cargo", "remover cargo",
+    "tira todos", "remover todos", "remove all", "remove_all_roles", "os cargos",
+    "ignora", "ignorar", "para de", "não faça", "nao faça",
+]
+
+# categoria -> palavras; tudo vira uma regex só, casada uma vez por mensagem
+TABELAS_KW: Dict[str, List[str]] = {
+    "briga": PALAVRAS_BRIGA,
+    "difamacao": KW_DIFAMACAO,
+    "desrespeito": KW_DESRESPEITO,
+    "ataque": ["corrupto", "ladrão", "ladrao"],
+    "japex": ["japex"],
+    "ordem": KW_ORDEM,
+    "modelo": ["modelo"],
+    "qual_seu": ["qual", "seu"],
+    "quem": ["quem"],
+    "criacao": ["programou", "criou", "fez", "criador"],
+    "eu_sou": ["eu sou"],
+    "sou_japex": ["sou japex", "sou o japex"],
+}
+_CATS_INFRACAO = frozenset({"briga", "difamacao", "desrespeito"})
+_CATS_SEM_FLAG = frozenset({"difamacao", "desrespeito", "japex"})
+
+_LEET = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"}
+_RE_LEET = re.compile(r"[013457@$]")
+_RE_ACENTO = re.compile(r"[\u0300-\u036f]")
+
+def dobrar_texto(s: str) -> str:
+    # minúsculo, sem acento, leetspeak desfeito, espaços colapsados
+    # (os atalhos evitam NFKD/substituição no caso comum: texto ASCII sem dígito)
+    s = (s or "").lower()
+    if not s.isascii():
+        s = _RE_ACENTO.sub("", unicodedata.normalize("NFKD", s))
+    if _RE_LEET.search(s):
+        s = _RE_LEET.sub(lambda m: _LEET[m.group()], s)
+    return " ".join(s.split())
+
+def _regex_trie(palavras: List[str]) -> str:
+    # trie como regex aninhada: em cada posição a regex tenta UMA vez e pega a
+    # palavra mais longa que começa ali (filhos antes do fim de palavra)
+    trie: Dict[str, dict] = {}
+    for p in palavras:
+        no = trie
+        for ch in p:
+            no = no.setdefault(ch, {})
+        no[""] = {}
+
+    def gerar(no: Dict[str, dict]) -> str:
+        fim = "" in no
+        ramos = [re.escape(ch) + gerar(filho) for ch, filho in sorted(no.items()) if ch]
+        if not ramos:
+            return ""
+        corpo = ramos[0] if len(ramos) == 1 else "(?:" + "|".join(ramos) + ")"
+        if fim:
+            return "(?:" + corpo + ")?"
+        return corpo
+
+    return gerar(trie)
+
+def _compilar_classificador(tabelas: Dict[str, List[str]]):
+    cats: Dict[str, Set[str]] = {}
+    for cat, kws in tabelas.items():
+        for kw in kws:
+            cats.setdefault(dobrar_texto(kw), set()).add(cat)
+    # a regex devolve só a palavra mais longa de cada posição; as mais curtas que
+    # são prefixo dela também bateram ali, então herdam as categorias
+    fechado = {
+        kw: frozenset(c for p, cs in cats.items() if kw.startswith(p) for c in cs)
+        for kw in cats
+    }
+    return re.compile(_regex_trie(list(cats))), fechado
+
+_RE_KW, _CATS_POR_KW = _compilar_classificador(TABELAS_KW)
+
+@functools.lru_cache(maxsize=1024)
+def classificar_texto(texto: str) -> FrozenSet[str]:
+    # todas as categorias que aparecem no texto, numa passada só
+    # (cache: a mesma mensagem passa por vários filtros)
+    t = dobrar_texto(texto)
+    achadas: Set[str] = set()
+    pos = 0
+    while True:
+        # recomeça 1 char depois do início do último acerto: pega sobreposições
+        m = _RE_KW.search(t, pos)
+        if m is None:
+            return frozenset(achadas)
+        achadas.update(_CATS_POR_KW[m.group()])
+        pos = m.start() + 1
+
+# =========================================================
+# AGENDADOR (fila por canal + fila de superiores)
+# =========================================================
+Trabalho = Callable[[], Awaitable[None]]
+T = TypeVar("T")
+
+class AgendadorCanais:
+    # - cada canal tem sua fila limitada e atende 1 por vez (ordem preservada)
+    # - canais com trabalho entram num rodízio (round-robin)
+    # - superiores vão numa fila própria, atendida antes do rodízio
+    # - no máximo `max_em_voo` trabalhos rodando ao mesmo tempo
+    def __init__(self, max_em_voo: int, max_fila_canal: int, max_fila_prioridade: int):
+        self.max_em_voo = max_em_voo
+        self.max_fila_canal = max_fila_canal
+        self.max_fila_prioridade = max_fila_prioridade
+        self._filas: Dict[int, Deque[Trabalho]] = {}
+        self._rodizio: Deque[int] = deque()
+        self._canais_ativos: Set[int] = set()
+        self._prioridade: Deque[Trabalho] = deque()
+        self._acordar: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self.descartes: Dict[str, int] = {}
+
+    def profundidade(self) -> int:
+        return len(self._prioridade) + sum(len(f) for f in self._filas.values())
+
+    def _descartar(self, motivo: str) -> bool:
+        self.descartes[motivo] = self.descartes.get(motivo, 0) + 1
+        metricas.descarte(motivo)
+        return False
+
+    def _iniciar(self) -> None:
+        if self._workers:
+            return
+        self._acordar = asyncio.Event()
+        for _ in range(self.max_em_voo):
+            self._workers.append(asyncio.get_running_loop().create_task(self._worker()))
+
+    def enviar(self, canal_id: int, trabalho: Trabalho, prioridade: bool = False) -> bool:
+        self._iniciar()
+        if prioridade:
+            if len(self._prioridade) >= self.max_fila_prioridade:
+                return self._descartar("fila_prioridade_cheia")
+            self._prioridade.append(trabalho)
+        else:
+            fila = self._filas.setdefault(canal_id, deque())
+            if len(fila) >= self.max_fila_canal:
+                return self._descartar("fila_canal_cheia")
+            fila.append(trabalho)
+            if len(fila) == 1 and canal_id not in self._canais_ativos:
+                self._rodizio.append(canal_id)
+        self._acordar.set()
+        return True
+
+    def _proximo(self) -> Optional[Tuple[Optional[int], Trabalho]]:
+        if self._prioridade:
+            return None, self._prioridade.popleft()
+        while self._rodizio:
+            cid = self._rodizio.popleft()
+            fila = self._filas.get(cid)
+            if fila:
+                self._canais_ativos.add(cid)
+                return cid, fila.popleft()
+        return None
+
+    def _liberar(self, cid: Optional[int]) -> None:
+        if cid is None:
+            return
+        self._canais_ativos.discard(cid)
+        if self._filas.get(cid):
+            self._rodizio.append(cid)
+            self._acordar.set()
+        else:
+            self._filas.pop(cid, None)
+
+    async def _worker(self) -> None:
+        while True:
+            item = self._proximo()
+            if item is None:
+                self._acordar.clear()
+                await self._acordar.wait()
+                continue
+            cid, trabalho = item
+            try:
+                await trabalho()
+            except Exception as e:
+                metricas.incr("japex_erros_total", onde="agendador", tipo=type(e).__name__)
+            finally:
+                self._liberar(cid)
+
+agendador = AgendadorCanais(MAX_EM_VOO, MAX_FILA_CANAL, MAX_FILA_PRIORIDADE)
+metricas.coletores.append(lambda: metricas.gauge("japex_fila_profundidade", agendador.profundidade()))
+
+# =========================================================
+# CACHE (LRU + TTL, limitado em bytes)
+# =========================================================
+class CacheTTL:
+    # LRU com validade; tamanho estimado pelo repr (bom o bastante pra dict/str/bool)
+    # chamadas concorrentes pra mesma chave esperam a primeira (raid de copypasta)
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._dados: "OrderedDict[str, Tuple[float, object, int]]" = OrderedDict()
+        self._em_voo: Dict[str, asyncio.Future] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirados = 0
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+    def _remover(self, chave: str) -> None:
+        _, _, tam = self._dados.pop(chave)
+        self.bytes -= tam
+
+    def get(self, chave: str) -> Tuple[bool, object]:
+        item = self._dados.get(chave)
+        if item is None:
+            self.misses += 1
+            return False, None
+        if item[0] <= time.monotonic():
+            self._remover(chave)
+            self.expirados += 1
+            self.misses += 1
+            return False, None
+        self._dados.move_to_end(chave)
+        self.hits += 1
+        return True, item[1]
+
+    def put(self, chave: str, valor: object) -> None:
+        if chave in self._dados:
+            self._remover(chave)
+        tam = len(chave) + len(repr(valor)) + 64
+        if tam > self.max_bytes:
+            return
+        self._dados[chave] = (time.monotonic() + self.ttl, valor, tam)
+        self.bytes += tam
+        while self.bytes > self.max_bytes:
+            self._remover(next(iter(self._dados)))
+            self.evictions += 1
+
+    def limpar(self) -> None:
+        self._dados.clear()
+        self.bytes = 0
+
+    async def obter_ou_calcular(self, chave: str, calcular: Callable[[], Awaitable[object]]) -> object:
+        # None = falha (API fora, timeout): devolve mas não guarda
+        achou, valor = self.get(chave)
+        if achou:
+            return valor
+        pendente = self._em_voo.get(chave)
+        if pendente is not None:
+            return await asyncio.shield(pendente)
+        fut = asyncio.get_running_loop().create_future()
+        self._em_voo[chave] = fut
+        try:
+            valor = await calcular()
+        except BaseException:
+            fut.set_result(None)
+            raise
+        finally:
+            self._em_voo.pop(chave, None)
+        if valor is not None:
+            self.put(chave, valor)
+        fut.set_result(valor)
+        return valor
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "itens": len(self._dados), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+            "evictions": self.evictions, "expirados": self.expirados,
+        }
+
+def chave_texto(texto: str) -> str:
+    # mesma mensagem com caixa/acento/espaço diferentes cai na mesma chave
+    return hashlib.blake2b(dobrar_texto(texto).encode("utf-8"), digest_size=16).hexdigest()
+
 # =========================================================
 # IGNORADOS
 # =========================================================
-def carregar_ignorados() -> Set[int]:
+def carregar_ignorados() -> FrozenSet[int]:
     s: Set[int] = set()
     try:
         if not os.path.exists(CAMINHO_IGNORE):
-            return s
+            return frozenset(s)
         with open(CAMINHO_IGNORE, "r", encoding="utf-8") as f:
             for line in f:
                 line = line.strip()
@@ -239,9 +1172,7 @@ def carregar_ignorados() -> Set[int]:
                     s.add(int(line))
     except:
         pass
-    return s
-
-IGNORADOS: Set[int] = carregar_ignorados()
+    return frozenset(s)
 
 # =========================================================
 # CHEFÕES / VOCATIVO
@@ -257,40 +1188,77 @@ def chefe_publico_info(member: discord.Member) -> Optional[Tuple[str, str, int]]
             return (key, titulo, rank)
     return None
 
-def rank_patente(member: discord.Member) -> Optional[int]:
-    best = None
+# patente de cada cargo calculada 1x por guild: role_id -> (pela tag, pelo título)
+# tag tem precedência sobre título (como antes); cada lado é (ordem, titulo) ou None
+PatenteCargo = Optional[Tuple[int, str]]
+_patentes_por_cargo: Dict[int, Dict[int, Tuple[PatenteCargo, PatenteCargo]]] = {}
+# memo por membro: guild_id -> member_id -> (ordem, titulo)
+_patente_por_membro: Dict[int, Dict[int, PatenteCargo]] = {}
+MAX_MEMO_MEMBROS = 20000  # por guild
+
+def _patente_do_cargo(nome: str) -> Tuple[PatenteCargo, PatenteCargo]:
+    nome = nome or ""
+    low = nome.lower()
+    por_tag: PatenteCargo = None
+    por_titulo: PatenteCargo = None
+    for tag, titulo, ordem in PATENTES:
+        if tag in nome and (por_tag is None or ordem < por_tag[0]):
+            por_tag = (ordem, titulo)
+        if titulo.lower() in low and (por_titulo is None or ordem < por_titulo[0]):
+            por_titulo = (ordem, titulo)
+    return por_tag, por_titulo
+
+def _tabela_cargos(guild: Optional[discord.Guild]) -> Dict[int, Tuple[PatenteCargo, PatenteCargo]]:
+    gid = guild.id if guild else 0
+    tabela = _patentes_por_cargo.get(gid)
+    if tabela is None:
+        tabela = {r.id: _patente_do_cargo(r.name) for r in (guild.roles if guild else [])}
+        _patentes_por_cargo[gid] = tabela
+    return tabela
+
+def invalidar_patentes_guild(guild_id: int) -> None:
+    _patentes_por_cargo.pop(guild_id, None)
+    _patente_por_membro.pop(guild_id, None)
+
+def invalidar_patente_membro(guild_id: int, member_id: int) -> None:
+    memo = _patente_por_membro.get(guild_id)
+    if memo:
+        memo.pop(member_id, None)
+
+def patente_membro(member: discord.Member) -> PatenteCargo:
+    guild = getattr(member, "guild", None)
+    gid = guild.id if guild else 0
+    memo = _patente_por_membro.setdefault(gid, {})
+    if member.id in memo:
+        return memo[member.id]
+
+    tabela = _tabela_cargos(guild)
+    por_tag: PatenteCargo = None
+    por_titulo: PatenteCargo = None
     for role in getattr(member, "roles", []):
-        rnome = role.name or ""
-        for tag, _, ordem in PATENTES:
-            if tag in rnome:
-                best = ordem if best is None else min(best, ordem)
-    if best is not None:
-        return best
-    for role in getattr(member, "roles", []):
-        rnome = role.name or ""
-        for _, titulo, ordem in PATENTES:
-            if titulo.lower() in rnome.lower():
-                best = ordem if best is None else min(best, ordem)
-    return best
+        par = tabela.get(role.id)
+        if par is None:
+            # cargo que ainda não está na tabela (evento perdido): calcula e guarda
+            par = tabela[role.id] = _patente_do_cargo(role.name)
+        t, ti = par
+        if t and (por_tag is None or t[0] < por_tag[0]):
+            por_tag = t
+        if ti and (por_titulo is None or ti[0] < por_titulo[0]):
+            por_titulo = ti
+    res = por_tag or por_titulo
+
+    if len(memo) >= MAX_MEMO_MEMBROS:
+        memo.clear()
+    memo[member.id] = res
+    return res
+
+def rank_patente(member: discord.Member) -> Optional[int]:
+    p = patente_membro(member)
+    return p[0] if p else None
 
 def best_patente_title(member: discord.Member) -> Optional[str]:
-    best_title = None
-    best_ord = 999
-    for role in getattr(member, "roles", []):
-        rnome = role.name or ""
-        for tag, titulo, ordem in PATENTES:
-            if tag in rnome and ordem < best_ord:
-                best_title = titulo
-                best_ord = ordem
-    if best_title:
-        return best_title
-    for role in getattr(member, "roles", []):
-        rnome = role.name or ""
-        for _, titulo, ordem in PATENTES:
-            if titulo.lower() in rnome.lower() and ordem < best_ord:
-                best_title = titulo
-                best_ord = ordem
-    return best_title
+    p = patente_membro(member)
+    return p[1] if p else None
 
 def vocativo(member: discord.Member) -> str:
     if is_japex(member.id):
@@ -317,9 +1285,10 @@ def autoridade_sobre_bot(author: discord.Member, guild: discord.Guild) -> bool:
     if chefe_publico_info(author) is not None:
         return True
 
-    if not guild or not cliente.user:
+    eu = usuario_bot()
+    if not guild or not eu:
         return False
-    bm = guild.get_member(cliente.user.id)
+    bm = guild.get_member(eu.id)
     if not bm:
         return False
 
@@ -333,9 +1302,10 @@ def autoridade_sobre_bot(author: discord.Member, guild: discord.Guild) -> bool:
 # PERMS / HIERARQUIA
 # =========================================================
 def bot_member(guild: discord.Guild) -> Optional[discord.Member]:
-    if not guild or not cliente.user:
+    eu = usuario_bot()
+    if not guild or not eu:
         return None
-    return guild.get_member(cliente.user.id)
+    return guild.get_member(eu.id)
 
 def bot_has_perm(guild: discord.Guild, perm_name: str) -> bool:
     bm = bot_member(guild)
@@ -362,40 +1332,407 @@ def bot_can_manage_role(guild: discord.Guild, role: discord.Role) -> bool:
     except:
         return False
 
+# =========================================================
+# HISTÓRICO DE INFRAÇÕES (SQLite WAL, escrita em lote fora do loop)
+# =========================================================
+# ":memory:" serve pra replay/bench; vários processos de shard podem dividir o mesmo arquivo
+INFRACOES_DB = os.getenv("INFRACOES_DB", os.path.join(PASTA_ATUAL, "infracoes.db"))
+INFRACOES_LOTE_MS = 200          # junta o que chegar nessa janela num INSERT só
+INFRACOES_LOTE_MAX = 1000        # lote cheio grava na hora
+INFRACOES_JANELA_SEGUNDOS = 7 * 86400
+# reincidência na janela -> multiplicador da duração do mute automático
+ESCALONAMENTO = (1, 2, 4, 8, 16)
+MUTE_AUTO_MAX_SEGUNDOS = 86400
+
+class Infracao(NamedTuple):
+    guild_id: int
+    user_id: int
+    ts: float
+    acao: str
+    duracao: int
+    motivo: str
+    origem: str
+
+class LivroInfracoes:
+    # toda operação de disco roda numa thread só (FIFO): uma consulta enviada depois
+    # de um lote só executa depois do commit dele, então o que ainda está em
+    # `_pendentes` no momento da consulta é exatamente o que falta somar.
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._db = None
+        self._pendentes: List[Infracao] = []
+        self._acordar: Optional[asyncio.Event] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        self._executor = None
+        self.gravadas = 0
+
+    def _conexao(self):
+        if self._db is None:
+            import sqlite3
+            self._db = sqlite3.connect(self.caminho, isolation_level=None, check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            # índice por usuário recebe inserção em posição aleatória: cache maior evita reler páginas
+            self._db.execute("PRAGMA cache_size=-32000")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS infracoes (id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL,"
+                " user_id INTEGER NOT NULL, ts REAL NOT NULL, acao TEXT NOT NULL, duracao INTEGER, motivo TEXT, origem TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_infracoes_usuario ON infracoes(guild_id, user_id, ts)")
+        return self._db
+
+    def _gravar(self, lote: List[Infracao]) -> None:
+        db = self._conexao()
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "INSERT INTO infracoes (guild_id, user_id, ts, acao, duracao, motivo, origem) VALUES (?, ?, ?, ?, ?, ?, ?)", lote
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _contar(self, guild_id: int, user_id: int, desde: float) -> int:
+        row = self._conexao().execute(
+            "SELECT COUNT(*) FROM infracoes WHERE guild_id = ? AND user_id = ? AND ts >= ?", (guild_id, user_id, desde)
+        ).fetchone()
+        return int(row[0])
+
+    def _enviar(self, fn, *args) -> asyncio.Future:
+        # entra na fila da thread na hora da chamada, sem esperar o loop girar
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infracoes")
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _no_disco(self, fn, *args):
+        return await self._enviar(fn, *args)
+
+    def registrar(self, guild_id: int, user_id: int, acao: str, duracao: int = 0, motivo: str = "", origem: str = "") -> None:
+        # não espera disco: entra na fila e o gravador junta em lote
+        self._pendentes.append(Infracao(guild_id, user_id, time.time(), acao, int(duracao or 0), motivo[:200], origem))
+        if self._tarefa is None or self._tarefa.done():
+            self._acordar = asyncio.Event()
+            self._tarefa = asyncio.get_running_loop().create_task(self._gravador())
+        if len(self._pendentes) == 1 or len(self._pendentes) >= INFRACOES_LOTE_MAX:
+            self._acordar.set()
+
+    async def _gravador(self) -> None:
+        while True:
+            await self._acordar.wait()
+            self._acordar.clear()
+            if len(self._pendentes) < INFRACOES_LOTE_MAX:
+                await asyncio.sleep(INFRACOES_LOTE_MS / 1000)
+            await self.descarregar()
+
+    async def _gravar_lote(self, lote: List[Infracao], fut: asyncio.Future) -> None:
+        try:
+            with metricas.medir("infracoes_lote"):
+                await fut
+            self.gravadas += len(lote)
+            metricas.incr("japex_infracoes_gravadas_total", len(lote))
+        except Exception as e:
+            metricas.erro("infracoes", e)
+            metricas.incr("japex_descartes_total", len(lote), motivo="infracoes_lote")
+
+    async def descarregar(self) -> None:
+        # os lotes entram na fila da thread aqui mesmo, antes do primeiro await: o que sai
+        # de `_pendentes` já está na frente de qualquer consulta feita depois
+        fila, self._pendentes = self._pendentes, []
+        lotes = [fila[i:i + INFRACOES_LOTE_MAX] for i in range(0, len(fila), INFRACOES_LOTE_MAX)]
+        futs = [self._enviar(self._gravar, lote) for lote in lotes]
+        await asyncio.gather(*(self._gravar_lote(lote, fut) for lote, fut in zip(lotes, futs)))
+
+    async def contar(self, guild_id: int, user_id: int, janela: float = INFRACOES_JANELA_SEGUNDOS) -> int:
+        desde = time.time() - janela
+        fila = sum(1 for i in self._pendentes if i.user_id == user_id and i.guild_id == guild_id and i.ts >= desde)
+        try:
+            return fila + await self._no_disco(self._contar, guild_id, user_id, desde)
+        except Exception as e:
+            metricas.erro("infracoes", e)
+            return fila
+
+infracoes = LivroInfracoes(INFRACOES_DB)
+metricas.coletores.append(lambda: metricas.gauge("japex_infracoes_pendentes", len(infracoes._pendentes)))
+
+def duracao_escalonada(base: int, anteriores: int) -> int:
+    fator = ESCALONAMENTO[min(anteriores, len(ESCALONAMENTO) - 1)]
+    return int(min(MUTE_AUTO_MAX_SEGUNDOS, base * fator))
+
 # =========================================================
 # DISCORD ACTIONS
 # =========================================================
 async def mutar(member: discord.Member, segundos: int) -> Tuple[bool, str]:
     try:
         ate = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=segundos)
-        await member.edit(timed_out_until=ate, reason="moderação")
+        with metricas.medir("discord_acao", acao="mute"):
+            await member.edit(timed_out_until=ate, reason="moderação")
         return True, ""
     except Exception as e:
+        metricas.erro("discord", e)
         return False, repr(e)
 
 async def desmutar(member: discord.Member) -> Tuple[bool, str]:
     try:
-        await member.edit(timed_out_until=None, reason="moderação")
+        with metricas.medir("discord_acao", acao="unmute"):
+            await member.edit(timed_out_until=None, reason="moderação")
         return True, ""
     except Exception as e:
+        metricas.erro("discord", e)
         return False, repr(e)
 
 async def banir(member: discord.Member) -> Tuple[bool, str]:
     try:
         if member.guild:
-            await member.guild.ban(member, reason="moderação", delete_message_seconds=0)
+            with metricas.medir("discord_acao", acao="ban"):
+                await member.guild.ban(member, reason="moderação", delete_message_seconds=0)
             return True, ""
         return False, "sem guild"
     except Exception as e:
+        metricas.erro("discord", e)
         return False, repr(e)
 
-async def remove_role(member: discord.Member, role: discord.Role) -> Tuple[bool, str]:
+async def remover_cargos(member: discord.Member, cargos: List[discord.Role]) -> Tuple[bool, str]:
+    # 1 PATCH só: manda a lista de cargos que ficam
+    tirar = {r.id for r in cargos}
+    manter = [r for r in getattr(member, "roles", []) if not r.is_default() and r.id not in tirar]
     try:
-        await member.remove_roles(role, reason="moderação")
+        with metricas.medir("discord_acao", acao="remove_all_roles"):
+            await member.edit(roles=manter, reason="moderação")
         return True, ""
     except Exception as e:
+        metricas.erro("discord", e)
         return False, repr(e)
 
+# =========================================================
+# MEMBROS (cache limitado + busca sob demanda)
+# =========================================================
+# sem chunk o guild.get_member só conhece o próprio bot; quem fala ou é marcado
+# entra aqui. Autoridades ficam fixas; o resto sai por inatividade/teto.
+MEMBROS_TTL = 6 * 3600.0
+MEMBROS_MAX = 20_000             # ativos, somando todas as guilds
+MEMBROS_MAX_AUTORIDADES = 2_000
+QUERY_MEMBROS_LOTE = 100         # limite do gateway por pedido de membros
+QUERY_MEMBROS_TIMEOUT = 5.0      # o padrão do discord.py espera bem mais que isso
+FETCH_MEMBROS_MAX = MAX_MASS_TARGETS
+
+_membros_ativos = MapaExpiravel(MEMBROS_TTL, MEMBROS_MAX)  # (guild_id, user_id) -> Member
+_membros_autoridade: "OrderedDict[Tuple[int, int], discord.Member]" = OrderedDict()
+
+def _ids_cargos(m: discord.Member) -> List[int]:
+    return [r.id for r in getattr(m, "roles", [])]
+
+def lembrar_membro(m: discord.Member) -> None:
+    guild = getattr(m, "guild", None)
+    if CHUNK_NA_PARTIDA or guild is None:
+        return
+    chave = (guild.id, m.id)
+    agora = time.monotonic()
+    anterior = _membros_autoridade.get(chave) or _membros_ativos.get(chave, agora)
+    # sem cache do discord.py não chega on_member_update: cargo mudou -> patente recalcula
+    if anterior is None or _ids_cargos(anterior) != _ids_cargos(m):
+        invalidar_patente_membro(guild.id, m.id)
+    if autoridade_sobre_bot(m, guild):
+        _membros_autoridade[chave] = m
+        _membros_autoridade.move_to_end(chave)
+        if len(_membros_autoridade) > MEMBROS_MAX_AUTORIDADES:
+            _membros_autoridade.popitem(last=False)
+    else:
+        _membros_autoridade.pop(chave, None)
+        _membros_ativos.set(chave, m, agora)
+
+def membro_em_cache(guild: discord.Guild, uid: int) -> Optional[discord.Member]:
+    m = guild.get_member(uid)
+    if m is not None:
+        return m
+    chave = (guild.id, uid)
+    return _membros_autoridade.get(chave) or _membros_ativos.get(chave, time.monotonic())
+
+async def resolver_membros(guild: discord.Guild, ids: List[int]) -> Dict[int, discord.Member]:
+    # cache -> query_members em lote (gateway) -> fetch_member (REST) pro que sobrar
+    achados: Dict[int, discord.Member] = {}
+    faltam: List[int] = []
+    for uid in dict.fromkeys(ids):
+        m = membro_em_cache(guild, uid)
+        if m is None:
+            faltam.append(uid)
+        else:
+            achados[uid] = m
+    metricas.incr("japex_membros_resolvidos_total", len(achados), origem="cache")
+
+    for i in range(0, len(faltam), QUERY_MEMBROS_LOTE):
+        lote = faltam[i:i + QUERY_MEMBROS_LOTE]
+        try:
+            with metricas.medir("discord_acao", acao="query_members"):
+                ms = await asyncio.wait_for(guild.query_members(user_ids=lote, limit=len(lote), cache=False), QUERY_MEMBROS_TIMEOUT)
+        except Exception as e:
+            metricas.erro("discord", e)
+            ms = []
+        for m in ms:
+            lembrar_membro(m)
+            achados[m.id] = m
+        metricas.incr("japex_membros_resolvidos_total", len(ms), origem="query")
+
+    async def buscar(uid: int) -> Optional[discord.Member]:
+        try:
+            with metricas.medir("discord_acao", acao="fetch_member"):
+                m = await guild.fetch_member(uid)
+        except discord.NotFound:
+            return None
+        except Exception as e:
+            metricas.erro("discord", e)
+            return None
+        lembrar_membro(m)
+        return m
+
+    sobra = [u for u in faltam if u not in achados][:FETCH_MEMBROS_MAX]
+    if sobra:
+        buscados = [m for m in await asyncio.gather(*(buscar(u) for u in sobra)) if m is not None]
+        for m in buscados:
+            achados[m.id] = m
+        metricas.incr("japex_membros_resolvidos_total", len(buscados), origem="fetch")
+    return achados
+
+def _coletar_membros() -> None:
+    metricas.gauge("japex_membros_cache", len(_membros_ativos), tipo="ativos")
+    metricas.gauge("japex_membros_cache", len(_membros_autoridade), tipo="autoridades")
+
+metricas.coletores.append(_coletar_membros)
+
+# =========================================================
+# HISTÓRICO DE CANAL (últimas mensagens em memória)
+# =========================================================
+# resolve reply sem fetch_message e dá as últimas falas pro prompt de conversa.
+# Teto por canal (itens) e global (bytes aproximados): passou do global, sai a
+# mensagem mais velha do canal parado há mais tempo.
+HISTORICO_POR_CANAL = 50
+HISTORICO_MAX_BYTES = 8 * 1024 * 1024
+HISTORICO_MAX_CHARS = 2000          # limite do Discord sem Nitro
+HISTORICO_NO_PROMPT = os.getenv("HISTORICO_NO_PROMPT", "0") == "1"
+HISTORICO_LINHAS_PROMPT = 6
+HISTORICO_CHARS_LINHA = 200
+
+class MensagemRecente(NamedTuple):
+    # mesmos nomes de atributo do discord.Message que o resto do código lê
+    id: int
+    author: discord.abc.User
+    content: str
+
+def _tamanho_recente(m: MensagemRecente) -> int:
+    return 120 + 2 * len(m.content)
+
+class HistoricoCanais:
+    def __init__(self, por_canal: int, max_bytes: int):
+        self.por_canal = por_canal
+        self.max_bytes = max_bytes
+        self._canais: "OrderedDict[int, OrderedDict[int, MensagemRecente]]" = OrderedDict()
+        self.bytes = 0
+        self.itens = 0
+
+    def _tirar(self, fila: "OrderedDict[int, MensagemRecente]", ultima: bool = False) -> None:
+        _, m = fila.popitem(last=ultima)
+        self.bytes -= _tamanho_recente(m)
+        self.itens -= 1
+
+    def adicionar(self, mensagem: discord.Message) -> None:
+        cid = mensagem.channel.id
+        fila = self._canais.get(cid)
+        if fila is None:
+            fila = self._canais[cid] = OrderedDict()
+        else:
+            self._canais.move_to_end(cid)
+        if mensagem.id in fila:
+            return
+        m = MensagemRecente(mensagem.id, mensagem.author, (mensagem.content or "")[:HISTORICO_MAX_CHARS])
+        fila[mensagem.id] = m
+        self.bytes += _tamanho_recente(m)
+        self.itens += 1
+        if len(fila) > self.por_canal:
+            self._tirar(fila)
+        while self.bytes > self.max_bytes and self._canais:
+            cid_velho, velha = next(iter(self._canais.items()))
+            if velha:
+                self._tirar(velha)
+            if not velha:
+                del self._canais[cid_velho]
+
+    def obter(self, channel_id: int, message_id: int) -> Optional[MensagemRecente]:
+        fila = self._canais.get(channel_id)
+        return fila.get(message_id) if fila else None
+
+    def editar(self, channel_id: int, message_id: int, conteudo: str) -> None:
+        fila = self._canais.get(channel_id)
+        m = fila.get(message_id) if fila else None
+        if m is None:
+            return
+        nova = m._replace(content=conteudo[:HISTORICO_MAX_CHARS])
+        fila[message_id] = nova
+        self.bytes += _tamanho_recente(nova) - _tamanho_recente(m)
+
+    def apagar(self, channel_id: int, message_id: int) -> None:
+        fila = self._canais.get(channel_id)
+        m = fila.pop(message_id, None) if fila else None
+        if m is not None:
+            self.bytes -= _tamanho_recente(m)
+            self.itens -= 1
+
+    def linhas(self, channel_id: int, antes_de: int, n: int = HISTORICO_LINHAS_PROMPT) -> str:
+        # "Nome: texto" das n últimas antes da mensagem atual (ids crescem com o tempo)
+        fila = self._canais.get(channel_id)
+        if not fila:
+            return ""
+        out: List[str] = []
+        for m in reversed(fila.values()):
+            if m.id >= antes_de or not m.content:
+                continue
+            out.append(f"{limpar_nome(getattr(m.author, 'display_name', '') or '')}: {normalizar_espacos(m.content)[:HISTORICO_CHARS_LINHA]}")
+            if len(out) >= n:
+                break
+        return " | ".join(reversed(out))
+
+historico = HistoricoCanais(HISTORICO_POR_CANAL, HISTORICO_MAX_BYTES)
+
+def _coletar_historico() -> None:
+    metricas.gauge("japex_cache_bytes", historico.bytes, cache="historico")
+    metricas.gauge("japex_cache_itens", historico.itens, cache="historico")
+
+metricas.coletores.append(_coletar_historico)
+
+async def resolver_referencia(mensagem: discord.Message) -> Optional[object]:
+    # gateway (resolved) -> histórico em memória -> REST, nessa ordem
+    ref = mensagem.reference
+    if not ref:
+        return None
+    if isinstance(ref.resolved, discord.Message):
+        metricas.incr("japex_referencia_total", origem="gateway")
+        return ref.resolved
+    if not ref.message_id:
+        return None
+    m = historico.obter(mensagem.channel.id, ref.message_id)
+    if m is not None:
+        metricas.incr("japex_referencia_total", origem="memoria")
+        return m
+    metricas.incr("japex_referencia_total", origem="rest")
+    try:
+        with metricas.medir("discord_acao", acao="fetch_message"):
+            return await mensagem.channel.fetch_message(ref.message_id)
+    except Exception as e:
+        metricas.erro("discord", e)
+        return None
+
+async def autor_membro(guild: discord.Guild, channel_id: int, referenced: object) -> Optional[discord.Member]:
+    # o `resolved` do gateway vem sem `member` e o discord.py só promove o autor
+    # via guild.get_member, que sem cache de membros devolve None: chega User.
+    # Histórico (guardou o Member do on_message) -> cache do bot -> gateway/REST
+    autor = getattr(referenced, "author", None)
+    if autor is None or isinstance(autor, discord.Member):
+        return autor
+    recente = historico.obter(channel_id, getattr(referenced, "id", 0))
+    if recente is not None and isinstance(recente.author, discord.Member):
+        return recente.author
+    return (await resolver_membros(guild, [autor.id])).get(autor.id)
+
 # =========================================================
 # DADOS.TXT (leve)
 # =========================================================
@@ -406,75 +1743,507 @@ STOPWORDS = {
     "sobre","isso","isto","aquele","aquela","aquilo","meu","minha","seu","sua",
     "pra","pro","pq","porque"
 }
-_dados_cache = {"mtime": None, "blocos": []}
-
-def _tokenizar(s: str) -> Set[str]:
+# ranking BM25 sobre índice invertido (termo -> [(bloco, tf)])
+BM25_K1 = 1.2
+BM25_B = 0.75
+DADOS_TOP_K = 3
+DADOS_MIN_TERMOS = 2  # bloco precisa bater 2+ termos da pergunta (mesma régua de antes)
+
+# "trigramas": TF-IDF de trigramas de caractere (aguenta "alistamneto", "portao", "recruta?")
+# matriz fica salva do lado do dados.txt e é aberta com mmap; precisa do numpy
+DADOS_MODO = os.getenv("DADOS_MODO", "bm25").strip().lower()
+TRIGRAMA_DIM = 2048        # trigramas espalhados por hash em colunas fixas
+TRIGRAMA_MIN_SCORE = 0.2   # cosseno mínimo pra um bloco entrar no contexto
+
+class IndiceTrigramas(NamedTuple):
+    # matriz esparsa por coluna (CSC): trigrama -> blocos que têm ele, linhas já normalizadas
+    indptr: object   # np.ndarray int32 (TRIGRAMA_DIM + 1,)
+    docs: object     # np.ndarray int32 (nnz,)
+    pesos: object    # np.ndarray float32 (nnz,)
+    idf: object      # np.ndarray float32 (TRIGRAMA_DIM,)
+    n_blocos: int
+
+class IndiceDados(NamedTuple):
+    blocos: List[Tuple[str, str]]              # (titulo, texto)
+    postings: Dict[str, List[Tuple[int, int]]]  # termo -> [(bloco, tf)]
+    idf: Dict[str, float]
+    norma_doc: List[float]                     # k1 * (1 - b + b * tam/tam_medio), pré-calculado
+    trigramas: Optional[IndiceTrigramas] = None
+
+INDICE_VAZIO = IndiceDados([], {}, {}, [])
+
+def _termos(s: str) -> List[str]:
     s = (s or "").lower()
     s = re.sub(r"[^a-z0-9áàâãéèêíìîóòôõúùûç°\s]", " ", s, flags=re.IGNORECASE)
-    parts = [p for p in s.split() if p and p not in STOPWORDS and len(p) > 2]
-    return set(parts)
+    return [p for p in s.split() if p and p not in STOPWORDS and len(p) > 2]
+
+def _tokenizar(s: str) -> Set[str]:
+    return set(_termos(s))
+
+def _separar_blocos(raw: str) -> List[Tuple[str, str]]:
+    partes = re.split(r"(?m)^\s*##\s+", raw)
+    blocos: List[Tuple[str, str]] = []
 
-def carregar_blocos_dados() -> List[Tuple[str, str, Set[str]]]:
+    if partes and not raw.lstrip().startswith("##"):
+        blocos.append(("GERAL", partes[0].strip()))
+        partes = partes[1:]
+
+    for p in partes:
+        p = p.strip()
+        if not p:
+            continue
+        linhas = p.split("\n", 1)
+        titulo = normalizar_espacos(linhas[0])[:60] if linhas else "BLOCO"
+        texto = linhas[1].strip() if len(linhas) > 1 else ""
+        texto = re.sub(r"\n{3,}", "\n\n", texto).strip()
+        blocos.append((titulo, texto))
+    return blocos
+
+def indexar_blocos(blocos: List[Tuple[str, str]]) -> IndiceDados:
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    tamanhos: List[int] = []
+    for i, (titulo, texto) in enumerate(blocos):
+        termos = _termos(titulo + " " + texto)
+        tamanhos.append(len(termos))
+        tf: Dict[str, int] = {}
+        for t in termos:
+            tf[t] = tf.get(t, 0) + 1
+        for t, n in tf.items():
+            postings.setdefault(t, []).append((i, n))
+
+    total = len(blocos)
+    medio = (sum(tamanhos) / total) if total else 1.0
+    medio = medio or 1.0
+    idf = {t: math.log(1.0 + (total - len(p) + 0.5) / (len(p) + 0.5)) for t, p in postings.items()}
+    norma = [BM25_K1 * (1.0 - BM25_B + BM25_B * n / medio) for n in tamanhos]
+    return IndiceDados(blocos, postings, idf, norma)
+
+_STOP_DOBRADAS = frozenset(dobrar_texto(w) for w in STOPWORDS)
+_RE_PALAVRA_DOBRADA = re.compile(r"[a-z0-9]+")
+
+@functools.lru_cache(maxsize=65536)
+def _dims_palavra(palavra: str) -> Tuple[int, ...]:
+    # crc32 e não hash(): a coluna tem que ser a mesma entre processos (matriz persistida)
+    p = f" {palavra} "
+    return tuple(zlib.crc32(p[i:i + 3].encode("utf-8")) % TRIGRAMA_DIM for i in range(len(p) - 2))
+
+def _contar_trigramas(s: str) -> Dict[int, int]:
+    cont: Dict[int, int] = {}
+    for w in _RE_PALAVRA_DOBRADA.findall(dobrar_texto(s)):
+        if w in _STOP_DOBRADAS:
+            continue
+        for d in _dims_palavra(w):
+            cont[d] = cont.get(d, 0) + 1
+    return cont
+
+def indexar_trigramas(blocos: List[Tuple[str, str]]) -> IndiceTrigramas:
+    n = len(blocos)
+    linhas: List[int] = []
+    cols: List[int] = []
+    vals: List[float] = []
+    for i, (titulo, texto) in enumerate(blocos):
+        for d, c in _contar_trigramas(titulo + " " + texto).items():
+            linhas.append(i)
+            cols.append(d)
+            vals.append(1.0 + math.log(c))
+    l = np.asarray(linhas, dtype=np.int32)
+    c = np.asarray(cols, dtype=np.int32)
+    v = np.asarray(vals, dtype=np.float32)
+
+    df = np.bincount(c, minlength=TRIGRAMA_DIM)
+    idf = (np.log((n + 1.0) / (df + 1.0)) + 1.0).astype(np.float32)
+    v *= idf[c]
+    normas = np.sqrt(np.bincount(l, weights=v * v, minlength=n)).astype(np.float32)
+    normas[normas == 0] = 1.0
+    v /= normas[l]
+
+    ordem = np.argsort(c, kind="stable")
+    indptr = np.zeros(TRIGRAMA_DIM + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum(df)
+    return IndiceTrigramas(indptr, l[ordem], v[ordem], idf, n)
+
+def _caminhos_trigramas() -> Tuple[str, str]:
+    base = CAMINHO_DADOS + ".trigramas"
+    return base + ".npy", base + ".json"
+
+TRIGRAMA_CABECALHO = 4  # int32 no começo do .npy: os 16 bytes do hash do dados.txt
+
+def _abrir_trigramas(cam_npy: str, meta: dict, digest: bytes) -> IndiceTrigramas:
+    # um .npy int32 só: [hash do dados.txt | indptr | docs | pesos (bits do float32)]
+    # o hash e o tamanho são conferidos na própria matriz: o .json pode ser de
+    # outra versão (queda entre os dois replace) e aí a matriz não é usada
+    arr = np.load(cam_npy, mmap_mode="r")
+    nnz = meta["nnz"]
+    h = TRIGRAMA_CABECALHO
+    if len(arr) != h + TRIGRAMA_DIM + 1 + 2 * nnz or arr[:h].tobytes() != digest:
+        raise ValueError("matriz de trigramas não bate com o dados.txt")
+    indptr = arr[h:h + TRIGRAMA_DIM + 1]
+    docs = arr[h + TRIGRAMA_DIM + 1:h + TRIGRAMA_DIM + 1 + nnz]
+    pesos = arr[h + TRIGRAMA_DIM + 1 + nnz:].view(np.float32)
+    return IndiceTrigramas(indptr, docs, pesos, np.asarray(meta["idf"], dtype=np.float32), meta["blocos"])
+
+def _gravar_atomico(caminho: str, dados: Callable[[object], None]) -> None:
+    # temporário único por processo na mesma pasta: shards subindo juntos não
+    # escrevem no mesmo arquivo, e o replace só publica arquivo completo
+    pasta, nome = os.path.split(caminho)
+    fd, tmp = tempfile.mkstemp(dir=pasta or ".", prefix=nome + ".", suffix=".tmp")
     try:
-        if not os.path.exists(CAMINHO_DADOS):
-            return []
-        mtime = os.path.getmtime(CAMINHO_DADOS)
-        if _dados_cache["mtime"] == mtime and _dados_cache["blocos"]:
-            return _dados_cache["blocos"]
+        with os.fdopen(fd, "wb") as f:
+            dados(f)
+        os.replace(tmp, caminho)
+    except:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+def carregar_trigramas(blocos: List[Tuple[str, str]], raw: str) -> Optional[IndiceTrigramas]:
+    # reaproveita a matriz salva se ela for do mesmo dados.txt; senão recalcula e regrava
+    if np is None or not blocos:
+        return None
+    digest = hashlib.blake2b(raw.encode("utf-8"), digest_size=4 * TRIGRAMA_CABECALHO).digest()
+    assinatura = digest.hex()
+    cam_npy, cam_meta = _caminhos_trigramas()
+    try:
+        with open(cam_meta, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("assinatura") == assinatura and meta.get("dim") == TRIGRAMA_DIM and meta.get("blocos") == len(blocos):
+            return _abrir_trigramas(cam_npy, meta, digest)
+    except:
+        pass
+
+    tri = indexar_trigramas(blocos)
+    try:
+        cabecalho = np.frombuffer(digest, dtype=np.int32)
+        _gravar_atomico(cam_npy, lambda f: np.save(f, np.concatenate([cabecalho, tri.indptr, tri.docs, tri.pesos.view(np.int32)])))
+        meta = {"assinatura": assinatura, "dim": TRIGRAMA_DIM, "blocos": len(blocos),
+                "nnz": int(len(tri.docs)), "idf": tri.idf.tolist()}
+        _gravar_atomico(cam_meta, lambda f: f.write(json.dumps(meta).encode("utf-8")))
+        return _abrir_trigramas(cam_npy, meta, digest)
+    except:
+        return tri  # pasta sem escrita (ou outro processo trocou a matriz no meio): fica com a da memória
 
+def carregar_blocos_dados() -> IndiceDados:
+    # lê e indexa do disco; quem chama é o vigia de arquivos (fora do event loop)
+    try:
+        if not os.path.exists(CAMINHO_DADOS):
+            return INDICE_VAZIO
         with open(CAMINHO_DADOS, "r", encoding="utf-8") as f:
             raw = f.read().replace("\r\n", "\n").strip()
         if not raw:
-            return []
-
-        partes = re.split(r"(?m)^\s*##\s+", raw)
-        blocos: List[Tuple[str, str, Set[str]]] = []
-
-        if partes and not raw.lstrip().startswith("##"):
-            titulo = "GERAL"
-            texto = partes[0].strip()
-            toks = _tokenizar(titulo + " " + texto)
-            blocos.append((titulo, texto, toks))
-            partes = partes[1:]
-
-        for p in partes:
-            p = p.strip()
-            if not p:
-                continue
-            linhas = p.split("\n", 1)
-            titulo = normalizar_espacos(linhas[0])[:60] if linhas else "BLOCO"
-            texto = linhas[1].strip() if len(linhas) > 1 else ""
-            texto = re.sub(r"\n{3,}", "\n\n", texto).strip()
-            toks = _tokenizar(titulo + " " + texto)
-            blocos.append((titulo, texto, toks))
-
-        _dados_cache["mtime"] = mtime
-        _dados_cache["blocos"] = blocos
-        return blocos
+            return INDICE_VAZIO
+        indice = indexar_blocos(_separar_blocos(raw))
+        if DADOS_MODO == "trigramas":
+            indice = indice._replace(trigramas=carregar_trigramas(indice.blocos, raw))
+        return indice
     except:
-        return []
+        return INDICE_VAZIO
 
-def buscar_contexto_dados(pergunta: str, max_chars: int = 650) -> str:
-    blocos = carregar_blocos_dados()
-    if not blocos:
+def ranquear_trigramas(tri: IndiceTrigramas, pergunta: str, k: int = DADOS_TOP_K) -> List[Tuple[float, int]]:
+    # produto matriz esparsa x vetor: só as colunas dos trigramas da pergunta são lidas
+    cont = _contar_trigramas(pergunta)
+    if not cont:
+        return []
+    dims = np.fromiter(cont.keys(), dtype=np.int64, count=len(cont))
+    q = (1.0 + np.log(np.fromiter(cont.values(), dtype=np.float32, count=len(cont)))) * tri.idf[dims]
+    norma = float(np.linalg.norm(q))
+    if norma == 0.0:
+        return []
+    q /= norma
+    docs: List[object] = []
+    pesos: List[object] = []
+    for d, w in zip(dims.tolist(), q.tolist()):
+        a, b = tri.indptr[d], tri.indptr[d + 1]
+        if a != b:
+            docs.append(tri.docs[a:b])
+            pesos.append(tri.pesos[a:b] * w)
+    if not docs:
+        return []
+    scores = np.bincount(np.concatenate(docs), weights=np.concatenate(pesos), minlength=tri.n_blocos)
+    if len(scores) > k:
+        idx = np.argpartition(-scores, k)[:k]
+    else:
+        idx = np.arange(len(scores))
+    top = [(float(scores[i]), int(i)) for i in idx if scores[i] >= TRIGRAMA_MIN_SCORE]
+    top.sort(reverse=True)
+    return top
+
+def ranquear_blocos(indice: IndiceDados, pergunta: str, k: int = DADOS_TOP_K) -> List[Tuple[float, int]]:
+    if indice.trigramas is not None:
+        return ranquear_trigramas(indice.trigramas, pergunta, k)
+    # custo proporcional às postings dos termos da pergunta, não ao tamanho do arquivo
+    scores: Dict[int, float] = {}
+    batidas: Dict[int, int] = {}
+    for t in _tokenizar(pergunta):
+        posting = indice.postings.get(t)
+        if not posting:
+            continue
+        idf = indice.idf[t]
+        for doc, tf in posting:
+            scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1.0) / (tf + indice.norma_doc[doc])
+            batidas[doc] = batidas.get(doc, 0) + 1
+    candidatos = [(sc, doc) for doc, sc in scores.items() if batidas[doc] >= DADOS_MIN_TERMOS]
+    return heapq.nlargest(k, candidatos)
+
+def buscar_contexto_dados(pergunta: str, max_chars: int = 650, k: int = DADOS_TOP_K) -> str:
+    indice = _estado.indice
+    if not indice.blocos:
         return ""
-    q_tokens = _tokenizar(pergunta)
-    if not q_tokens:
+    top = ranquear_blocos(indice, pergunta, k)
+    if not top:
         return ""
-    melhor_score = 0
-    melhor = None
-    for titulo, texto, toks in blocos:
-        inter = len(q_tokens.intersection(toks))
-        if inter > melhor_score:
-            melhor_score = inter
-            melhor = (titulo, texto)
-    if not melhor or melhor_score < 2:
+
+    # empacota os melhores blocos no orçamento; o 1º sempre entra (cortado se preciso)
+    partes: List[str] = []
+    usado = 0
+    for _, doc in top:
+        titulo, texto = indice.blocos[doc]
+        trecho = normalizar_espacos(f"[{titulo}] {texto}")
+        if not partes:
+            if len(trecho) > max_chars:
+                trecho = trecho[:max_chars].rstrip() + "..."
+            partes.append(trecho)
+            usado = len(trecho)
+            continue
+        if usado + 1 + len(trecho) > max_chars:
+            continue
+        partes.append(trecho)
+        usado += 1 + len(trecho)
+    return " ".join(partes)
+
+# =========================================================
+# ARQUIVOS DE CONTROLE (vigia em background)
+# =========================================================
+# dados.txt, ignorar.txt e silencio.flag são lidos só pelo vigia; o resto do
+# bot lê o snapshot imutável em `_estado`, trocado de uma vez a cada mudança
+VIGIA_POLL_SEGUNDOS = 2.0          # fallback sem inotify
+VIGIA_VARREDURA_SEGUNDOS = 60.0    # conferência de segurança mesmo com inotify
+VIGIA_AGRUPAR_SEGUNDOS = 0.2       # junta rajadas de eventos (editor salvando)
+
+Assinatura = Optional[Tuple[int, int]]  # (mtime_ns, tamanho) ou None se não existe
+
+class EstadoArquivos(NamedTuple):
+    ignorados: FrozenSet[int]
+    indice: IndiceDados
+    silenciado: bool
+    versao_dados: Optional[int]    # mtime_ns do dados.txt (invalidação de caches)
+    assinaturas: Tuple[Assinatura, Assinatura, Assinatura]
+
+def _assinatura(caminho: str) -> Assinatura:
+    try:
+        st = os.stat(caminho)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _assinaturas_arquivos() -> Tuple[Assinatura, Assinatura, Assinatura]:
+    return (_assinatura(CAMINHO_DADOS), _assinatura(CAMINHO_IGNORE), _assinatura(CAMINHO_SILENCIO))
+
+def montar_estado_arquivos(anterior: Optional[EstadoArquivos] = None) -> EstadoArquivos:
+    # só relê o que mudou desde o snapshot anterior
+    ass = _assinaturas_arquivos()
+    if anterior is None or ass[0] != anterior.assinaturas[0]:
+        indice = carregar_blocos_dados()
+    else:
+        indice = anterior.indice
+    if anterior is None or ass[1] != anterior.assinaturas[1]:
+        ignorados = carregar_ignorados()
+    else:
+        ignorados = anterior.ignorados
+    versao = ass[0][0] if ass[0] else None
+    return EstadoArquivos(ignorados, indice, ass[2] is not None, versao, ass)
+
+def recarregar_arquivos() -> EstadoArquivos:
+    global _estado
+    _estado = montar_estado_arquivos(_estado)
+    return _estado
+
+_estado: EstadoArquivos = montar_estado_arquivos()
+
+# inotify via libc (Linux); em outro SO cai no polling
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+
+def _inotify_abrir(pasta: str) -> Optional[int]:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(pasta), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except Exception:
+        return None
+
+def _inotify_drenar(fd: int, acordar: asyncio.Event) -> None:
+    nomes = {os.path.basename(c) for c in (CAMINHO_DADOS, CAMINHO_IGNORE, CAMINHO_SILENCIO)}
+    try:
+        buf = os.read(fd, 65536)
+    except (BlockingIOError, InterruptedError):
+        return
+    i = 0
+    while i + 16 <= len(buf):
+        _, _, _, tam = struct.unpack_from("iIII", buf, i)
+        nome = buf[i + 16:i + 16 + tam].split(b"\0", 1)[0].decode("utf-8", "replace")
+        i += 16 + tam
+        if nome in nomes:
+            acordar.set()
+
+async def vigiar_arquivos() -> None:
+    global _estado
+    loop = asyncio.get_running_loop()
+    acordar = asyncio.Event()
+    fd = _inotify_abrir(PASTA_ATUAL)
+    if fd is not None:
+        loop.add_reader(fd, _inotify_drenar, fd, acordar)
+    try:
+        while True:
+            if fd is None:
+                await asyncio.sleep(VIGIA_POLL_SEGUNDOS)
+            else:
+                try:
+                    await asyncio.wait_for(acordar.wait(), timeout=VIGIA_VARREDURA_SEGUNDOS)
+                    await asyncio.sleep(VIGIA_AGRUPAR_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    pass
+                acordar.clear()
+            try:
+                ass = await asyncio.to_thread(_assinaturas_arquivos)
+                if ass != _estado.assinaturas:
+                    _estado = await asyncio.to_thread(montar_estado_arquivos, _estado)
+            except Exception:
+                pass
+    finally:
+        if fd is not None:
+            loop.remove_reader(fd)
+            os.close(fd)
+
+# =========================================================
+# PROMPTS (prefixo fixo + campos dinâmicos no fim, orçamento em tokens)
+# =========================================================
+# tudo que é fixo (persona, regras, formato) fica no system, compilado 1 vez;
+# o que muda por chamada vai no fim da mensagem do usuário, sempre na mesma ordem.
+# O cache de prefixo do provedor só entra a partir de CACHE_PREFIXO_MIN_TOKENS de
+# começo idêntico: os prompts de hoje ficam abaixo disso, então o que conta é o
+# total por chamada (sem regra repetida, rótulo só quando o campo vem)
+CHARS_POR_TOKEN = 3.0  # estimativa sem tiktoken (português fica perto disso, pro lado seguro)
+CACHE_PREFIXO_MIN_TOKENS = 1024
+
+_ENC = None
+_ENC_TENTADO = False
+
+def codificador():
+    # carrega na 1ª contagem, não no import: a 1ª vez o tiktoken baixa o BPE da rede
+    # (o on_ready já chama isto numa thread pra mensagem nenhuma pagar a espera)
+    global _ENC, _ENC_TENTADO
+    if not _ENC_TENTADO:
+        if tiktoken is not None:
+            try:
+                _ENC = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _ENC = None  # sem o arquivo do BPE (offline): fica na estimativa
+        _ENC_TENTADO = True
+    return _ENC
+
+def contar_tokens(texto: str) -> int:
+    if not texto:
+        return 0
+    enc = codificador()
+    if enc is not None:
+        return len(enc.encode(texto, disallowed_special=()))
+    return int(math.ceil(len(texto) / CHARS_POR_TOKEN))
+
+def cortar_tokens(texto: str, n: int) -> str:
+    if n <= 0:
         return ""
-    titulo, texto = melhor
-    contexto = normalizar_espacos(f"[{titulo}] {texto}")
-    if len(contexto) > max_chars:
-        contexto = contexto[:max_chars].rstrip() + "..."
-    return contexto
+    enc = codificador()
+    if enc is not None:
+        ids = enc.encode(texto, disallowed_special=())
+        return texto if len(ids) <= n else enc.decode(ids[:n])
+    return texto[:int(n * CHARS_POR_TOKEN)]
+
+class Prompt:
+    # campos: (nome, cortável) na ordem em que entram; quando estoura o orçamento,
+    # os cortáveis do fim perdem primeiro. A mensagem vai sempre por último.
+    # rotulos: texto que aparece no lugar do nome (explica o campo só quando ele vem)
+    def __init__(self, nome: str, system: str, campos: Tuple[Tuple[str, bool], ...], rotulo_mensagem: str,
+                 orcamento: int, rotulos: Optional[Dict[str, str]] = None):
+        self.nome = nome
+        self.system = system
+        self.campos = campos
+        self.rotulo_mensagem = rotulo_mensagem
+        self.orcamento = orcamento
+        self.rotulos = rotulos or {}
+        self._tokens_fixos: Optional[int] = None
+
+    @property
+    def tokens_fixos(self) -> int:
+        # contado na 1ª chamada (não no import), com o codificador que estiver disponível
+        if self._tokens_fixos is None:
+            self._tokens_fixos = contar_tokens(self.system)
+        return self._tokens_fixos
+
+    @property
+    def cacheavel(self) -> bool:
+        return self.tokens_fixos >= CACHE_PREFIXO_MIN_TOKENS
+
+    def montar(self, mensagem: str, **valores: str) -> Tuple[str, int]:
+        # devolve (conteúdo do usuário, tokens estimados do input inteiro)
+        mensagem = cortar_tokens(mensagem, self.orcamento // 2)
+        usados = self.tokens_fixos + contar_tokens(mensagem) + 4 * (len(self.campos) + 1)
+        textos = {}
+        for rotulo, cortavel in self.campos:
+            if not cortavel:
+                textos[rotulo] = valores.get(rotulo) or ""
+                usados += contar_tokens(textos[rotulo])
+        for rotulo, cortavel in self.campos:
+            if cortavel:
+                textos[rotulo] = cortar_tokens(valores.get(rotulo) or "", self.orcamento - usados)
+                usados += contar_tokens(textos[rotulo])
+        linhas = [f"{self.rotulos.get(r, r)}: {textos[r]}" for r, _ in self.campos if textos[r]]
+        linhas.append(f"{self.rotulo_mensagem}: {mensagem}")
+        return "\n".join(linhas), usados
+
+    def entrada(self, conteudo: str) -> List[dict]:
+        return [{"role": "system", "content": self.system}, {"role": "user", "content": conteudo}]
+
+    def extras(self) -> dict:
+        # chave de cache só quando o prefixo fixo chega no mínimo do provedor
+        return {"prompt_cache_key": f"japex:{self.nome}"} if self.cacheavel else {}
+
+def registrar_uso(site: str, usage: object, estimado: int = 0) -> None:
+    # tokens reais da resposta por ponto de chamada; "estimado" confere o contador local
+    if usage is None:
+        return
+    detalhes = getattr(usage, "input_tokens_details", None)
+    for tipo, valor in (
+        ("prompt", getattr(usage, "input_tokens", 0)),
+        ("completion", getattr(usage, "output_tokens", 0)),
+        ("cached", getattr(detalhes, "cached_tokens", 0) if detalhes is not None else 0),
+        ("estimado", estimado),
+    ):
+        if valor:
+            metricas.incr("japex_llm_tokens_total", float(valor), site=site, tipo=tipo)
+
+async def chamar_llm(prompt: Prompt, conteudo: str, estimado: int, max_tokens: int, temperature: float,
+                     site: Optional[str] = None, **kw: object):
+    r = await openai.responses.create(
+        model=MODEL_MAIN,
+        input=prompt.entrada(conteudo),
+        max_output_tokens=max_tokens,
+        temperature=temperature,
+        **prompt.extras(),
+        **kw,
+    )
+    registrar_uso(site or prompt.nome, getattr(r, "usage", None), estimado)
+    return r
 
 # =========================================================
 # PERSONALIDADE (conversa normal, sem sermonizar)
@@ -491,83 +2260,291 @@ PERSONA_BASE = (
 )
 
 def pergunta_modelo(texto: str) -> bool:
-    t = norm(texto)
-    return ("modelo" in t) and ("qual" in t or "seu" in t)
+    c = classificar_texto(texto)
+    return ("modelo" in c) and ("qual_seu" in c)
 
 def pergunta_criador(texto: str) -> bool:
-    t = norm(texto)
-    return ("quem" in t) and any(k in t for k in ["programou", "criou", "fez", "criador"])
+    c = classificar_texto(texto)
+    return ("quem" in c) and ("criacao" in c)
 
 def tenta_enganar_identidade(texto: str) -> bool:
-    t = norm(texto)
-    return ("eu sou" in t and "japex" in t) or ("sou japex" in t) or ("sou o japex" in t)
+    c = classificar_texto(texto)
+    return ("eu_sou" in c and "japex" in c) or ("sou_japex" in c)
+
+ORCAMENTO_CHAT = 700
+
+PROMPT_CHAT = Prompt(
+    "chat",
+    PERSONA_BASE,
+    (("VOCATIVO", False), ("BASE", True), ("HISTORICO", True)),
+    "MENSAGEM",
+    ORCAMENTO_CHAT,
+    {"HISTORICO": "Falas anteriores do canal (só contexto, não responda)"},
+)
+
+async def chat_llm(conteudo: str, estimado: int = 0, max_tokens: int = 70, temperature: float = 0.75) -> str:
+    with metricas.medir("chat_llm"):
+        r = await chamar_llm(PROMPT_CHAT, conteudo, estimado, max_tokens, temperature)
+    return (r.output_text or "").strip() or "Entendido."
 
-def chat_sync(system: str, user_text: str, max_tokens: int = 70, temperature: float = 0.75) -> str:
-    r = openai.responses.create(
+async def chat_llm_stream(conteudo: str, estimado: int = 0, max_tokens: int = 70, temperature: float = 0.75) -> AsyncIterator[str]:
+    # pedaços de texto conforme a Responses API vai gerando; o uso vem no evento final
+    stream = await openai.responses.create(
         model=MODEL_MAIN,
-        input=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user_text},
-        ],
+        input=PROMPT_CHAT.entrada(conteudo),
         max_output_tokens=max_tokens,
         temperature=temperature,
+        stream=True,
+        **PROMPT_CHAT.extras(),
     )
-    return (r.output_text or "").strip() or "Entendido."
-
-async def gerar_resposta(texto: str, author: discord.Member) -> str:
+    try:
+        async for ev in stream:
+            tipo = getattr(ev, "type", "")
+            if tipo == "response.output_text.delta":
+                yield ev.delta
+            elif tipo == "response.completed":
+                registrar_uso("chat_stream", getattr(ev.response, "usage", None), estimado)
+    finally:
+        # timeout/cancelamento no meio: devolve a conexão pro pool agora, não no GC
+        await stream.close()
+
+def resposta_fixa(texto: str, author: discord.Member) -> Optional[str]:
     if pergunta_modelo(texto):
         return MODEL_PUBLIC_NAME
     if pergunta_criador(texto):
         return "Foi o Baddx_xd."
     if (not is_japex(author.id)) and tenta_enganar_identidade(texto):
         return "Autoridade aqui é por ID do Discord, não por afirmação."
+    return None
 
-    ctx = buscar_contexto_dados(texto, max_chars=650)
-    system = (
-        PERSONA_BASE
-        + f"\nVocativo: {vocativo(author)}.\n"
-        + (f"BASE: {ctx}\n" if ctx else "")
-        + "Saída: 1 linha.\n"
-    )
+def montar_chat(texto: str, author: discord.Member, ctx: Optional[str] = None, hist: str = "") -> Tuple[str, int]:
+    if ctx is None:
+        ctx = buscar_contexto_dados(texto, max_chars=650)
+    return PROMPT_CHAT.montar(texto, VOCATIVO=vocativo(author), BASE=ctx, HISTORICO=hist)
+
+# =========================================================
+# CACHE DE RESPOSTAS (FAQ)
+# =========================================================
+# chave: pergunta dobrada + bloco do dados.txt usado + classe do vocativo + versão do dados.txt
+# (dados.txt mudou -> versão muda -> entradas antigas nunca mais casam e saem por LRU/TTL)
+RESPOSTA_CACHE_TTL = 1800
+RESPOSTA_CACHE_BYTES = 1_000_000
+RESPOSTA_VARIANTES = 3   # cada entrada guarda até N respostas diferentes e sorteia entre elas
+_MARCA_VOCATIVO = "\x00voc\x00"
+VOCATIVO_MIN_CHARS = 4   # "Al", "Zé": curto demais pra achar na resposta sem pegar pedaço de palavra
+
+_cache_respostas = CacheTTL(RESPOSTA_CACHE_TTL, RESPOSTA_CACHE_BYTES)
+_respostas_stats: Dict[str, int] = {"hits": 0, "geradas": 0, "sem_cache": 0}
+
+def _coletar_respostas() -> None:
+    # o CacheTTL conta hit mesmo com pool incompleto; aqui vale o que foi servido sem chamar o modelo
+    metricas.fixar("japex_cache_total", _respostas_stats["hits"], cache="respostas", resultado="hit")
+    metricas.fixar("japex_cache_total", _respostas_stats["geradas"] + _respostas_stats["sem_cache"], cache="respostas", resultado="miss")
+    metricas.gauge("japex_cache_bytes", _cache_respostas.bytes, cache="respostas")
+    metricas.gauge("japex_cache_itens", len(_cache_respostas), cache="respostas")
+
+metricas.coletores.append(_coletar_respostas)
+
+def classe_vocativo(member: discord.Member) -> str:
+    if is_japex(member.id):
+        return "japex"
+    if chefe_publico_info(member):
+        return "chefe"
+    if best_patente_title(member):
+        return "patente"
+    return "membro"
+
+def chave_resposta(texto: str, ctx: str, author: discord.Member) -> str:
+    h = hashlib.blake2b(f"{_estado.versao_dados}|{classe_vocativo(author)}|{ctx}".encode("utf-8"), digest_size=16)
+    return chave_texto(texto) + ":" + h.hexdigest()
+
+def resposta_do_cache(chave: str, author: discord.Member) -> Optional[str]:
+    # só serve do cache com o pool cheio; antes disso cada pedido gera uma variante nova
+    achou, variantes = _cache_respostas.get(chave)
+    if not achou or len(variantes) < RESPOSTA_VARIANTES:
+        return None
+    _respostas_stats["hits"] += 1
+    return random.choice(variantes).replace(_MARCA_VOCATIVO, vocativo(author))
+
+def _palavra(texto: str) -> "re.Pattern[str]":
+    return re.compile(r"(?<!\w)" + re.escape(texto) + r"(?!\w)")
 
-    out = await asyncio.wait_for(asyncio.to_thread(chat_sync, system, texto, 70, 0.75), timeout=12)
-    return sanitizar_resposta(out)
+def guardar_resposta(chave: str, author: discord.Member, resposta: str) -> None:
+    voc = vocativo(author)
+    nome = limpar_nome(author.display_name)
+    if len(voc) < VOCATIVO_MIN_CHARS:
+        _respostas_stats["sem_cache"] += 1
+        return
+    _respostas_stats["geradas"] += 1
+    # nome/patente de quem perguntou vira marcador (só palavra inteira): a variante serve pra outro da mesma classe
+    modelo = _palavra(voc).sub(_MARCA_VOCATIVO, resposta)
+    if nome and _palavra(nome).search(modelo):
+        return  # cita o autor de outro jeito: não dá pra reaproveitar
+    achou, variantes = _cache_respostas.get(chave)
+    variantes = tuple(variantes) if achou else ()
+    if modelo in variantes or len(variantes) >= RESPOSTA_VARIANTES:
+        return
+    _cache_respostas.put(chave, variantes + (modelo,))
+
+async def gerar_resposta(texto: str, author: discord.Member, hist: str = "") -> str:
+    # hist: últimas falas do canal; com ele a resposta depende da conversa e não entra no cache de FAQ
+    fixa = resposta_fixa(texto, author)
+    if fixa:
+        return fixa
+    ctx = buscar_contexto_dados(texto, max_chars=650)
+    chave = chave_resposta(texto, ctx, author)
+    cacheada = None if hist else resposta_do_cache(chave, author)
+    if cacheada:
+        return cacheada
+    conteudo, estimado = montar_chat(texto, author, ctx, hist)
+    try:
+        raw = await asyncio.wait_for(chat_llm(conteudo, estimado, 70, 0.75), timeout=12)
+    except Exception as e:
+        metricas.erro("chat", e)
+        raise
+    out = sanitizar_resposta(raw)
+    if normalizar_espacos(raw) and not hist:
+        guardar_resposta(chave, author, out)
+    else:
+        _respostas_stats["sem_cache"] += 1  # vazio ("Entendido." de fallback) ou dependente da conversa
+    return out
 
 # =========================================================
-# INTERPRETAR ORDEM (JSON) — MESMO MODELO
+# ORDEM LOCAL (gramática fixa: verbo + menções + duração, sem LLM)
 # =========================================================
-def interpretar_ordem_sync(texto: str, mentions: List[dict], meta: dict) -> dict:
-    schema = {"action": "none", "target_user_ids": [], "duration_seconds": None, "reason": ""}
+# só resolve o que é inequívoco; qualquer dúvida devolve None e vai pro modelo
+_RE_ALVO_TXT = re.compile(r"<@!?\d+>|\b\d{17,20}\b")
+_RE_NEGACAO = re.compile(r"\b(nao|nem|nunca|jamais|para de|pare de|ignora|ignorar|se)\b|\?")
+_VERBOS_ORDEM: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("unmute", re.compile(r"\b(desmut\w*|unmute|tira o (mute|castigo|timeout)|tirar o (mute|castigo|timeout))\b")),
+    ("remove_all_roles", re.compile(r"\b(tira|tirar|remove|remover)( todos| todas)?( os| as)? (cargos|roles)\b|\bremove all\b|\bremove_all_roles\b")),
+    ("mute", re.compile(r"\b(muta|mutar|mute|timeout|silencia|silenciar|castiga|castigar)\b")),
+    ("ban", re.compile(r"\b(bane|banir|bana|bani|ban)\b")),
+]
+_UNIDADES_SEG = {"s": 1, "seg": 1, "segundo": 1, "segundos": 1,
+                 "m": 60, "min": 60, "mins": 60, "minuto": 60, "minutos": 60,
+                 "h": 3600, "hr": 3600, "hrs": 3600, "hora": 3600, "horas": 3600,
+                 "d": 86400, "dia": 86400, "dias": 86400}
+_NUMEROS_PT = {"um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "cinco": 5, "dez": 10,
+               "quinze": 15, "vinte": 20, "trinta": 30}
+_RE_DURACAO = re.compile(
+    r"(?:\b(?:por|durante)\s+)?(?:\bmeia hora\b|\b(\d+|" + "|".join(_NUMEROS_PT) + r")\s*("
+    + "|".join(sorted(_UNIDADES_SEG, key=len, reverse=True)) + r")\b)"
+)
+_RE_MOTIVO = re.compile(r"\b(?:por|motivo:?)\s+(.+)$")
+_RE_POR = re.compile(r"\b(?:por|motivo)\b")
+# o que pode sobrar fora de verbo/alvo/duração/motivo; qualquer outra palavra muda o sentido
+# ("até amanhã", "cargos de moderador") e a ordem vai pro modelo
+_PALAVRAS_NEUTRAS = frozenset("o a os as ele ela eles elas do da dos das de e".split())
+
+# quantas ordens de superior saíram da gramática vs do modelo
+ORDEM_LOCAL_STATS: Dict[str, int] = {"local": 0, "llm": 0}
+metricas.coletores.append(lambda: [metricas.fixar("japex_ordens_total", n, via=via) for via, n in ORDEM_LOCAL_STATS.items()])
+
+def _texto_ordem(texto: str) -> str:
+    # minúsculo e sem acento, mas sem desfazer leet: dígito aqui é duração
+    t = (texto or "").lower()
+    if not t.isascii():
+        t = _RE_ACENTO.sub("", unicodedata.normalize("NFKD", t))
+    return " ".join(t.split())
+
+def parse_ordem_local(texto: str, mentions: List[dict]) -> Optional[dict]:
+    if not mentions or not parece_ordem_rapida(texto):
+        return None
+    t = _texto_ordem(texto)
+    if len(_RE_POR.findall(t)) > 1:
+        return None  # "por 10m por spam": mais de um "por" dá pra ler de mais de um jeito
+    # menção que não está escrita no texto (ex.: ping do reply) não é alvo garantido
+    escritos = {int(x) for x in re.findall(r"\d{17,20}", t)}
+    if any(x["user_id"] not in escritos for x in mentions):
+        return None
+    t = _RE_ALVO_TXT.sub(" ", t)
+    if _RE_NEGACAO.search(t):
+        return None
 
-    system = (
-        "Você interpreta ordens de moderação para um bot Discord.\n"
-        "Se NÃO for ordem, action=none.\n"
-        "Responda APENAS JSON válido.\n"
-        "Ações: mute, unmute, ban, remove_all_roles, none.\n"
-        "Se faltar alvo marcado, action=none.\n"
-    )
+    acoes = []
+    for acao, rx in _VERBOS_ORDEM:
+        if rx.search(t):
+            acoes.append(acao)
+            t = rx.sub(" ", t)
+    if len(acoes) != 1:
+        return None
+    action = acoes[0]
 
-    user = (
-        f"META: {json.dumps(meta, ensure_ascii=False)[:900]}\n"
-        f"MENSAGEM: {texto}\n"
-        f"MENTIONS: {json.dumps(mentions, ensure_ascii=False)}\n"
-        f"JSON_BASE: {json.dumps(schema, ensure_ascii=False)}"
-    )
+    duracoes = list(_RE_DURACAO.finditer(t))
+    if len(duracoes) > 1 or (duracoes and action != "mute"):
+        return None
+    duration_seconds = None
+    if duracoes:
+        d = duracoes[0]
+        if d.group(1) is None:
+            duration_seconds = 1800
+        else:
+            n = d.group(1)
+            qtd = int(n) if n.isdigit() else _NUMEROS_PT[n]
+            duration_seconds = qtd * _UNIDADES_SEG[d.group(2)]
+        t = t[:d.start()] + " " + t[d.end():]
+    if re.search(r"\d", t):
+        return None  # número solto sem unidade ("muta @x 10"): deixa o modelo decidir
+
+    m = _RE_MOTIVO.search(t)
+    reason = m.group(1) if m else ""
+    if m:
+        t = t[:m.start()]
+    if any(p not in _PALAVRAS_NEUTRAS for p in re.sub(r"[,.;:!]", " ", t).split()):
+        return None
+    return _validar_ordem({
+        "action": action,
+        "target_user_ids": [x["user_id"] for x in mentions],
+        "duration_seconds": duration_seconds,
+        "reason": reason,
+    })
 
-    r = openai.responses.create(
-        model=MODEL_MAIN,
-        input=[{"role": "system", "content": system}, {"role": "user", "content": user}],
-        max_output_tokens=220,
-        temperature=0.1,
+# =========================================================
+# INTERPRETAR ORDEM (JSON) — MESMO MODELO
+# =========================================================
+_ORDEM_VAZIA = {"action": "none", "target_user_ids": [], "duration_seconds": None, "reason": ""}
+ORCAMENTO_ORDEM = 600
+
+PROMPT_ORDEM = Prompt(
+    "ordem",
+    "Você interpreta ordens de moderação para um bot Discord.\n"
+    "Responda APENAS JSON válido.\n"
+    "Ações: mute, unmute, ban, remove_all_roles, none.\n"
+    "Se NÃO for ordem ou faltar alvo marcado, action=none.\n"
+    "Todo ID em MENTIONS conta como alvo marcado (inclusive IDs soltos no texto).\n"
+    f"JSON_BASE: {json.dumps(_ORDEM_VAZIA, ensure_ascii=False)}\n",
+    (("META", True), ("MENTIONS", False)),
+    "MENSAGEM",
+    ORCAMENTO_ORDEM,
+)
+
+async def interpretar_ordem_llm(texto: str, mentions: List[dict], meta: dict) -> dict:
+    schema = dict(_ORDEM_VAZIA)
+    conteudo, estimado = PROMPT_ORDEM.montar(
+        texto, META=json.dumps(meta, ensure_ascii=False), MENTIONS=json.dumps(mentions, ensure_ascii=False)
     )
+    # lista de IDs de raid é longa
+    r = await chamar_llm(PROMPT_ORDEM, conteudo, estimado, 220 + 8 * len(mentions), 0.1)
 
-    raw = (r.output_text or "").strip()
-    m = re.search(r"\{.*\}", raw, flags=re.DOTALL)
-    if not m:
+    obj = _extrair_json(r.output_text or "")
+    if obj is None:
         return schema
+    return _validar_ordem(obj)
 
+def _extrair_json(raw: str) -> Optional[dict]:
+    m = re.search(r"\{.*\}", raw.strip(), flags=re.DOTALL)
+    if not m:
+        return None
     try:
         obj = json.loads(m.group(0))
+    except:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+def _validar_ordem(obj: dict) -> dict:
+    schema = {"action": "none", "target_user_ids": [], "duration_seconds": None, "reason": ""}
+    try:
         action = str(obj.get("action", "none")).strip()
         allowed = {"mute", "unmute", "ban", "remove_all_roles", "none"}
         if action not in allowed:
@@ -575,8 +2552,9 @@ def interpretar_ordem_sync(texto: str, mentions: List[dict], meta: dict) -> dict
 
         tids = obj.get("target_user_ids", [])
         out_ids: List[int] = []
+        limite = MAX_BULK_BAN_TARGETS if action == "ban" else MAX_MASS_TARGETS
         if isinstance(tids, list):
-            for x in tids[:MAX_MASS_TARGETS]:
+            for x in tids[:limite]:
                 if isinstance(x, int):
                     out_ids.append(x)
                 elif isinstance(x, str) and x.isdigit():
@@ -599,98 +2577,265 @@ def interpretar_ordem_sync(texto: str, mentions: List[dict], meta: dict) -> dict
 
 async def interpretar_ordem(texto: str, mentions: List[dict], meta: dict) -> dict:
     try:
-        return await asyncio.wait_for(asyncio.to_thread(interpretar_ordem_sync, texto, mentions, meta), timeout=12)
-    except:
+        return await asyncio.wait_for(interpretar_ordem_llm(texto, mentions, meta), timeout=12)
+    except Exception as e:
+        metricas.erro("ordem", e)
         return {"action": "none", "target_user_ids": [], "duration_seconds": None, "reason": ""}
 
+# =========================================================
+# ROTEADOR (superior): ordem OU conversa numa chamada só
+# =========================================================
+# False = fluxo antigo em 2 etapas (interpretar_ordem -> gerar_resposta), pra comparar latência
+ROTEADOR_UNIFICADO = True
+
+_FORMATO_ROTEADOR = {
+    "type": "json_schema",
+    "name": "roteador",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "action": {"type": "string", "enum": ["mute", "unmute", "ban", "remove_all_roles", "none"]},
+            "target_user_ids": {"type": "array", "items": {"type": "string"}},
+            "duration_seconds": {"type": ["integer", "null"]},
+            "reason": {"type": "string"},
+            "reply": {"type": "string"},
+        },
+        "required": ["action", "target_user_ids", "duration_seconds", "reason", "reply"],
+        "additionalProperties": False,
+    },
+}
+
+ORCAMENTO_ROTEADOR = 900
+
+PROMPT_ROTEADOR = Prompt(
+    "roteador",
+    PROMPT_CHAT.system
+    + "Também interpreta ordens de moderação (ações no schema).\n"
+    "Ordem com alvo marcado: preencha a ordem e deixe reply vazio.\n"
+    "Senão: action=none e reply com a resposta.\n"
+    "Todo ID em MENTIONS conta como alvo marcado (inclusive IDs soltos no texto).\n",
+    (("VOCATIVO", False), ("BASE", True), ("META", True), ("MENTIONS", False)),
+    "MENSAGEM",
+    ORCAMENTO_ROTEADOR,
+)
+
+async def rotear_superior_llm(texto: str, mentions: List[dict], meta: dict, author: discord.Member) -> Tuple[dict, str]:
+    conteudo, estimado = PROMPT_ROTEADOR.montar(
+        texto,
+        VOCATIVO=vocativo(author),
+        BASE=buscar_contexto_dados(texto, max_chars=650),
+        META=json.dumps(meta, ensure_ascii=False),
+        MENTIONS=json.dumps(mentions, ensure_ascii=False),
+    )
+    r = await chamar_llm(PROMPT_ROTEADOR, conteudo, estimado, 290 + 8 * len(mentions), 0.3,
+                         text={"format": _FORMATO_ROTEADOR})
+
+    obj = _extrair_json(r.output_text or "") or {}
+    ordem = _validar_ordem(obj)
+    resposta = ""
+    # reply vazio (JSON ruim, {} ou ordem que não passou na validação) volta ""
+    # pra cair na conversa normal: o "Entendido." do sanitizar seria um ack falso
+    bruta = str(obj.get("reply") or "").strip()
+    if ordem["action"] == "none" and bruta:
+        resposta = sanitizar_resposta(bruta)
+    return ordem, resposta
+
+async def rotear_superior(texto: str, mentions: List[dict], meta: dict, author: discord.Member) -> Tuple[dict, str]:
+    try:
+        return await asyncio.wait_for(rotear_superior_llm(texto, mentions, meta, author), timeout=12)
+    except Exception as e:
+        metricas.erro("roteador", e)
+        return {"action": "none", "target_user_ids": [], "duration_seconds": None, "reason": ""}, ""
+
 # =========================================================
 # EXEC ORDEM (não mente)
 # =========================================================
+# ações por alvo rodam em paralelo até esse limite; o discord.py já segura
+# cada rota no bucket de rate limit dela (e espera sozinho em 429)
+ACOES_CONCORRENCIA = 5
+
+class ResultadoAlvo(NamedTuple):
+    user_id: int
+    nome: str
+    ok: bool
+    erro: str
+
+class ResultadoOrdem(NamedTuple):
+    ok: bool
+    mensagem: str
+    alvos: List[ResultadoAlvo]
+
+AcaoMembro = Callable[[discord.Member], Awaitable[Tuple[bool, str]]]
+
+async def executar_em_alvos(acao: AcaoMembro, membros: List[discord.Member], limite: int = ACOES_CONCORRENCIA) -> List[ResultadoAlvo]:
+    sem = asyncio.Semaphore(max(1, limite))
+
+    async def um(m: discord.Member) -> ResultadoAlvo:
+        async with sem:
+            try:
+                ok, err = await acao(m)
+            except Exception as e:
+                ok, err = False, repr(e)
+        return ResultadoAlvo(m.id, limpar_nome(m.display_name), ok, err)
+
+    return list(await asyncio.gather(*(um(m) for m in membros)))
+
+def _resumo_falhas(resultados: List[ResultadoAlvo]) -> str:
+    falhas = [r for r in resultados if not r.ok]
+    if not falhas:
+        return ""
+    nomes = ", ".join(r.nome for r in falhas[:3]) + ("..." if len(falhas) > 3 else "")
+    return f" | Falhas: {len(falhas)} ({nomes})"
+
+def _primeiro_erro(resultados: List[ResultadoAlvo]) -> str:
+    for r in resultados:
+        if not r.ok and r.erro:
+            return r.erro
+    return "sem detalhes"
+
+def registrar_resultados(guild: discord.Guild, res: List[ResultadoAlvo], acao: str, duracao: int, motivo: str) -> None:
+    for r in res:
+        if r.ok:
+            infracoes.registrar(guild.id, r.user_id, acao, duracao, motivo, "ordem")
+
 async def executar_ordem(ordem: dict, guild: discord.Guild) -> Tuple[bool, str]:
+    res = await executar_ordem_detalhada(ordem, guild)
+    return res.ok, res.mensagem
+
+async def banir_em_massa(guild: discord.Guild, tids: List[int], reason: str) -> ResultadoOrdem:
+    # aceita ID fora do cache de membros (conta alt que entrou e ninguém carregou)
+    if not bot_has_perm(guild, "ban_members"):
+        return ResultadoOrdem(False, "Eu não tenho permissão de banir membros.", [])
+
+    nomes: Dict[int, str] = {}
+    bloqueados: List[ResultadoAlvo] = []
+    alvos: List[int] = []
+    eu = usuario_bot().id if usuario_bot() else None
+    for uid in dict.fromkeys(int(x) for x in tids[:MAX_BULK_BAN_TARGETS]):
+        if uid == eu:
+            continue
+        m = membro_em_cache(guild, uid)  # sem buscar: ban por ID não precisa do Member
+        nomes[uid] = limpar_nome(m.display_name) if isinstance(m, discord.Member) else str(uid)
+        if isinstance(m, discord.Member) and not bot_can_act_on(guild, m):
+            bloqueados.append(ResultadoAlvo(uid, nomes[uid], False, "cargo acima/igual ao meu"))
+            continue
+        alvos.append(uid)
+
+    if not alvos:
+        if len(bloqueados) == 1:
+            return ResultadoOrdem(False, f"Não posso agir em {bloqueados[0].nome}: cargo acima/igual ao meu.", bloqueados)
+        return ResultadoOrdem(False, "Não posso agir nesses alvos: cargo acima/igual ao meu.", bloqueados)
+
+    motivo = reason or "Infração grave."
+    res: List[ResultadoAlvo] = []
+    if bot_has_perm(guild, "manage_guild"):
+        for i in range(0, len(alvos), BULK_BAN_LOTE):
+            lote = alvos[i:i + BULK_BAN_LOTE]
+            try:
+                with metricas.medir("discord_acao", acao="bulk_ban"):
+                    r = await guild.bulk_ban([discord.Object(id=u) for u in lote], reason=motivo, delete_message_seconds=0)
+                banidos = {o.id for o in r.banned}
+                erro = ""
+            except Exception as e:
+                metricas.erro("discord", e)
+                banidos, erro = set(), repr(e)
+            for u in lote:
+                ok = u in banidos
+                res.append(ResultadoAlvo(u, nomes[u], ok, "" if ok else (erro or "recusado pelo Discord")))
+    else:
+        # bulk_ban exige Gerenciar Servidor; sem isso vai um por um (em paralelo)
+        async def banir_id(uid: int) -> ResultadoAlvo:
+            try:
+                with metricas.medir("discord_acao", acao="ban"):
+                    await guild.ban(discord.Object(id=uid), reason=motivo, delete_message_seconds=0)
+                return ResultadoAlvo(uid, nomes[uid], True, "")
+            except Exception as e:
+                metricas.erro("discord", e)
+                return ResultadoAlvo(uid, nomes[uid], False, repr(e))
+
+        sem = asyncio.Semaphore(ACOES_CONCORRENCIA)
+
+        async def com_limite(uid: int) -> ResultadoAlvo:
+            async with sem:
+                return await banir_id(uid)
+
+        res = list(await asyncio.gather(*(com_limite(u) for u in alvos)))
+
+    res += bloqueados
+    registrar_resultados(guild, res, "ban", 0, motivo)
+    okc = sum(1 for r in res if r.ok)
+    if okc == 0:
+        return ResultadoOrdem(False, f"Falhou ao banir ({_primeiro_erro(res)}).", res)
+    if len(res) == 1:
+        return ResultadoOrdem(True, f"Banido: {res[0].nome} | permanente | Motivo: {motivo}.", res)
+    return ResultadoOrdem(True, f"Banidos: {okc} | Motivo: {motivo}{_resumo_falhas(res)}.", res)
+
+async def executar_ordem_detalhada(ordem: dict, guild: discord.Guild) -> ResultadoOrdem:
     action = ordem.get("action", "none")
     tids: List[int] = ordem.get("target_user_ids", []) or []
     dur = ordem.get("duration_seconds", None)
     reason = ordem.get("reason", "") or ""
 
     if action == "none":
-        return False, ""
+        return ResultadoOrdem(False, "", [])
 
     if not tids:
-        return False, "Faltou marcar o alvo."
+        return ResultadoOrdem(False, "Faltou marcar o alvo.", [])
 
-    members: List[discord.Member] = []
-    for uid in tids[:MAX_MASS_TARGETS]:
-        m = guild.get_member(int(uid))
-        if isinstance(m, discord.Member):
-            members.append(m)
-    if not members:
-        return False, "Não achei o alvo no servidor."
+    if action == "ban":
+        return await banir_em_massa(guild, tids, reason)
 
-    def bot_has_perm(g: discord.Guild, perm_name: str) -> bool:
-        bm = bot_member(g)
-        if not bm:
-            return False
-        perms = bm.guild_permissions
-        return getattr(perms, perm_name, False)
+    ids = [int(uid) for uid in tids[:MAX_MASS_TARGETS]]
+    achados = await resolver_membros(guild, ids)
+    members: List[discord.Member] = [achados[uid] for uid in ids if isinstance(achados.get(uid), discord.Member)]
+    if not members:
+        return ResultadoOrdem(False, "Não achei o alvo no servidor.", [])
 
-    if action in {"mute", "unmute", "ban"}:
-        if action in {"mute", "unmute"} and not bot_has_perm(guild, "moderate_members"):
-            return False, "Eu não tenho permissão de moderar membros (timeout)."
-        if action == "ban" and not bot_has_perm(guild, "ban_members"):
-            return False, "Eu não tenho permissão de banir membros."
+    if action in {"mute", "unmute"}:
+        if not bot_has_perm(guild, "moderate_members"):
+            return ResultadoOrdem(False, "Eu não tenho permissão de moderar membros (timeout).", [])
 
-        for m in members:
-            if not bot_can_act_on(guild, m):
-                return False, f"Não posso agir em {limpar_nome(m.display_name)}: cargo acima/igual ao meu."
+        # quem está acima/igual ao bot vira falha do alvo, sem travar os outros
+        bloqueados = [
+            ResultadoAlvo(m.id, limpar_nome(m.display_name), False, "cargo acima/igual ao meu")
+            for m in members if not bot_can_act_on(guild, m)
+        ]
+        alvos = [m for m in members if bot_can_act_on(guild, m)]
+        if not alvos:
+            if len(members) == 1:
+                return ResultadoOrdem(False, f"Não posso agir em {limpar_nome(members[0].display_name)}: cargo acima/igual ao meu.", bloqueados)
+            return ResultadoOrdem(False, "Não posso agir nesses alvos: cargo acima/igual ao meu.", bloqueados)
 
         if action == "unmute":
-            okc, last_err = 0, ""
-            for m in members:
-                ok, err = await desmutar(m)
-                okc += 1 if ok else 0
-                last_err = err or last_err
-                await asyncio.sleep(0.12)
+            res = await executar_em_alvos(desmutar, alvos) + bloqueados
+            okc = sum(1 for r in res if r.ok)
             if okc == 0:
-                return False, f"Falhou ao desmutar ({last_err or 'sem detalhes'})."
-            return True, f"Desmutados: {okc}."
+                return ResultadoOrdem(False, f"Falhou ao desmutar ({_primeiro_erro(res)}).", res)
+            return ResultadoOrdem(True, f"Desmutados: {okc}{_resumo_falhas(res)}.", res)
 
         if action == "mute":
             seconds = int(dur) if isinstance(dur, int) else 60
             seconds = max(1, min(86400, seconds))
-            okc, last_err = 0, ""
-            for m in members:
-                ok, err = await mutar(m, seconds)
-                okc += 1 if ok else 0
-                last_err = err or last_err
-                await asyncio.sleep(0.12)
+            res = await executar_em_alvos(lambda m: mutar(m, seconds), alvos) + bloqueados
+            okc = sum(1 for r in res if r.ok)
             if okc == 0:
-                return False, f"Falhou ao mutar ({last_err or 'sem detalhes'})."
+                return ResultadoOrdem(False, f"Falhou ao mutar ({_primeiro_erro(res)}).", res)
             mot = reason or "Conduta inadequada."
+            registrar_resultados(guild, res, "mute", seconds, mot)
             if len(members) == 1:
-                return True, f"Mutado: {limpar_nome(members[0].display_name)} | {seconds}s | Motivo: {mot}."
-            return True, f"Mutados: {okc} | {seconds}s | Motivo: {mot}."
-
-        if action == "ban":
-            okc, last_err = 0, ""
-            for m in members:
-                ok, err = await banir(m)
-                okc += 1 if ok else 0
-                last_err = err or last_err
-                await asyncio.sleep(0.18)
-            if okc == 0:
-                return False, f"Falhou ao banir ({last_err or 'sem detalhes'})."
-            mot = reason or "Infração grave."
-            if len(members) == 1:
-                return True, f"Banido: {limpar_nome(members[0].display_name)} | permanente | Motivo: {mot}."
-            return True, f"Banidos: {okc} | Motivo: {mot}."
+                return ResultadoOrdem(True, f"Mutado: {limpar_nome(members[0].display_name)} | {seconds}s | Motivo: {mot}.", res)
+            return ResultadoOrdem(True, f"Mutados: {okc} | {seconds}s | Motivo: {mot}{_resumo_falhas(res)}.", res)
 
     if action == "remove_all_roles":
         if not bot_has_perm(guild, "manage_roles"):
-            return False, "Eu não tenho permissão de gerenciar cargos."
+            return ResultadoOrdem(False, "Eu não tenho permissão de gerenciar cargos.", [])
 
         alvo = members[0]
+        nome = limpar_nome(alvo.display_name)
         if not bot_can_act_on(guild, alvo):
-            return False, f"Não posso mexer em {limpar_nome(alvo.display_name)}: cargo acima/igual ao meu."
+            return ResultadoOrdem(False, f"Não posso mexer em {nome}: cargo acima/igual ao meu.",
+                                  [ResultadoAlvo(alvo.id, nome, False, "cargo acima/igual ao meu")])
 
         removable = []
         for r in list(getattr(alvo, "roles", [])):
@@ -701,46 +2846,130 @@ async def executar_ordem(ordem: dict, guild: discord.Guild) -> Tuple[bool, str]:
             removable.append(r)
 
         if not removable:
-            return False, f"Não há cargos removíveis em {limpar_nome(alvo.display_name)}."
-
-        removed, last_err = 0, ""
-        for r in removable:
-            ok, err = await remove_role(alvo, r)
-            removed += 1 if ok else 0
-            last_err = err or last_err
-            await asyncio.sleep(0.10)
+            return ResultadoOrdem(False, f"Não há cargos removíveis em {nome}.", [])
 
-        if removed == 0:
-            return False, f"Falhou ao remover cargos ({last_err or 'sem detalhes'})."
-        return True, f"Cargos removidos: {removed} | Alvo: {limpar_nome(alvo.display_name)}."
+        ok, err = await remover_cargos(alvo, removable)
+        res = [ResultadoAlvo(alvo.id, nome, ok, err)]
+        registrar_resultados(guild, res, "remove_all_roles", 0, reason)
+        if not ok:
+            return ResultadoOrdem(False, f"Falhou ao remover cargos ({err or 'sem detalhes'}).", res)
+        return ResultadoOrdem(True, f"Cargos removidos: {len(removable)} | Alvo: {nome}.", res)
 
-    return False, "Ordem inválida."
+    return ResultadoOrdem(False, "Ordem inválida.", [])
 
 # =========================================================
 # AUTO-MODERAÇÃO (sem mention) — barato + inteligente
 # =========================================================
-PALAVRAS_BRIGA = [
-    "idiota", "burro", "lixo", "verme", "otário", "otario", "vagabundo",
-    "arrombado", "fdp", "foda-se", "foda se", "seu merda", "mlk",
-    "vai tomar no", "vai se foder"
-]
-KW_DIFAMACAO = ["calunia", "calúnia", "difamacao", "difamação", "mentiroso", "acusação", "acusacao"]
-KW_DESRESPEITO = ["desrespeito", "insulto", "humilha", "ameaça", "ameaca"]
+# veredictos por texto normalizado: copypasta repetida não paga API de novo
+VEREDICTO_CACHE_TTL = 600.0
+VEREDICTO_CACHE_MAX_BYTES = 2 * 1024 * 1024
+_cache_moderacao = CacheTTL(VEREDICTO_CACHE_TTL, VEREDICTO_CACHE_MAX_BYTES)
+_cache_punicao = CacheTTL(VEREDICTO_CACHE_TTL, VEREDICTO_CACHE_MAX_BYTES)
+coletar_cache("moderacao", _cache_moderacao)
+coletar_cache("punicao", _cache_punicao)
+
+# omni-moderation aceita lista: junta o que chegar na janela e manda numa chamada só
+MOD_LOTE_JANELA_SEGUNDOS = 0.05
+MOD_LOTE_MAX_ITENS = 32
+
+class LoteModeracao:
+    def __init__(self, janela: float, max_itens: int):
+        self.janela = janela
+        self.max_itens = max_itens
+        self._pendentes: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # o loop só guarda referência fraca das tasks: sem isso o lote em voo
+        # (e todo mundo esperando por ele) pode ser coletado no meio
+        self._em_voo: Set[asyncio.Task] = set()
+        # métricas
+        self.lotes = 0
+        self.itens = 0
+        self.falhas = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    async def verificar(self, texto: str) -> Optional[dict]:
+        # devolve a entrada de `results` desse texto, ou None se a chamada falhar
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pendentes.append((texto, fut, loop.time()))
+        if len(self._pendentes) >= self.max_itens:
+            self._disparar()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.janela, self._disparar)
+        return await fut
+
+    def _disparar(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        lote, self._pendentes = self._pendentes, []
+        if lote:
+            t = asyncio.get_running_loop().create_task(self._enviar(lote))
+            self._em_voo.add(t)
+            t.add_done_callback(self._em_voo.discard)
+
+    async def _enviar(self, lote: List[Tuple[str, asyncio.Future, float]]) -> None:
+        agora = asyncio.get_running_loop().time()
+        for _, _, desde in lote:
+            espera = agora - desde
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+        self.lotes += 1
+        self.itens += len(lote)
+        try:
+            with metricas.medir("moderacao_api"):
+                r = await asyncio.wait_for(
+                    openai.moderations.create(model="omni-moderation-latest", input=[t for t, _, _ in lote]),
+                    timeout=8,
+                )
+            results = r.model_dump()["results"]
+        except Exception as e:
+            self.falhas += 1
+            metricas.erro("moderacao", e)
+            results = []
+        for i, (_, fut, _) in enumerate(lote):
+            if not fut.done():
+                fut.set_result(results[i] if i < len(results) else None)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "lotes": self.lotes,
+            "itens": self.itens,
+            "falhas": self.falhas,
+            "ocupacao_media": (self.itens / (self.lotes * self.max_itens)) if self.lotes else 0.0,
+            "espera_media_ms": (self.espera_total / self.itens * 1000.0) if self.itens else 0.0,
+            "espera_max_ms": self.espera_max * 1000.0,
+        }
+
+_lote_moderacao = LoteModeracao(MOD_LOTE_JANELA_SEGUNDOS, MOD_LOTE_MAX_ITENS)
+
+def _coletar_lote() -> None:
+    st = _lote_moderacao.stats()
+    metricas.fixar("japex_moderacao_lotes_total", st["lotes"])
+    metricas.fixar("japex_moderacao_itens_total", st["itens"])
+    metricas.gauge("japex_moderacao_lote_ocupacao", st["ocupacao_media"])
+    metricas.gauge("japex_moderacao_espera_max_segundos", st["espera_max_ms"] / 1000.0)
+
+metricas.coletores.append(_coletar_lote)
+
+# caminho quente (roda em toda mensagem): só as palavras que importam aqui, por
+# busca de substring em C sobre o texto dobrado; a regex do classificador
+# compensa quando vários filtros olham a mesma mensagem, não pra um filtro só
+_KW_INFRACAO = tuple(sorted({dobrar_texto(k) for c in _CATS_INFRACAO for k in TABELAS_KW[c]}))
+_KW_ATAQUE = tuple(dobrar_texto(k) for k in TABELAS_KW["ataque"])
 
 def should_check_infraction(texto: str) -> bool:
-    t = norm(texto)
-    if any(p in t for p in PALAVRAS_BRIGA):
-        return True
-    if any(k in t for k in KW_DIFAMACAO + KW_DESRESPEITO):
+    t = dobrar_texto(texto)
+    if any(k in t for k in _KW_INFRACAO):
         return True
-    if "japex" in t and any(p in t for p in PALAVRAS_BRIGA + ["corrupto", "ladrão", "ladrao"]):
-        return True
-    return False
+    return "japex" in t and any(k in t for k in _KW_ATAQUE)
 
-def moderation_flagged(texto: str) -> bool:
+async def _moderacao_api(texto: str) -> Optional[bool]:
     try:
-        r = openai.moderations.create(model="omni-moderation-latest", input=texto)
-        res = r.model_dump()["results"][0]
+        res = await _lote_moderacao.verificar(texto)
+        if res is None:
+            return None
         if not res.get("flagged"):
             return False
         cats = res.get("categories", {}) or {}
@@ -752,24 +2981,34 @@ def moderation_flagged(texto: str) -> bool:
         ]
         return any(bool(cats.get(k)) for k in keys)
     except:
-        return False
+        return None
 
-def recomendar_punicao_sync(texto: str) -> dict:
-    schema = {"action":"none", "duration_seconds": 0, "reason": ""}
-    system = (
-        "Você decide punição de chat em servidor Discord.\n"
-        "Se não houver infração, action=none.\n"
-        "Se houver, action=mute e duração curta.\n"
-        "Motivo: bem curto.\n"
-        "Saída: APENAS JSON.\n"
-    )
-    user = f"TEXTO: {texto}\nJSON_BASE: {json.dumps(schema, ensure_ascii=False)}"
-    r = openai.responses.create(
-        model=MODEL_MAIN,
-        input=[{"role":"system","content":system},{"role":"user","content":user}],
-        max_output_tokens=120,
-        temperature=0.1,
+async def moderation_flagged(texto: str) -> bool:
+    chave = chave_texto(texto)
+    flagged = await _cache_moderacao.obter_ou_calcular(
+        chave, lambda: compartilhado_ou_calcular(f"mod:{chave}", VEREDICTO_CACHE_TTL, lambda: _moderacao_api(texto))
     )
+    return bool(flagged)
+
+ORCAMENTO_PUNICAO = 400
+
+PROMPT_PUNICAO = Prompt(
+    "punicao",
+    "Você decide punição de chat em servidor Discord.\n"
+    "Se não houver infração, action=none.\n"
+    "Se houver, action=mute e duração curta.\n"
+    "Motivo: bem curto.\n"
+    "Saída: APENAS JSON.\n"
+    'JSON_BASE: {"action": "none", "duration_seconds": 0, "reason": ""}\n',
+    (),
+    "TEXTO",
+    ORCAMENTO_PUNICAO,
+)
+
+async def recomendar_punicao_llm(texto: str) -> dict:
+    schema = {"action":"none", "duration_seconds": 0, "reason": ""}
+    conteudo, estimado = PROMPT_PUNICAO.montar(texto)
+    r = await chamar_llm(PROMPT_PUNICAO, conteudo, estimado, 120, 0.1)
     raw = (r.output_text or "").strip()
     m = re.search(r"\{.*\}", raw, flags=re.DOTALL)
     if not m:
@@ -791,11 +3030,22 @@ def recomendar_punicao_sync(texto: str) -> dict:
     except:
         return schema
 
-async def recomendar_punicao(texto: str) -> dict:
+async def _recomendar_punicao_api(texto: str) -> Optional[dict]:
     try:
-        return await asyncio.wait_for(asyncio.to_thread(recomendar_punicao_sync, texto), timeout=10)
-    except:
+        with metricas.medir("punicao_llm"):
+            return await asyncio.wait_for(recomendar_punicao_llm(texto), timeout=10)
+    except Exception as e:
+        metricas.erro("punicao", e)
+        return None
+
+async def recomendar_punicao(texto: str) -> dict:
+    chave = chave_texto(texto)
+    rec = await _cache_punicao.obter_ou_calcular(
+        chave, lambda: compartilhado_ou_calcular(f"pun:{chave}", VEREDICTO_CACHE_TTL, lambda: _recomendar_punicao_api(texto))
+    )
+    if not rec:
         return {"action":"none","duration_seconds":0,"reason":""}
+    return dict(rec)
 
 async def aplicar_auto_punicao(msg: discord.Message, alvo: discord.Member, motivo_ctx: str) -> Optional[str]:
     guild = msg.guild
@@ -806,8 +3056,8 @@ async def aplicar_auto_punicao(msg: discord.Message, alvo: discord.Member, motiv
     if not bot_can_act_on(guild, alvo):
         return None
 
-    flagged = await asyncio.to_thread(moderation_flagged, motivo_ctx)
-    if not flagged and not any(k in norm(motivo_ctx) for k in (KW_DIFAMACAO + KW_DESRESPEITO + ["japex"])):
+    flagged = await moderation_flagged(motivo_ctx)
+    if not flagged and not (classificar_texto(motivo_ctx) & _CATS_SEM_FLAG):
         return None
 
     rec = await recomendar_punicao(motivo_ctx)
@@ -818,21 +3068,235 @@ async def aplicar_auto_punicao(msg: discord.Message, alvo: discord.Member, motiv
     if seconds <= 0:
         seconds = 60
     reason = rec.get("reason") or "Conduta inadequada."
+    # reincidente na janela leva mute mais longo
+    anteriores = await infracoes.contar(guild.id, alvo.id)
+    seconds = duracao_escalonada(seconds, anteriores)
 
     ok, _ = await mutar(alvo, seconds)
     if not ok:
         return None
-    return f"Mutado: {limpar_nome(alvo.display_name)} | {seconds}s | Motivo: {reason}."
+    infracoes.registrar(guild.id, alvo.id, "mute", seconds, reason, "auto")
+    extra = f" | Reincidência: {anteriores}" if anteriores else ""
+    return f"Mutado: {limpar_nome(alvo.display_name)} | {seconds}s | Motivo: {reason}{extra}."
+
+# =========================================================
+# ANTI-FLOOD (local, sem API)
+# =========================================================
+# tudo aqui é contagem em memória: flood/spam não espera moderação nem LLM.
+# Limites por janela deslizante; passou de qualquer um, mute direto.
+FLOOD_JANELA_SEGUNDOS = 8.0
+FLOOD_JANELA_REPETIDA_SEGUNDOS = 30.0  # anúncio a cada 5 s passa da janela curta, dessa não
+FLOOD_MAX_MSGS_USUARIO = 7       # mais que isso na janela = flood
+FLOOD_MAX_REPETIDAS_USUARIO = 4  # mesma mensagem (ou quase) do mesmo autor
+FLOOD_MAX_AUTORES_COPYPASTA = 4  # mesma mensagem com link/marcação por N autores no canal (raid)
+FLOOD_MAX_AUTORES_TEXTO = 10     # só texto: "parabéns, muitas felicidades!" colado por vários é normal
+FLOOD_MAX_MENCOES = 8            # menções numa mensagem só (@everyone conta como várias)
+FLOOD_MAX_EMOJIS = 30
+FLOOD_MIN_CHARS_REPETIDA = 8     # "kkk" repetido não é spam (conta sem as marcações)
+FLOOD_MIN_CHARS_COPYPASTA = 40   # "gg", "bom dia pessoal, tudo certo?" de todo mundo junto não é raid
+FLOOD_SIMHASH_DISTANCIA = 5      # bits diferentes (de 64) pra ainda contar como "a mesma"
+FLOOD_RECENTES_CANAL = 40
+FLOOD_MAX_CHAVES = 50_000
+FLOOD_MUTE_SEGUNDOS = 300
+FLOOD_AVISO_SEGUNDOS = 15.0      # no máximo um aviso por canal nesse intervalo
+
+_RE_EMOJI = re.compile(r"<a?:\w{2,32}:\d{15,21}>|[\U0001F000-\U0001FAFF\u2600-\u27BF]")
+_RE_MARCACAO = re.compile(r"<(?:@[!&]?|#)\d+>")
+_RE_LINK = re.compile(r"https?://|discord(?:\.gg|app\.com/invite|\.com/invite)/|www\.", re.IGNORECASE)
+_SEM_PONTUACAO = str.maketrans("", "", "!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~ \t\n")
+SIMHASH_MAX_FEATURES = 128
+_MASCARA64 = (1 << 64) - 1
+# byte -> os 8 bits dele espalhados em campos de 8 bits: somar um int grande
+# soma os 64 contadores de uma vez (até 255 features por mensagem)
+_ESPALHAR = [sum(((b >> j) & 1) << (8 * j) for j in range(8)) for b in range(256)]
+
+def _features_simhash(s: str) -> List[str]:
+    # trigramas de caractere do texto dobrado, sem espaço nem pontuação
+    c = dobrar_texto(s).translate(_SEM_PONTUACAO)
+    return [c[i:i + 3] for i in range(min(len(c) - 2, SIMHASH_MAX_FEATURES))] or [c]
+
+def simhash(s: str) -> int:
+    # hash() de str muda entre processos, mas o simhash só é comparado dentro do mesmo
+    feats = _features_simhash(s)
+    n = len(feats)
+    if np is not None and n > 8:
+        # coluna i = bit i do hash (bytes little-endian, bits do menor pro maior), igual ao laço abaixo
+        hs = np.array([hash(f) for f in feats], dtype=np.int64).astype("<i8")
+        cont = np.unpackbits(hs.view(np.uint8), bitorder="little").reshape(n, 64).sum(axis=0)
+        return int.from_bytes(np.packbits(2 * cont > n, bitorder="little").tobytes(), "little")
+    acc = 0
+    esp = _ESPALHAR
+    for f in feats:
+        h = hash(f) & _MASCARA64
+        acc += (esp[h & 0xFF] | esp[(h >> 8) & 0xFF] << 64 | esp[(h >> 16) & 0xFF] << 128
+                | esp[(h >> 24) & 0xFF] << 192 | esp[(h >> 32) & 0xFF] << 256 | esp[(h >> 40) & 0xFF] << 320
+                | esp[(h >> 48) & 0xFF] << 384 | esp[(h >> 56) & 0xFF] << 448)
+    out = 0
+    for i in range(64):
+        if 2 * ((acc >> (8 * i)) & 0xFF) > n:
+            out |= 1 << i
+    return out
+
+def contar_mencoes(msg: discord.Message) -> int:
+    n = len({m.id for m in msg.mentions}) + len(getattr(msg, "role_mentions", None) or [])
+    if getattr(msg, "mention_everyone", False):
+        n += FLOOD_MAX_MENCOES // 2
+    return n
+
+class DetectorFlood:
+    # por autor: deque (ts, simhash) das últimas FLOOD_MAX_MSGS_USUARIO+1 na janela
+    # longa; por canal: deque (ts, autor, simhash) das últimas N na janela curta.
+    # Custo por mensagem: um simhash + no máximo FLOOD_RECENTES_CANAL popcounts.
+    def __init__(self, janela: float, janela_repetida: float, max_chaves: int):
+        self.janela = janela
+        self.janela_repetida = janela_repetida
+        self._usuarios = MapaExpiravel(janela_repetida, max_chaves)  # (guild_id, user_id) -> deque
+        self._canais = MapaExpiravel(janela, max_chaves)             # channel_id -> deque
+
+    def _janela(self, mapa: MapaExpiravel, chave: object, agora: float, maxlen: int) -> Deque:
+        dq = mapa.get(chave, agora)
+        if dq is None:
+            dq = deque(maxlen=maxlen)
+        mapa.set(chave, dq, agora)
+        limite = agora - mapa.ttl
+        while dq and dq[0][0] < limite:
+            dq.popleft()
+        return dq
+
+    def verificar(self, msg: discord.Message, agora: float) -> Optional[Tuple[str, List[int]]]:
+        # (motivo, ids a punir) ou None
+        autor = msg.author.id
+        if contar_mencoes(msg) >= FLOOD_MAX_MENCOES:
+            return "menções em massa", [autor]
+        texto = msg.content or ""
+        if len(texto) >= FLOOD_MAX_EMOJIS and len(_RE_EMOJI.findall(texto)) >= FLOOD_MAX_EMOJIS:
+            return "parede de emoji", [autor]
+
+        # <@id> muda a cada cópia do spam e "@bot pergunta" é o uso normal: fica de fora
+        limpo = _RE_MARCACAO.sub("", texto).strip()
+        h = simhash(limpo) if len(limpo) >= FLOOD_MIN_CHARS_REPETIDA else None
+        dist = FLOOD_SIMHASH_DISTANCIA
+
+        du = self._janela(self._usuarios, (msg.guild.id, autor), agora, FLOOD_MAX_MSGS_USUARIO + 1)
+        du.append((agora, h))
+        # deque cheio e o mais velho ainda dentro da janela curta = N+1 mensagens nela
+        if len(du) > FLOOD_MAX_MSGS_USUARIO and du[0][0] >= agora - self.janela:
+            return "flood", [autor]
+        if h is not None:
+            iguais = sum(1 for _, x in du if x is not None and (x ^ h).bit_count() <= dist)
+            if iguais >= FLOOD_MAX_REPETIDAS_USUARIO:
+                return "mensagem repetida", [autor]
+
+        if h is None or len(limpo) < FLOOD_MIN_CHARS_COPYPASTA:
+            return None
+        dc = self._janela(self._canais, msg.channel.id, agora, FLOOD_RECENTES_CANAL)
+        dc.append((agora, autor, h))
+        autores = {u for _, u, x in dc if (x ^ h).bit_count() <= dist}
+        # FAQ perguntada ao bot por vários ao mesmo tempo não é raid: só conta marcar outra pessoa
+        eu_id = getattr(usuario_bot(), "id", None)
+        com_alvo = _RE_LINK.search(limpo) is not None or any(m.id != eu_id for m in msg.mentions)
+        if len(autores) >= (FLOOD_MAX_AUTORES_COPYPASTA if com_alvo else FLOOD_MAX_AUTORES_TEXTO):
+            # raid de copypasta: pune o grupo todo, não só quem fechou a conta
+            return "copypasta em massa", list(autores)
+        return None
+
+detector_flood = DetectorFlood(FLOOD_JANELA_SEGUNDOS, FLOOD_JANELA_REPETIDA_SEGUNDOS, FLOOD_MAX_CHAVES)
+_flood_punidos = MapaExpiravel(FLOOD_MUTE_SEGUNDOS, FLOOD_MAX_CHAVES)  # (guild_id, user_id)
+_flood_avisos = MapaExpiravel(FLOOD_AVISO_SEGUNDOS, FLOOD_MAX_CHAVES)  # channel_id
+
+async def _mutar_flood(guild: discord.Guild, alvo: discord.Member, motivo: str) -> Optional[int]:
+    anteriores = await infracoes.contar(guild.id, alvo.id)
+    seconds = duracao_escalonada(FLOOD_MUTE_SEGUNDOS, anteriores)
+    ok, _ = await mutar(alvo, seconds)
+    if not ok:
+        return None
+    infracoes.registrar(guild.id, alvo.id, "mute", seconds, motivo, "flood")
+    return seconds
+
+async def punir_flood(msg: discord.Message, motivo: str, ids: List[int], agora: float) -> None:
+    guild = msg.guild
+    metricas.incr("japex_flood_total", motivo=motivo)
+    if not bot_has_perm(guild, "moderate_members"):
+        return
+    alvos: List[discord.Member] = []
+    for uid in ids:
+        alvo = msg.author if uid == msg.author.id else membro_em_cache(guild, uid)
+        if alvo is None or alvo.bot:
+            continue
+        if autoridade_sobre_bot(alvo, guild) or not bot_can_act_on(guild, alvo):
+            continue
+        # o mute leva um RTT: o que o autor mandou nesse meio tempo não pune de novo
+        if not _flood_punidos.adicionar_se_novo((guild.id, uid), agora):
+            continue
+        alvos.append(alvo)
+    if not alvos:
+        return
+    duracoes = await asyncio.gather(*(_mutar_flood(guild, a, motivo) for a in alvos))
+    mutados = [(a, s) for a, s in zip(alvos, duracoes) if s is not None]
+    if not mutados or not _flood_avisos.adicionar_se_novo(msg.channel.id, agora):
+        return
+    if len(mutados) == 1:
+        alvo, seconds = mutados[0]
+        await msg.channel.send(f"Mutado: {limpar_nome(alvo.display_name)} | {seconds}s | Motivo: {motivo}.")
+    else:
+        await msg.channel.send(f"Mutados: {len(mutados)} | Motivo: {motivo}.")
 
 # =========================================================
 # EVENTOS
 # =========================================================
+_tarefas_fundo: Dict[str, asyncio.Task] = {}
+
+def iniciar_tarefa_fundo(nome: str, fn: Callable[[], Awaitable[None]]) -> None:
+    # on_ready pode disparar de novo em reconexão; não duplica tarefa viva
+    t = _tarefas_fundo.get(nome)
+    if t is None or t.done():
+        _tarefas_fundo[nome] = asyncio.get_running_loop().create_task(fn())
+
 @cliente.event
 async def on_ready():
+    await asyncio.to_thread(codificador)
+    iniciar_tarefa_fundo("vigia_arquivos", vigiar_arquivos)
+    iniciar_tarefa_fundo("lag_loop", medir_lag_loop)
+    iniciar_tarefa_fundo("metricas", servir_metricas)
     print(f"bot ligado ({MODEL_MAIN}) | {MODEL_PUBLIC_NAME}")
 
+@cliente.event
+async def on_guild_role_create(role: discord.Role):
+    invalidar_patentes_guild(role.guild.id)
+
+@cliente.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    if before.name != after.name:
+        invalidar_patentes_guild(after.guild.id)
+
+@cliente.event
+async def on_guild_role_delete(role: discord.Role):
+    invalidar_patentes_guild(role.guild.id)
+
+@cliente.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if before.roles != after.roles:
+        invalidar_patente_membro(after.guild.id, after.id)
+
+@cliente.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    # raw: chega mesmo quando a mensagem já saiu do cache do discord.py
+    if "content" in payload.data:
+        historico.editar(payload.channel_id, payload.message_id, payload.data.get("content") or "")
+
+@cliente.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    historico.apagar(payload.channel_id, payload.message_id)
+
+@cliente.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    for mid in payload.message_ids:
+        historico.apagar(payload.channel_id, mid)
+
 @cliente.event
 async def on_message(mensagem: discord.Message):
+    # antes do filtro de bot: as respostas do próprio bot também são contexto
+    historico.adicionar(mensagem)
     if mensagem.author.bot:
         return
     if not isinstance(mensagem.author, discord.Member):
@@ -840,7 +3304,34 @@ async def on_message(mensagem: discord.Message):
 
     loop_time = asyncio.get_event_loop().time()
     if already_processed(mensagem.id, loop_time):
+        metricas.descarte("duplicada")
+        return
+    # troca de versão com 2 processos no ar (ou shard reassumido): o outro já pode ter tratado
+    if armazem.compartilhado and not await estado_novo(f"msg:{mensagem.id}", PROCESSED_TTL):
+        metricas.descarte("duplicada")
         return
+    lembrar_membro(mensagem.author)
+    for m in mensagem.mentions:
+        if isinstance(m, discord.Member):
+            lembrar_membro(m)
+    with metricas.medir("on_message"):
+        await tratar_mensagem(mensagem, loop_time)
+
+async def tratar_mensagem(mensagem: discord.Message, loop_time: float):
+
+    # ---------------------------
+    # ANTI-FLOOD (local, antes de qualquer API)
+    # ---------------------------
+    if mensagem.guild:
+        with metricas.medir("flood"):
+            flood = detector_flood.verificar(mensagem, loop_time)
+        # superior pode marcar 20 de uma vez numa ordem: o limite não vale pra ele
+        if flood is not None and not autoridade_sobre_bot(mensagem.author, mensagem.guild):
+            try:
+                await punir_flood(mensagem, *flood, loop_time)
+            except Exception as e:
+                metricas.incr("japex_erros_total", onde="flood", tipo=type(e).__name__)
+            return
 
     # ---------------------------
     # AUTO-MODERAÇÃO (sem mention)
@@ -848,114 +3339,285 @@ async def on_message(mensagem: discord.Message):
     try:
         if mensagem.guild and mensagem.content:
             txt = mensagem.content
-            if should_check_infraction(txt):
+            with metricas.medir("prefiltro"):
+                checar = should_check_infraction(txt)
+            if checar:
                 rep = await aplicar_auto_punicao(mensagem, mensagem.author, txt)
                 if rep:
-                    async with mensagem.channel.typing():
-                        await asyncio.sleep(0.7)
+                    espera = min(0.7, TYPING_ORCAMENTO_SEGUNDOS) if TYPING_COSMETICO else 0.0
+                    if espera > 0:
+                        async with mensagem.channel.typing():
+                            await asyncio.sleep(espera)
                     await mensagem.channel.send(rep)
-    except:
-        pass
+    except Exception as e:
+        metricas.incr("japex_erros_total", onde="auto_moderacao", tipo=type(e).__name__)
 
     # ---------------------------
     # Só responde se for mencionado
     # ---------------------------
-    if cliente.user not in mensagem.mentions:
+    if usuario_bot() not in mensagem.mentions:
         return
 
-    if not await respeitar_delay_e_cooldown(mensagem.author.id):
+    # superior passa pelo balde próprio e vai na fila de prioridade; o resto entra na fila do canal
+    prioridade = bool(mensagem.guild) and autoridade_sobre_bot(mensagem.author, mensagem.guild)
+    if armazem.compartilhado:
+        recusa = await admitir_mencao_compartilhada(mensagem.author.id, mensagem.channel.id, loop_time, prioridade)
+    else:
+        recusa = admitir_mencao(mensagem.author.id, mensagem.channel.id, loop_time, prioridade)
+    if recusa is not None:
         return
 
-    # trava geral anti-spam
-    if ocupado.locked():
+    if (mensagem.author.id in _estado.ignorados) and (not is_japex(mensagem.author.id)):
+        metricas.descarte("ignorado")
         return
+    agendador.enviar(mensagem.channel.id, lambda: responder_mencao_medida(mensagem), prioridade=prioridade)
 
-    async with ocupado:
-        guild = mensagem.guild
-        channel = mensagem.channel
-        extra = typing_extra(mensagem.author.id)
+async def completar_atraso(channel: discord.abc.Messageable, inicio: float, extra: float) -> None:
+    # atraso cosmético só cobre o que o trabalho real ainda não gastou
+    falta = extra - (asyncio.get_running_loop().time() - inicio)
+    if falta > 0:
+        async with channel.typing():
+            await asyncio.sleep(falta)
+
+async def com_digitando(channel: discord.abc.Messageable, trabalho: Awaitable[T], extra: float,
+                        inicio: Optional[float] = None) -> T:
+    # o trabalho começa já; "digitando..." roda junto com ele.
+    # inicio: quando a etapa anterior (ex.: roteador) já gastou tempo, o atraso conta dali
+    loop = asyncio.get_running_loop()
+    if inicio is None:
+        inicio = loop.time()
+    tarefa = asyncio.ensure_future(trabalho)
+    try:
+        async with channel.typing():
+            resultado = await tarefa
+            falta = extra - (loop.time() - inicio)
+            if falta > 0:
+                await asyncio.sleep(falta)
+        return resultado
+    finally:
+        if not tarefa.done():
+            tarefa.cancel()
+
+# streaming: posta a 1ª frase assim que chega e vai editando com o resto
+STREAM_RESPOSTAS = False
+STREAM_EDITAR_SEGUNDOS = 1.0   # edição de mensagem tem rate limit: não edita a cada token
+STREAM_TIMEOUT_SEGUNDOS = 12.0  # só a geração; o mesmo teto do chat sem stream
+_RE_FIM_FRASE = re.compile(r"[.!?…](\s|$)")
+
+async def responder_stream(mensagem: discord.Message, texto: str, extra: float) -> None:
+    channel = mensagem.channel
+    fixa = resposta_fixa(texto, mensagem.author)
+    if fixa:
+        await completar_atraso(channel, asyncio.get_running_loop().time(), extra)
+        await mensagem.reply(fixa)
+        return
 
-        if (mensagem.author.id in IGNORADOS) and (not is_japex(mensagem.author.id)):
-            return
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    ctx = buscar_contexto_dados(texto, max_chars=650)
+    chave = chave_resposta(texto, ctx, mensagem.author)
+    hist = historico.linhas(channel.id, mensagem.id) if HISTORICO_NO_PROMPT else ""
+    cacheada = None if hist else resposta_do_cache(chave, mensagem.author)
+    if cacheada:
+        await completar_atraso(channel, inicio, extra)
+        await mensagem.reply(cacheada)
+        return
+
+    conteudo, estimado = montar_chat(texto, mensagem.author, ctx, hist)
+    partes: List[str] = []
+    enviada: Optional[discord.Message] = None
+    mostrado = ""
+    falhou = False
+    # o prazo vale só pro modelo; reply/edit no Discord ficam fora dele
+    prazo = inicio + STREAM_TIMEOUT_SEGUNDOS
+    gerador = chat_llm_stream(conteudo, estimado, 70, 0.75)
+
+    async def proximo() -> Optional[str]:
+        nonlocal falhou
+        if falhou:
+            return None
+        try:
+            return await asyncio.wait_for(gerador.__anext__(), max(0.0, prazo - loop.time()))
+        except StopAsyncIteration:
+            return None
+        except Exception as e:
+            metricas.erro("chat", e)
+            falhou = True
+            return None
+
+    try:
+        async with channel.typing():
+            while (pedaco := await proximo()) is not None:
+                partes.append(pedaco)
+                atual = normalizar_espacos("".join(partes))
+                if len(atual) >= 12 and _RE_FIM_FRASE.search(atual):
+                    break
+            falta = extra - (loop.time() - inicio)
+            if falta > 0:
+                await asyncio.sleep(falta)
+        # modelo caiu antes da 1ª frase: responde com o que veio (ou o fallback do sanitizar)
+        mostrado = sanitizar_resposta("".join(partes))
+        enviada = await mensagem.reply(mostrado)
+        ultima_edicao = loop.time()
+        while (pedaco := await proximo()) is not None:
+            partes.append(pedaco)
+            atual = normalizar_espacos("".join(partes))
+            if loop.time() - ultima_edicao >= STREAM_EDITAR_SEGUNDOS and _RE_FIM_FRASE.search(atual[len(mostrado) - 1:]):
+                mostrado = sanitizar_resposta(atual)
+                await enviada.edit(content=mostrado)
+                ultima_edicao = loop.time()
+        if not falhou and normalizar_espacos("".join(partes)) and not hist:
+            guardar_resposta(chave, mensagem.author, sanitizar_resposta("".join(partes)))
+    finally:
+        await gerador.aclose()
+        if enviada is not None:
+            final = sanitizar_resposta("".join(partes))
+            if final != mostrado:
+                try:
+                    await enviada.edit(content=final)
+                except Exception:
+                    pass
+
+async def responder_conversa(mensagem: discord.Message, texto: str, extra: float) -> None:
+    if STREAM_RESPOSTAS:
+        await responder_stream(mensagem, texto, extra)
+        return
+    hist = historico.linhas(mensagem.channel.id, mensagem.id) if HISTORICO_NO_PROMPT else ""
+    resposta = await com_digitando(mensagem.channel, gerar_resposta(texto, mensagem.author, hist), extra)
+    await mensagem.reply(resposta)
+
+async def denunciar_referencia(mensagem: discord.Message, referenced: object, extra: float) -> bool:
+    # reply mencionando o bot em cima de uma ofensa: pune o autor da mensagem citada
+    contexto = getattr(referenced, "content", None) or ""
+    if not mensagem.guild or not contexto or not should_check_infraction(contexto):
+        return False
+    alvo = await autor_membro(mensagem.guild, mensagem.channel.id, referenced)
+    if alvo is None:
+        return False
+    inicio = asyncio.get_running_loop().time()
+    rep = await aplicar_auto_punicao(mensagem, alvo, contexto)
+    if not rep:
+        return False
+    await completar_atraso(mensagem.channel, inicio, extra)
+    await mensagem.channel.send(rep)
+    return True
 
-        texto_limpo = remover_mencao_bot(mensagem.content)
-        if not texto_limpo:
+async def responder_mencao_medida(mensagem: discord.Message):
+    with metricas.medir("responder_mencao"):
+        await responder_mencao(mensagem)
+
+async def responder_mencao(mensagem: discord.Message):
+    guild = mensagem.guild
+    channel = mensagem.channel
+    extra = typing_extra(mensagem.author.id)
+
+    texto_limpo = remover_mencao_bot(mensagem.content)
+    if not texto_limpo:
+        return
+
+    # referência (quando mencionam o bot respondendo uma msg)
+    referenced = await resolver_referencia(mensagem)
+
+    # =====================================================
+    # SUPERIOR: tenta ordem se parecer ordem OU se tiver menção alvo
+    # =====================================================
+    if guild and autoridade_sobre_bot(mensagem.author, guild):
+        # User (fora do cache de membros) também vale: serve pro ban
+        mentions = montar_alvos(
+            [(m.id, limpar_nome(m.display_name)) for m in mensagem.mentions
+             if isinstance(m, (discord.Member, discord.User)) and not (usuario_bot() and m.id == usuario_bot().id)],
+            texto_limpo,
+        )
+
+        tentar_ordem = bool(mentions) or parece_ordem_rapida(texto_limpo)
+        meta = {"author_id": mensagem.author.id, "founder_id": JAPEX_ID}
+        resposta = ""
+
+        if tentar_ordem:
+            inicio = asyncio.get_running_loop().time()
+            t0 = time.perf_counter()
+            ordem = parse_ordem_local(texto_limpo, mentions)
+            if ordem is not None:
+                ORDEM_LOCAL_STATS["local"] += 1
+                via = "local"
+            elif ROTEADOR_UNIFICADO:
+                ORDEM_LOCAL_STATS["llm"] += 1
+                via = "roteador"
+                ordem, resposta = await com_digitando(channel, rotear_superior(texto_limpo, mentions, meta, mensagem.author), 0)
+            else:
+                ORDEM_LOCAL_STATS["llm"] += 1
+                via = "llm"
+                ordem = await interpretar_ordem(texto_limpo, mentions, meta)
+            metricas.observar("japex_etapa_segundos", time.perf_counter() - t0, etapa="ordem_parse", via=via)
+            # o modelo pode inventar ID: só vale alvo marcado ou escrito na mensagem
+            marcados = {x["user_id"] for x in mentions}
+            ordem["target_user_ids"] = [u for u in ordem.get("target_user_ids", []) if u in marcados]
+            if ordem.get("action") != "none":
+                ok, resp = await com_digitando(channel, executar_ordem(ordem, guild), extra, inicio)
+                await channel.send(sanitizar_resposta(resp or ack_superior(mensagem.author)))
+                return
+
+        # se é reply denunciando, tenta punir o autor da msg referenciada
+        if referenced and await denunciar_referencia(mensagem, referenced, extra):
             return
 
-        # referência (quando mencionam o bot respondendo uma msg)
-        referenced = None
-        try:
-            if mensagem.reference:
-                if isinstance(mensagem.reference.resolved, discord.Message):
-                    referenced = mensagem.reference.resolved
-                elif mensagem.reference.message_id:
-                    referenced = await channel.fetch_message(mensagem.reference.message_id)
-        except:
-            referenced = None
-
-        # =====================================================
-        # SUPERIOR: tenta ordem se parecer ordem OU se tiver menção alvo
-        # =====================================================
-        if guild and autoridade_sobre_bot(mensagem.author, guild):
-            mentions = []
-            for m in mensagem.mentions:
-                if cliente.user and m.id == cliente.user.id:
-                    continue
-                if isinstance(m, discord.Member):
-                    mentions.append({"user_id": m.id, "display_name": limpar_nome(m.display_name)})
-
-            tentar_ordem = bool(mentions) or parece_ordem_rapida(texto_limpo)
-
-            if tentar_ordem:
-                ordem = await interpretar_ordem(texto_limpo, mentions, {"author_id": mensagem.author.id, "founder_id": JAPEX_ID})
-                if ordem.get("action") != "none":
-                    async with channel.typing():
-                        await asyncio.sleep(extra)
-                    ok, resp = await executar_ordem(ordem, guild)
-                    await channel.send(sanitizar_resposta(resp or ack_superior(mensagem.author)))
-                    return
-
-            # se é reply denunciando, tenta punir o autor da msg referenciada
-            if referenced and referenced.author and isinstance(referenced.author, discord.Member):
-                alvo = referenced.author
-                contexto = referenced.content or ""
-                if contexto and should_check_infraction(contexto):
-                    rep = await aplicar_auto_punicao(mensagem, alvo, contexto)
-                    if rep:
-                        async with channel.typing():
-                            await asyncio.sleep(extra)
-                        await channel.send(rep)
-                        return
-
-            # >>> mudança principal:
-            # superior agora conversa normal quando não é ordem
-            # (sem ficar preso em "Sim, ...")
-            async with channel.typing():
-                await asyncio.sleep(extra)
-            resposta = await gerar_resposta(texto_limpo, mensagem.author)
+        # roteador já trouxe a conversa: não precisa de 2ª chamada
+        if resposta:
+            resposta = resposta_fixa(texto_limpo, mensagem.author) or resposta
+            await completar_atraso(channel, inicio, extra)
             await mensagem.reply(resposta)
             return
 
-        # =====================================================
-        # NÃO-SUPERIOR: se for reply com menção ao bot, pode punir autor da msg
-        # =====================================================
-        if referenced and referenced.author and isinstance(referenced.author, discord.Member):
-            alvo = referenced.author
-            contexto = referenced.content or ""
-            if contexto and should_check_infraction(contexto):
-                rep = await aplicar_auto_punicao(mensagem, alvo, contexto)
-                if rep:
-                    async with channel.typing():
-                        await asyncio.sleep(extra)
-                    await channel.send(rep)
-                    return
-
-        # =====================================================
-        # CONVERSA NORMAL
-        # =====================================================
-        async with channel.typing():
-            await asyncio.sleep(extra)
-        resposta = await gerar_resposta(texto_limpo, mensagem.author)
-        await mensagem.reply(resposta)
+        # >>> mudança principal:
+        # superior agora conversa normal quando não é ordem
+        # (sem ficar preso em "Sim, ...")
+        await responder_conversa(mensagem, texto_limpo, extra)
+        return
+
+    # =====================================================
+    # NÃO-SUPERIOR: se for reply com menção ao bot, pode punir autor da msg
+    # =====================================================
+    if referenced and await denunciar_referencia(mensagem, referenced, extra):
+        return
+
+    # =====================================================
+    # CONVERSA NORMAL
+    # =====================================================
+    await responder_conversa(mensagem, texto_limpo, extra)
+
+def supervisionar() -> None:
+    # 1 filho por fatia de shards; filho que cai é reerguido com a mesma fatia
+    import subprocess
+    if ESTADO_BACKEND == "memoria":
+        print("aviso: ESTADO_BACKEND=memoria com vários processos -> dedup/taxa global não são compartilhados")
+    fatias = [list(range(i, SHARD_COUNT, SHARD_PROCESSOS)) for i in range(min(SHARD_PROCESSOS, SHARD_COUNT))]
+    def subir(i: int) -> "subprocess.Popen":
+        env = dict(os.environ, SHARD_IDS=",".join(map(str, fatias[i])), SHARD_PROCESSOS="1")
+        if METRICAS_PORTA:
+            env["METRICAS_PORTA"] = str(METRICAS_PORTA + i)
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+    filhos = [subir(i) for i in range(len(fatias))]
+    try:
+        while True:
+            time.sleep(5)
+            for i, f in enumerate(filhos):
+                if f.poll() is not None:
+                    print(f"processo de shards {fatias[i]} saiu ({f.returncode}); subindo de novo")
+                    filhos[i] = subir(i)
+    except KeyboardInterrupt:
+        for f in filhos:
+            f.terminate()
+        for f in filhos:
+            f.wait()
+
+def main() -> None:
+    if not TOKEN_DISCORD or not CHAVE_OPENAI:
+        raise SystemExit("faltou DISCORD_BOT_TOKEN ou OPENAI_API_KEY no .env")
+    if SHARD_COUNT > 0 and SHARD_PROCESSOS > 1 and not SHARD_IDS:
+        supervisionar()
+        return
+    configurar()
+    cliente.run(TOKEN_DISCORD)
 
-cliente.run(TOKEN_DISCORD)
+if __name__ == "__main__":
+    main()